@@ -10,8 +10,11 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
+from django.core.exceptions import ImproperlyConfigured
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -31,6 +34,7 @@ ALLOWED_HOSTS = []
 # Application definition
 
 INSTALLED_APPS = [
+    'daphne',  # ASGI runserver, required by the event stream
     'django.contrib.admin',
     'django.contrib.auth',
     'django.contrib.contenttypes',
@@ -44,7 +48,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'storage.middleware.RequestMetricsMiddleware',  # Per-route latency/query metrics, exposed at /metrics
     'corsheaders.middleware.CorsMiddleware',  # Middleware: TODO
+    'storage.middleware.ReplicaPinningMiddleware',  # Read-your-writes: pins writers to the primary database
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -71,17 +77,107 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'core.wsgi.application'
+ASGI_APPLICATION = 'core.asgi.application'
 
 
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
-
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+# Selected with DJANGO_DB_PROFILE:
+#   sqlite   - single file, default journaling (development)
+#   edge     - SQLite tuned for concurrent writers on edge devices (WAL, see SQLITE_PRAGMAS)
+#   postgres - PostgreSQL with persistent or pooled connections (production)
+
+DB_PROFILE = os.environ.get('DJANGO_DB_PROFILE', 'sqlite')
+
+if DB_PROFILE in ('sqlite', 'edge'):
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.environ.get('DJANGO_SQLITE_PATH', BASE_DIR / 'db.sqlite3'),
+            'OPTIONS': {
+                # SQLite ignores select_for_update; taking the write lock when the
+                # transaction begins keeps station state transitions serialized
+                'transaction_mode': 'IMMEDIATE',
+                'timeout': 20,
+            },
+            # File-backed (not shared-cache in-memory) so concurrency tests get
+            # the same locking behavior as a real database file
+            'TEST': {'NAME': BASE_DIR / 'test_db.sqlite3'},
+        }
     }
-}
+elif DB_PROFILE == 'postgres':
+    POSTGRES_POOL = os.environ.get('POSTGRES_POOL', '') == '1'
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ.get('POSTGRES_DB', 'storage'),
+            'USER': os.environ.get('POSTGRES_USER', 'storage'),
+            'PASSWORD': os.environ.get('POSTGRES_PASSWORD', ''),
+            'HOST': os.environ.get('POSTGRES_HOST', 'localhost'),
+            'PORT': os.environ.get('POSTGRES_PORT', '5432'),
+            # A connection pool replaces persistent connections, Django
+            # rejects CONN_MAX_AGE with pooling enabled
+            'CONN_MAX_AGE': 0 if POSTGRES_POOL else int(os.environ.get('POSTGRES_CONN_MAX_AGE', 60)),
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {
+                'pool': {
+                    'min_size': int(os.environ.get('POSTGRES_POOL_MIN_SIZE', 2)),
+                    'max_size': int(os.environ.get('POSTGRES_POOL_MAX_SIZE', 10)),
+                    'timeout': 10,
+                } if POSTGRES_POOL else False,
+            },
+        }
+    }
+else:
+    raise ImproperlyConfigured(f'Unknown DJANGO_DB_PROFILE: {DB_PROFILE!r}')
+
+# Sharding by site (storage.sharding, storage.routers.ShardRouter): each site listed in
+# DJANGO_SHARDS ("north=/data/north.sqlite3,south=/data/south.sqlite3"; database names
+# for PostgreSQL) gets its own database with the default database's settings, holding
+# its stations and their history. Other sites stay on the default database.
+STORAGE_SHARDS = {}
+for _shard in filter(None, os.environ.get('DJANGO_SHARDS', '').split(',')):
+    _site, _, _name = _shard.partition('=')
+    _alias = f'shard_{_site.strip()}'
+    DATABASES[_alias] = {**DATABASES['default'], 'NAME': _name.strip()}
+    if DB_PROFILE in ('sqlite', 'edge'):
+        DATABASES[_alias]['TEST'] = {'NAME': BASE_DIR / f'test_{_alias}.sqlite3'}
+    STORAGE_SHARDS[_site.strip()] = _alias
+# Size of the shared thread pool querying the shards in parallel for fleet-wide listings
+STORAGE_SHARD_WORKERS = 8
+
+# Read replicas (storage.replicas, storage.routers.ReplicaRouter): DJANGO_REPLICAS
+# ("default=/data/replica.sqlite3,shard_north=/data/north-replica.sqlite3"; hosts for
+# PostgreSQL) gives a database alias a replica, which serves station listings and
+# history reads. A client that wrote is pinned to the primary for
+# STORAGE_REPLICA_PIN_SECONDS, so it reads its own writes despite replication lag.
+STORAGE_REPLICAS = {}
+for _replica in filter(None, os.environ.get('DJANGO_REPLICAS', '').split(',')):
+    _primary, _, _location = _replica.partition('=')
+    _primary = _primary.strip()
+    _alias = f'{_primary}_replica'
+    if DB_PROFILE in ('sqlite', 'edge'):
+        DATABASES[_alias] = {
+            **DATABASES[_primary],
+            'NAME': _location.strip(),
+            'TEST': {'NAME': BASE_DIR / f'test_{_alias}.sqlite3'},
+        }
+    else:
+        DATABASES[_alias] = {**DATABASES[_primary], 'HOST': _location.strip()}
+    STORAGE_REPLICAS[_primary] = _alias
+STORAGE_REPLICA_PIN_SECONDS = 5
+
+DATABASE_ROUTERS = ['storage.routers.ReplicaRouter']
+
+# Applied to every new SQLite connection (storage.db.configure_sqlite_connection)
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',        # readers no longer block the writer
+    'synchronous': 'NORMAL',      # fsync at checkpoints only, safe with WAL
+    'busy_timeout': 20000,        # ms to wait for the write lock
+    'mmap_size': 268435456,       # 256 MiB memory-mapped reads
+    'cache_size': -65536,         # 64 MiB page cache
+    'temp_store': 'MEMORY',
+} if DB_PROFILE == 'edge' else {}
 
 
 # Password validation
@@ -121,6 +217,75 @@ USE_TZ = True
 
 STATIC_URL = 'static/'
 
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# Local memory by default; point DJANGO_CACHE_BACKEND/DJANGO_CACHE_LOCATION
+# at e.g. django.core.cache.backends.redis.RedisCache to share it between workers
+
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get(
+            'DJANGO_CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'
+        ),
+        'LOCATION': os.environ.get('DJANGO_CACHE_LOCATION', 'storage'),
+    }
+}
+
+# Station list/detail responses (storage.cache)
+STORAGE_CACHE_ALIAS = 'default'
+STORAGE_CACHE_TIMEOUT = 300  # seconds
+
+# History retention (storage rollup_history command)
+STORAGE_HISTORY_RETENTION_DAYS = 90          # raw events, then hourly rollups
+STORAGE_HISTORY_ROLLUP_RETENTION_DAYS = 365  # hourly rollups, then daily rollups
+
+# Write-behind history (storage.history_writer): history events are inserted by a
+# background thread after the request commits. Off by default and in tests.
+STORAGE_HISTORY_WRITE_BEHIND = os.environ.get('STORAGE_HISTORY_WRITE_BEHIND', '') == '1'
+STORAGE_HISTORY_WRITER = {
+    'max_size': 10000,      # events buffered before producers write inline
+    'batch_size': 500,      # events per bulk insert
+    'flush_interval': 1.0,  # seconds before a partial batch is written
+    'put_timeout': 0.5,     # seconds a producer waits on a full queue
+    'retries': 3,           # retries of a failed insert, before inserting event by event
+    'retry_delay': 0.1,     # seconds before the first retry, doubled on each one
+}
+
+# Sensor reading dead-band (storage.services.is_significant_reading): a bulk_update
+# reading within this many % of the stored volume, arriving less than the interval
+# (seconds) after the station's last write, is acknowledged without being stored.
+# Stations can override both; a dead-band of 0 stores every reading. Single-station
+# updates (manual edits) are always stored.
+STORAGE_READING_DEADBAND = float(os.environ.get('STORAGE_READING_DEADBAND', 1.0))
+STORAGE_READING_INTERVAL = int(os.environ.get('STORAGE_READING_INTERVAL', 900))
+
+# Idempotency-Key support on station writes (storage.idempotency): responses are kept
+# for ttl seconds (purge with the purge_idempotency_keys command), the most recent
+# max_entries also in process memory; a claim not completed within lock_timeout
+# seconds is considered abandoned
+STORAGE_IDEMPOTENCY = {
+    'max_entries': 10000,
+    'ttl': 86400,
+    'lock_timeout': 60,
+}
+
+# Request metrics (storage.middleware.RequestMetricsMiddleware)
+# Queries at least this slow are logged to 'storage.slow_queries'; None (an empty
+# or "off" STORAGE_SLOW_QUERY_MS) disables the log
+_slow_query_ms = os.environ.get('STORAGE_SLOW_QUERY_MS', '100').strip()
+STORAGE_SLOW_QUERY_MS = None if _slow_query_ms.lower() in ('', 'off') else float(_slow_query_ms)
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'storage': {'handlers': ['console'], 'level': 'INFO'},
+    },
+}
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
@@ -131,3 +296,5 @@ CORS_ALLOWED_ORIGINS = [
     "http://localhost:3000",  # React frontend
     "http://frontend:3000",
 ]
+# The dashboard sends the replica pinning cookie with its requests
+CORS_ALLOW_CREDENTIALS = True
@@ -1,7 +1,9 @@
 from django.contrib import admin
 from django.urls import path, include
+from storage.views import metrics
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/', include('storage.urls')),
+    path('metrics', metrics, name='metrics'),
 ]
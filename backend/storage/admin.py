@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Station, StationHistory
+from .models import HistoryImport, IdempotencyKey, Station, StationHistory, StationHistoryRollup
 
 @admin.register(Station)
 class StationAdmin(admin.ModelAdmin):
@@ -11,4 +11,43 @@ class StationAdmin(admin.ModelAdmin):
 class StationHistoryAdmin(admin.ModelAdmin):
     list_display = ('station', 'operation_type', 'volume_percentage', 'timestamp')
     list_filter = ('operation_type', 'station')
-    search_fields = ('station__name', 'operation_type')
+    list_select_related = ('station',)
+    search_fields = ('station__name',)
+
+    def has_change_permission(self, request, obj=None):
+        # History is append-only
+        return False
+
+@admin.register(StationHistoryRollup)
+class StationHistoryRollupAdmin(admin.ModelAdmin):
+    list_display = ('station', 'period', 'period_start', 'samples', 'min_volume', 'max_volume', 'avg_volume')
+    list_filter = ('period', 'station')
+    list_select_related = ('station',)
+    search_fields = ('station__name',)
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+@admin.register(HistoryImport)
+class HistoryImportAdmin(admin.ModelAdmin):
+    list_display = ('path', 'rows_processed', 'rows_imported', 'rows_invalid', 'started_at', 'completed_at')
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+@admin.register(IdempotencyKey)
+class IdempotencyKeyAdmin(admin.ModelAdmin):
+    list_display = ('key', 'status_code', 'created_at')
+    search_fields = ('key',)
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
@@ -1,6 +1,23 @@
 from django.apps import AppConfig
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_migrate, post_save, pre_migrate
 
 
 class StorageConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'storage'
+
+    def ready(self):
+        from . import sharding
+        from .cache import station_changed
+        from .db import configure_sqlite_connection
+        from .models import Station
+
+        connection_created.connect(configure_sqlite_connection, dispatch_uid='storage_sqlite_pragmas')
+        # Cached station responses are dropped on every save and delete, queryset deletes included
+        post_save.connect(station_changed, sender=Station, dispatch_uid='storage_station_saved')
+        post_delete.connect(station_changed, sender=Station, dispatch_uid='storage_station_deleted')
+        post_delete.connect(sharding.station_deleted, sender=Station, dispatch_uid='storage_station_directory')
+        # Data migrations run on the database being migrated, shards included
+        pre_migrate.connect(sharding.bind_migration, dispatch_uid='storage_bind_migration')
+        post_migrate.connect(sharding.unbind_migration, dispatch_uid='storage_unbind_migration')
@@ -0,0 +1,97 @@
+import json
+import math
+import time
+from pathlib import Path
+
+
+def percentile(values, fraction):
+    """
+    Nearest-rank percentile of a list of numbers.
+
+    Args:
+        values (list): Samples, in any order
+        fraction (float): Percentile as a fraction, e.g. 0.95
+
+    Returns:
+        float: The sample at that rank, or 0.0 for an empty list
+    """
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(math.ceil(fraction * len(ordered)) - 1, 0)
+    return ordered[rank]
+
+
+def summarize(latencies, queries, elapsed, statuses=None):
+    """
+    Summarize one benchmark scenario.
+
+    Args:
+        latencies (list): Per-request latency in seconds
+        queries (list): Per-request database query count
+        elapsed (float): Wall-clock duration of the scenario in seconds
+        statuses (dict): Optional count of responses per HTTP status
+
+    Returns:
+        dict: Latency percentiles in milliseconds, throughput and queries
+    """
+    summary = {
+        'requests': len(latencies),
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 3),
+        'p95_ms': round(percentile(latencies, 0.95) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 3),
+        'throughput_rps': round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        'queries_per_request': round(sum(queries) / len(queries), 2) if queries else 0.0,
+    }
+    if statuses is not None:
+        summary['statuses'] = {str(code): count for code, count in sorted(statuses.items())}
+    return summary
+
+
+def compare(baseline, current, tolerance=0.2, metrics=('p95_ms', 'queries_per_request')):
+    """
+    Find scenarios that regressed against a baseline.
+
+    A metric regresses when it exceeds the baseline value by more than
+    ``tolerance`` (a fraction). Query counts also get an absolute slack of
+    half a query, since cache hits make them vary slightly between runs.
+
+    Returns:
+        list: Human-readable descriptions of each regression
+    """
+    regressions = []
+    for name, result in current.get('scenarios', {}).items():
+        previous = baseline.get('scenarios', {}).get(name)
+        if previous is None:
+            continue
+        for metric in metrics:
+            if metric not in result or metric not in previous:
+                continue
+            allowed = previous[metric] * (1 + tolerance)
+            if metric == 'queries_per_request':
+                allowed = max(allowed, previous[metric] + 0.5)
+            if result[metric] > allowed:
+                regressions.append(f'{name}: {metric} {previous[metric]} -> {result[metric]}')
+    return regressions
+
+
+def load_report(path):
+    """Read a JSON benchmark report"""
+    return json.loads(Path(path).read_text())
+
+
+def save_report(path, report):
+    """Write a JSON benchmark report"""
+    Path(path).write_text(json.dumps(report, indent=2, sort_keys=True) + '\n')
+
+
+class Timer:
+    """Context manager measuring elapsed wall-clock time in seconds"""
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        self.elapsed = 0.0
+        return self
+
+    def __exit__(self, *exc_info):
+        self.elapsed = time.perf_counter() - self.started
@@ -0,0 +1,230 @@
+import hashlib
+import json
+import threading
+import uuid
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.utils.http import http_date, parse_http_date_safe
+from rest_framework import status
+from rest_framework.response import Response
+
+from . import replicas
+from . import sharding
+
+# Replaced on every station write; list entries are keyed by it so a single
+# write invalidates every cached listing at once
+LIST_VERSION_KEY = 'storage:stations:version'
+
+_stats = {'hits': 0, 'misses': 0}
+_stats_lock = threading.Lock()
+
+
+def get_cache():
+    """Return the cache backend configured for station responses"""
+    return caches[getattr(settings, 'STORAGE_CACHE_ALIAS', 'default')]
+
+
+def _timeout():
+    return getattr(settings, 'STORAGE_CACHE_TIMEOUT', 300)
+
+
+def _count(name):
+    with _stats_lock:
+        _stats[name] += 1
+
+
+def stats():
+    """Return a snapshot of the hit/miss counters"""
+    with _stats_lock:
+        return dict(_stats)
+
+
+def reset_stats():
+    """Zero the hit/miss counters"""
+    with _stats_lock:
+        for name in _stats:
+            _stats[name] = 0
+
+
+def _list_version(cache):
+    version = cache.get(LIST_VERSION_KEY)
+    if version is None:
+        cache.add(LIST_VERSION_KEY, uuid.uuid4().hex, None)
+        version = cache.get(LIST_VERSION_KEY)
+    return version
+
+
+def list_key(request, view='list'):
+    """
+    Cache key for a station listing, including its query string.
+
+    Responses computed over every station (e.g. ``view='summary'``) use
+    their own view name and are invalidated together with the listings.
+    """
+    version = _list_version(get_cache())
+    query = request.META.get('QUERY_STRING', '')
+    return f'storage:stations:{view}:v{version}:{query}'
+
+
+def _history_version_key(pk):
+    return f'storage:history:version:{pk}'
+
+
+def series_key(pk, start, end, points):
+    """
+    Cache key for a station's downsampled history series.
+
+    Keyed by the station's history version, so any new or pruned history
+    for the station makes every cached range of it unreachable.
+    """
+    cache = get_cache()
+    version_key = _history_version_key(pk)
+    version = cache.get(version_key)
+    if version is None:
+        cache.add(version_key, uuid.uuid4().hex, None)
+        version = cache.get(version_key)
+    start = start.isoformat() if start else ''
+    end = end.isoformat() if end else ''
+    return f'storage:series:{pk}:{version}:{start}:{end}:{points}'
+
+
+def detail_key(pk):
+    """Cache key for a single station"""
+    return f'storage:stations:detail:{pk}'
+
+
+def lookup(key):
+    """
+    Look up a cached response entry.
+
+    Returns:
+        dict: ``{'data': ..., 'etag': ...}`` or None on a miss
+    """
+    entry = get_cache().get(key)
+    if entry is not None and entry.get('replica') and not replicas.active():
+        # Possibly older than the data a client pinned to the primary just wrote
+        entry = None
+    _count('misses' if entry is None else 'hits')
+    return entry
+
+
+def _etag(data):
+    payload = json.dumps(data, cls=DjangoJSONEncoder, sort_keys=True)
+    return '"%s"' % hashlib.md5(payload.encode()).hexdigest()
+
+
+def store(key, data, last_modified=None):
+    """
+    Store serialized response data along with its validators and return the entry.
+
+    Data read from a replica may lag behind the version it is stored under,
+    so it is kept for no longer than the replica pinning window and is not
+    served to clients pinned to the primary; their reads replace it.
+    """
+    entry = {'data': data, 'etag': _etag(data), 'last_modified': last_modified}
+    timeout = _timeout()
+    if replicas.active():
+        entry['replica'] = True
+        timeout = min(timeout, replicas.pin_seconds())
+    get_cache().set(key, entry, timeout)
+    return entry
+
+
+def not_modified(request, etag=None, last_modified=None):
+    """
+    Whether a conditional GET can be answered with 304.
+
+    If-None-Match takes precedence over If-Modified-Since, as in RFC 9110:
+    the ETag also catches changes a timestamp cannot (e.g. a deletion).
+    """
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+    if if_none_match is not None:
+        etags = {tag.strip() for tag in if_none_match.split(',')}
+        return etag is not None and (etag in etags or '*' in etags)
+
+    if_modified_since = parse_http_date_safe(request.META.get('HTTP_IF_MODIFIED_SINCE', ''))
+    return (
+        last_modified is not None
+        and if_modified_since is not None
+        and int(last_modified.timestamp()) <= if_modified_since
+    )
+
+
+def validator_headers(etag=None, last_modified=None):
+    """ETag/Last-Modified response headers for the given validators"""
+    headers = {}
+    if etag is not None:
+        headers['ETag'] = etag
+    if last_modified is not None:
+        headers['Last-Modified'] = http_date(last_modified.timestamp())
+    return headers
+
+
+def respond(request, entry, hit, fields=None):
+    """
+    Build the response for a cache entry.
+
+    ``fields`` narrows a cached object to a sparse fieldset, with its own
+    ETag. Returns 304 with no body when the client's If-None-Match or
+    If-Modified-Since shows it already holds the data.
+    """
+    data, etag = entry['data'], entry['etag']
+    if fields is not None:
+        data = {name: data[name] for name in fields}
+        etag = _etag(data)
+    last_modified = entry.get('last_modified')
+    headers = {**validator_headers(etag, last_modified), 'X-Cache': 'HIT' if hit else 'MISS'}
+
+    if not_modified(request, etag, last_modified):
+        return Response(status=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(data, headers=headers)
+
+
+def _invalidate(pks):
+    cache = get_cache()
+    cache.delete_many([detail_key(pk) for pk in pks])
+    # A fresh random version, rather than a counter, cannot fall back to a
+    # version still holding entries when the version key is evicted
+    cache.set(LIST_VERSION_KEY, uuid.uuid4().hex, None)
+
+
+def invalidate_stations(pks, using=None):
+    """
+    Drop cached entries for the given stations and every cached listing.
+
+    Runs immediately and again once the surrounding transaction commits
+    (on ``using``, by default the current shard), so a read that races the
+    write cannot repopulate the cache with the pre-commit state.
+    """
+    pks = list(pks)
+    _invalidate(pks)
+    transaction.on_commit(lambda: _invalidate(pks), using=using or sharding.current_db())
+
+
+def station_changed(sender, instance, using, **kwargs):
+    """post_save/post_delete receiver for Station, including admin and queryset deletes"""
+    invalidate_stations([instance.pk], using=using)
+
+
+def _invalidate_history(pks):
+    # A fresh random version, rather than a counter, also invalidates when
+    # the version key had been evicted
+    version = uuid.uuid4().hex
+    get_cache().set_many({_history_version_key(pk): version for pk in pks}, None)
+
+
+def invalidate_history(pks):
+    """
+    Drop the cached series of the given stations.
+
+    Called whenever history events are inserted or pruned; like
+    ``invalidate_stations`` it runs again once the transaction commits.
+    """
+    pks = set(pks)
+    if not pks:
+        return
+    _invalidate_history(pks)
+    transaction.on_commit(lambda: _invalidate_history(pks), using=sharding.current_db())
@@ -0,0 +1,21 @@
+from django.conf import settings
+
+
+def configure_sqlite_connection(sender, connection, **kwargs):
+    """
+    Apply the SQLITE_PRAGMAS setting to every new SQLite connection.
+
+    Connected to ``connection_created``; journal mode, synchronous level,
+    busy timeout and mmap size are per-connection (WAL is persisted in the
+    file, but setting it again is a no-op).
+    """
+    if connection.vendor != 'sqlite':
+        return
+
+    pragmas = getattr(settings, 'SQLITE_PRAGMAS', {})
+    if not pragmas:
+        return
+
+    with connection.cursor() as cursor:
+        for name, value in pragmas.items():
+            cursor.execute(f'PRAGMA {name} = {value}')
@@ -0,0 +1,73 @@
+import asyncio
+import threading
+
+from django.db import transaction
+
+from . import sharding
+
+
+class EventBroker:
+    """
+    In-process publish/subscribe hub for station events.
+
+    Subscribers are asyncio queues owned by the event loop serving a
+    streaming response; publishers may run on any thread (e.g. a WSGI
+    worker or a sync view under ASGI). Swapping this class for one backed
+    by a message broker only needs ``subscribe``/``unsubscribe``/``publish``.
+    """
+
+    def __init__(self, max_queue_size=100):
+        self.max_queue_size = max_queue_size
+        self._subscribers = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self):
+        """Register a subscriber on the running event loop and return its queue"""
+        queue = asyncio.Queue(maxsize=self.max_queue_size)
+        with self._lock:
+            self._subscribers[queue] = asyncio.get_running_loop()
+        return queue
+
+    def unsubscribe(self, queue):
+        """Remove a subscriber queue"""
+        with self._lock:
+            self._subscribers.pop(queue, None)
+
+    @property
+    def subscriber_count(self):
+        with self._lock:
+            return len(self._subscribers)
+
+    def publish(self, event):
+        """Deliver an event to every subscriber, from any thread"""
+        with self._lock:
+            subscribers = list(self._subscribers.items())
+
+        for queue, loop in subscribers:
+            try:
+                loop.call_soon_threadsafe(self._put, queue, event)
+            except RuntimeError:
+                # The subscriber's loop has been closed
+                self.unsubscribe(queue)
+
+    @staticmethod
+    def _put(queue, event):
+        # A slow client never blocks publishers: its oldest event is dropped
+        if queue.full():
+            queue.get_nowait()
+        queue.put_nowait(event)
+
+
+broker = EventBroker()
+
+
+def publish_station_event(event_type, station_data):
+    """
+    Publish a station event once the current transaction commits.
+
+    Args:
+        event_type (str): History operation type, e.g. 'update'
+        station_data (dict): Serialized station state after the operation
+    """
+    event = {'type': event_type, 'station': station_data}
+    transaction.on_commit(lambda: broker.publish(event), using=sharding.current_db())
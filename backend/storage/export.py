@@ -0,0 +1,151 @@
+import csv
+import json
+import zlib
+
+from django.core.handlers.asgi import ASGIRequest
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+
+from .models import StationHistory
+
+COLUMNS = (
+    'id', 'station_id', 'station_name', 'operation_type', 'volume_percentage',
+    'previous_volume_percentage', 'timestamp', 'notes',
+)
+CONTENT_TYPES = {
+    'csv': 'text/csv; charset=utf-8',
+    'ndjson': 'application/x-ndjson',
+}
+# Rows fetched per database round trip
+CHUNK_SIZE = 2000
+# Rows encoded into each chunk of the response body
+ROWS_PER_CHUNK = 500
+
+
+class _Echo:
+    """File-like object handing csv.writer's output straight back"""
+
+    def write(self, value):
+        return value
+
+
+class HistoryEncoder:
+    """
+    Incrementally encode history rows as CSV or NDJSON, optionally gzipped.
+
+    Rows are buffered ``ROWS_PER_CHUNK`` at a time, so the response is sent
+    in reasonably sized chunks while memory stays constant.
+    """
+
+    def __init__(self, output, compress=False):
+        self.output = output
+        self._writer = csv.writer(_Echo())
+        self._compressor = zlib.compressobj(wbits=16 + zlib.MAX_WBITS) if compress else None
+        self._lines = []
+        if output == 'csv':
+            self._lines.append(self._writer.writerow(COLUMNS))
+
+    def _encode(self, row):
+        record = {
+            'id': row['id'],
+            'station_id': row['station_id'],
+            'station_name': row['station__name'],
+            'operation_type': row['operation_type'],
+            'volume_percentage': row['volume_percentage'],
+            'previous_volume_percentage': row['previous_volume_percentage'],
+            'timestamp': row['timestamp'].isoformat(),
+            'notes': StationHistory.describe_values(
+                row['operation_type'], row['volume_percentage'], row['previous_volume_percentage'], row['notes']
+            ),
+        }
+        if self.output == 'csv':
+            return self._writer.writerow([record[column] for column in COLUMNS])
+        return json.dumps(record, cls=DjangoJSONEncoder, ensure_ascii=False) + '\n'
+
+    def _drain(self):
+        data = ''.join(self._lines).encode()
+        self._lines = []
+        if self._compressor is not None:
+            data = self._compressor.compress(data)
+        return data
+
+    def feed(self, row):
+        """Add a row, returning the next chunk of the body once one is full"""
+        self._lines.append(self._encode(row))
+        if len(self._lines) >= ROWS_PER_CHUNK:
+            return self._drain()
+        return b''
+
+    def finish(self):
+        """Return the rest of the body"""
+        data = self._drain()
+        if self._compressor is not None:
+            data += self._compressor.flush()
+        return data
+
+
+def _stream(rows, encoder):
+    for row in rows.iterator(chunk_size=CHUNK_SIZE):
+        chunk = encoder.feed(row)
+        if chunk:
+            yield chunk
+    yield encoder.finish()
+
+
+async def _astream(rows, encoder):
+    async for row in rows.aiterator(chunk_size=CHUNK_SIZE):
+        chunk = encoder.feed(row)
+        if chunk:
+            yield chunk
+    yield encoder.finish()
+
+
+def accepts_gzip(accept_encoding):
+    """
+    Whether an Accept-Encoding header allows a gzipped body.
+
+    ``gzip`` (or ``x-gzip``) is looked up first, then the ``*`` wildcard; a
+    coding listed with ``q=0`` is refused.
+    """
+    weights = {}
+    for item in accept_encoding.split(','):
+        coding, *params = [part.strip() for part in item.split(';')]
+        quality = 1.0
+        for param in params:
+            name, _, value = param.partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        weights.setdefault(coding.lower(), quality)
+    for coding in ('gzip', 'x-gzip', '*'):
+        if coding in weights:
+            return weights[coding] > 0
+    return False
+
+
+def export_response(request, queryset, output):
+    """
+    Stream a history queryset in chronological order as CSV or NDJSON.
+
+    Rows are read with ``.values()`` in chunks instead of model instances,
+    so memory use does not grow with the export. The body is gzipped when
+    the client accepts it. Under ASGI the rows are read asynchronously, as
+    Django would otherwise buffer a synchronous iterator in memory.
+    """
+    # The body is read after the view returns; pin the shard it was routed to
+    rows = queryset.using(queryset.db).order_by('timestamp', 'id').values(
+        'id', 'station_id', 'station__name', 'operation_type', 'volume_percentage',
+        'previous_volume_percentage', 'timestamp', 'notes',
+    )
+    compress = accepts_gzip(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+    encoder = HistoryEncoder(output, compress)
+    stream = _astream if isinstance(request, ASGIRequest) else _stream
+
+    response = StreamingHttpResponse(stream(rows, encoder), content_type=CONTENT_TYPES[output])
+    response['Content-Disposition'] = f'attachment; filename="history.{output}"'
+    response['Vary'] = 'Accept-Encoding'
+    if compress:
+        response['Content-Encoding'] = 'gzip'
+    return response
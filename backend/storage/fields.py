@@ -0,0 +1,58 @@
+from django.core.exceptions import ValidationError
+from django.db import models
+from django.utils.functional import cached_property
+
+# History operation types and the small integer stored for each.
+# Codes are persisted: append new types, never renumber existing ones.
+OPERATION_TYPES = {
+    'create': 1,
+    'update': 2,
+    'collection_request': 3,
+    'collection_complete': 4,
+}
+OPERATION_NAMES = {code: name for name, code in OPERATION_TYPES.items()}
+
+
+class OperationTypeField(models.PositiveSmallIntegerField):
+    """
+    Stores a history operation type as a small integer.
+
+    Python code, querysets and the API keep using the operation names
+    ('update', 'collection_request', ...); only the column is compact.
+    """
+
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault('choices', [(name, name) for name in OPERATION_TYPES])
+        super().__init__(*args, **kwargs)
+
+    @cached_property
+    def validators(self):
+        # Values are operation names, the integer range validators do not apply
+        return list(self._validators)
+
+    def from_db_value(self, value, expression, connection):
+        if value is None:
+            return value
+        return OPERATION_NAMES[value]
+
+    def to_python(self, value):
+        if value is None or value in OPERATION_TYPES:
+            return value
+        if isinstance(value, int) and value in OPERATION_NAMES:
+            return OPERATION_NAMES[value]
+        raise ValidationError(
+            'Tipo de operação inválido: %(value)s',
+            code='invalid',
+            params={'value': value},
+        )
+
+    def get_prep_value(self, value):
+        if value is None or isinstance(value, int):
+            return value
+        try:
+            return OPERATION_TYPES[value]
+        except KeyError:
+            raise ValueError(f'Unknown operation type: {value!r}') from None
+
+    def value_to_string(self, obj):
+        return self.value_from_object(obj)
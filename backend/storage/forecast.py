@@ -0,0 +1,234 @@
+import threading
+from datetime import timedelta
+
+import numpy as np
+
+from . import horizon
+from . import sharding
+from .cache import get_cache
+from .models import COLLECTION_THRESHOLD, StationHistory
+
+# Fitted state shared by every worker through the station cache backend, one per shard
+STATE_KEY = 'storage:forecast:state'
+
+# Operations that carry a volume reading; create and collection_complete
+# also start a new fill cycle
+SAMPLE_OPERATIONS = ('create', 'update', 'collection_complete')
+CYCLE_OPERATIONS = ('create', 'collection_complete')
+
+# Columns of ForecastState.sums: the sufficient statistics of a least-squares line
+N, SUM_T, SUM_V, SUM_TT, SUM_TV = range(5)
+
+_lock = threading.Lock()
+
+
+class ForecastState:
+    """
+    Running least-squares sums of volume over time, one row per station.
+
+    Each station is fitted over its current fill cycle, i.e. the readings
+    since it was created or last emptied, with time measured in hours from
+    the start of the cycle. Only the sums are kept, so new history events
+    are folded in without rereading older ones. Every event up to the
+    ``floor`` id has been applied; above it, ``applied`` holds the ids
+    applied up to ``last_id``, the highest id read, so that events that
+    commit late are applied once (see ``horizon``).
+    """
+
+    def __init__(self):
+        self.floor = 0
+        self.last_id = 0
+        self.checkpoint = None
+        self.applied = np.empty(0, dtype=np.int64)
+        self.station_ids = np.empty(0, dtype=np.int64)
+        self.origin = np.empty(0)  # cycle start, epoch seconds (NaN if unknown)
+        self.sums = np.zeros((0, 5))
+
+    def _grow(self, station_ids):
+        """Add rows for unseen stations, keeping station_ids sorted"""
+        merged = np.union1d(self.station_ids, station_ids)
+        if len(merged) == len(self.station_ids):
+            return
+        rows = np.searchsorted(merged, self.station_ids)
+        origin = np.full(len(merged), np.nan)
+        sums = np.zeros((len(merged), 5))
+        origin[rows] = self.origin
+        sums[rows] = self.sums
+        self.station_ids, self.origin, self.sums = merged, origin, sums
+
+    def apply(self, ids, stations, times, volumes, cycle_starts):
+        """
+        Fold a batch of readings, ordered by id, into the sums.
+
+        Readings older than their station's current cycle, i.e. that
+        committed after a later cycle start was applied, are ignored.
+
+        Args:
+            ids: StationHistory ids
+            stations: Station id of each reading
+            times: Reading time in epoch seconds
+            volumes: Volume after the operation
+            cycle_starts: Whether the reading starts a new fill cycle
+        """
+        if not len(ids):
+            return
+        self._grow(np.unique(stations))
+        rows = np.searchsorted(self.station_ids, stations)
+        current = ~(times < self.origin[rows])
+        if not current.all():
+            rows, times, volumes, cycle_starts = rows[current], times[current], volumes[current], cycle_starts[current]
+        order = np.arange(len(rows))
+
+        # Readings before a station's last cycle start in this batch are stale
+        last_start = np.full(len(self.station_ids), -1)
+        np.maximum.at(last_start, rows[cycle_starts], order[cycle_starts])
+        restarted = last_start >= 0
+        self.sums[restarted] = 0
+        self.origin[restarted] = times[last_start[restarted]]
+
+        keep = order >= last_start[rows]
+        rows, times, volumes = rows[keep], times[keep], volumes[keep]
+
+        # Stations first seen mid-cycle start at their earliest reading
+        first = np.full(len(self.station_ids), np.inf)
+        np.minimum.at(first, rows, times)
+        unknown = np.isnan(self.origin)
+        self.origin[unknown] = first[unknown]
+
+        hours = (times - self.origin[rows]) / 3600
+        size = len(self.station_ids)
+        self.sums[:, N] += np.bincount(rows, minlength=size)
+        self.sums[:, SUM_T] += np.bincount(rows, hours, size)
+        self.sums[:, SUM_V] += np.bincount(rows, volumes, size)
+        self.sums[:, SUM_TT] += np.bincount(rows, hours * hours, size)
+        self.sums[:, SUM_TV] += np.bincount(rows, hours * volumes, size)
+
+    def fill_rates(self):
+        """
+        Fitted fill rate (% per hour) for every station.
+
+        Returns NaN where the cycle has fewer than two readings or all
+        readings share the same time.
+        """
+        n, t, v, tt, tv = self.sums.T
+        denominator = n * tt - t * t
+        fitted = (n >= 2) & (denominator > 1e-9)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return np.where(fitted, (n * tv - t * v) / denominator, np.nan)
+
+
+def _apply_rows(state, rows, read):
+    """Apply (id, station, timestamp, volume, operation) rows not applied yet"""
+    ids = np.array([row[0] for row in rows], dtype=np.int64)
+    new = ~np.isin(ids, state.applied)
+    rows = [row for row, keep in zip(rows, new) if keep]
+    if rows:
+        _, stations, timestamps, volumes, operations = zip(*rows)
+        state.apply(
+            ids[new],
+            np.array(stations, dtype=np.int64),
+            np.array([timestamp.timestamp() for timestamp in timestamps]),
+            np.array(volumes, dtype=float),
+            np.isin(np.array(operations), CYCLE_OPERATIONS),
+        )
+    state.last_id = max(state.last_id, int(ids[-1]))
+    floor = read.history_floor(state.floor, state.last_id, state.checkpoint)
+    applied = np.union1d(state.applied, ids)
+    state.applied = applied[applied > floor]
+
+
+def refresh(batch_size=50000):
+    """
+    Bring the cached state up to date with the history and return it.
+
+    Events are read in id order: those between the state's floor and
+    ``last_id`` that were not applied yet (late commits), then those above
+    ``last_id``. The state is rebuilt from the retained history if it was
+    evicted.
+    """
+    cache = get_cache()
+    key = f'{STATE_KEY}:{sharding.current_db()}'
+    with _lock:
+        cached = cache.get(key)
+        if not hasattr(cached, 'floor'):
+            # Missing, or cached by a version without late-commit tracking
+            cached = None
+        state = cached or ForecastState()
+        before = (state.floor, state.last_id, state.checkpoint)
+        samples = StationHistory.objects.filter(operation_type__in=SAMPLE_OPERATIONS).order_by('id').values_list(
+            'id', 'station_id', 'timestamp', 'volume_percentage', 'operation_type'
+        )
+        with horizon.reading(stations=False) as read:
+            if state.floor < state.last_id:
+                late = list(samples.filter(id__gt=state.floor, id__lte=state.last_id))
+                if late:
+                    _apply_rows(state, late, read)
+            while True:
+                rows = list(samples.filter(id__gt=state.last_id)[:batch_size])
+                if not rows:
+                    break
+                _apply_rows(state, rows, read)
+                if len(rows) < batch_size:
+                    break
+        state.floor = read.history_floor(state.floor, state.last_id, state.checkpoint)
+        state.checkpoint = read.checkpoint
+        if cached is None or (state.floor, state.last_id, state.checkpoint) != before:
+            cache.set(key, state, None)
+        return state
+
+
+def _hours_to(target, volumes, rates):
+    """Hours after the last update until ``target`` is reached (0 if already reached)"""
+    with np.errstate(divide='ignore', invalid='ignore'):
+        hours = np.where(volumes >= target, 0.0, (target - volumes) / rates)
+    return np.where((volumes < target) & ~(rates > 0), np.nan, hours)
+
+
+def forecast(stations, now):
+    """
+    Predict when each station reaches the collection threshold and 100%.
+
+    Args:
+        stations: Dicts with ``id``, ``volume_percentage`` and ``updated_at``
+        now: Reference time for the ``hours_to_*`` values
+
+    Returns:
+        list: One dict per station with the fitted ``fill_rate`` (% per
+        hour), the number of ``samples`` in the current cycle and, for each
+        target, the predicted time and the hours left from ``now``. Times
+        are None when the station is not filling up.
+    """
+    state = refresh()
+    if not stations:
+        return []
+
+    ids = np.array([station['id'] for station in stations], dtype=np.int64)
+    volumes = np.array([station['volume_percentage'] for station in stations], dtype=float)
+    rates = np.full(len(ids), np.nan)
+    samples = np.zeros(len(ids), dtype=int)
+    if len(state.station_ids):
+        rows = np.searchsorted(state.station_ids, ids).clip(max=len(state.station_ids) - 1)
+        known = state.station_ids[rows] == ids
+        rates[known] = state.fill_rates()[rows[known]]
+        samples[known] = state.sums[rows[known], N]
+    etas = {
+        'threshold': _hours_to(COLLECTION_THRESHOLD, volumes, rates),
+        'full': _hours_to(100, volumes, rates),
+    }
+
+    results = []
+    for index, station in enumerate(stations):
+        result = {
+            'id': station['id'],
+            'fill_rate': None if np.isnan(rates[index]) else float(rates[index]),
+            'samples': int(samples[index]),
+        }
+        for name, hours in etas.items():
+            if np.isnan(hours[index]):
+                result[f'{name}_at'] = result[f'hours_to_{name}'] = None
+                continue
+            at = station['updated_at'] + timedelta(hours=float(hours[index]))
+            result[f'{name}_at'] = at
+            result[f'hours_to_{name}'] = max((at - now).total_seconds() / 3600, 0.0)
+        results.append(result)
+    return results
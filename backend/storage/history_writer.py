@@ -0,0 +1,194 @@
+import atexit
+import logging
+import queue
+import threading
+import time
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger('storage.history_writer')
+
+_STOP = object()
+
+
+class HistoryWriter:
+    """
+    Buffered write-behind queue for StationHistory events.
+
+    Request threads hand over unsaved events and return immediately; a
+    background thread inserts them with ``bulk_create`` once ``batch_size``
+    events are buffered or ``flush_interval`` seconds have passed. The queue
+    holds at most ``max_size`` events: when it is full, producers wait up to
+    ``put_timeout`` seconds and then insert their events themselves, so
+    memory stays bounded. A failed insert is retried ``retries`` times with
+    exponential backoff from ``retry_delay`` seconds, then event by event;
+    only events that still fail are dropped, and they are counted in
+    ``dropped_events()``. Pending events are flushed when the process exits.
+    """
+
+    def __init__(self, max_size=10000, batch_size=500, flush_interval=1.0, put_timeout=0.5,
+                 retries=3, retry_delay=0.1):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.put_timeout = put_timeout
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self._queue = queue.Queue(maxsize=max_size)
+        self._thread = None
+        self._lock = threading.Lock()
+
+    @property
+    def pending(self):
+        """Approximate number of queued events"""
+        return self._queue.qsize()
+
+    def start(self):
+        """Start the background thread if it is not running"""
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='history-writer', daemon=True)
+                self._thread.start()
+
+    def submit(self, events):
+        """Queue events for insertion, writing them inline under backpressure"""
+        self.start()
+        for index, event in enumerate(events):
+            try:
+                self._queue.put(event, timeout=self.put_timeout)
+            except queue.Full:
+                logger.warning('History queue full, writing %d events synchronously', len(events) - index)
+                self._write(list(events[index:]))
+                return
+
+    def flush(self, timeout=None):
+        """Block until every event queued so far has been written"""
+        if self._thread is not None and self._thread.is_alive():
+            done = threading.Event()
+            self._queue.put(done, timeout=timeout)
+            done.wait(timeout)
+
+    def stop(self, timeout=10):
+        """Flush pending events and stop the background thread"""
+        with self._lock:
+            thread = self._thread
+            self._thread = None
+        if thread is not None and thread.is_alive():
+            self._queue.put(_STOP)
+            thread.join(timeout)
+
+    def _run(self):
+        batch = []
+        deadline = time.monotonic() + self.flush_interval
+        try:
+            while True:
+                try:
+                    item = self._queue.get(timeout=max(deadline - time.monotonic(), 0))
+                except queue.Empty:
+                    item = None
+
+                if item is None or item is _STOP or isinstance(item, threading.Event):
+                    self._write(batch)
+                    batch = []
+                    deadline = time.monotonic() + self.flush_interval
+                    if isinstance(item, threading.Event):
+                        item.set()
+                    if item is _STOP:
+                        return
+                    continue
+
+                batch.append(item)
+                if len(batch) >= self.batch_size:
+                    self._write(batch)
+                    batch = []
+                    deadline = time.monotonic() + self.flush_interval
+        finally:
+            connections.close_all()
+
+    def _write(self, events):
+        if not events:
+            return
+        from . import cache as station_cache
+
+        # Events are tagged with the shard they were recorded on
+        by_db = {}
+        for event in events:
+            by_db.setdefault(event._state.db or 'default', []).append(event)
+        for db, shard_events in by_db.items():
+            written = self._insert(db, shard_events)
+            if written:
+                station_cache.invalidate_history(event.station_id for event in written)
+
+    def _insert(self, db, events):
+        """
+        Insert events on ``db``, retrying failed batches with backoff.
+
+        When every attempt fails the events are inserted one by one, so a
+        single bad event cannot take the batch down with it.
+
+        Returns:
+            list: The events written
+        """
+        from .models import StationHistory
+
+        delay = self.retry_delay
+        for attempt in range(self.retries + 1):
+            try:
+                StationHistory.objects.using(db).bulk_create(events, batch_size=self.batch_size)
+                return events
+            except Exception:
+                logger.warning(
+                    'Failed to write %d history events (attempt %d)', len(events), attempt + 1, exc_info=True
+                )
+                # Reconnect after e.g. a database restart
+                connections[db].close_if_unusable_or_obsolete()
+            if attempt < self.retries:
+                time.sleep(delay)
+                delay *= 2
+
+        written = []
+        for event in events:
+            try:
+                StationHistory.objects.using(db).bulk_create([event])
+            except Exception:
+                logger.exception('Dropped history event for station %s', event.station_id)
+                _count_dropped()
+            else:
+                written.append(event)
+        return written
+
+
+_dropped = 0
+_dropped_lock = threading.Lock()
+
+
+def _count_dropped():
+    global _dropped
+    with _dropped_lock:
+        _dropped += 1
+
+
+def dropped_events():
+    """Number of history events the writer failed to insert since the process started"""
+    with _dropped_lock:
+        return _dropped
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def is_enabled():
+    """Whether history events go through the write-behind queue"""
+    return getattr(settings, 'STORAGE_HISTORY_WRITE_BEHIND', False)
+
+
+def get_writer():
+    """Return the process-wide writer, creating it from settings on first use"""
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            options = getattr(settings, 'STORAGE_HISTORY_WRITER', {})
+            _writer = HistoryWriter(**options)
+            atexit.register(_writer.stop)
+        return _writer
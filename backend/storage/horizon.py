@@ -0,0 +1,108 @@
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.db import connections
+from django.utils import timezone
+
+from . import sharding
+from .models import StationHistory
+
+# Rows are stamped (updated_at) and numbered (history ids) before their
+# transaction commits, so an incremental reader can see a later stamp or id
+# before an earlier one becomes visible. A reading horizon tells the reader
+# how far what it read is complete:
+#
+# - SQLite serializes writers, so history ids become visible in order.
+#   Station stamps are read in a deferred (snapshot) transaction that does
+#   not take the write lock. A write in flight waited at most the busy
+#   timeout for the lock and, as writers queued behind it give up after
+#   the same timeout, holds it for less than that: it was stamped at most
+#   twice the busy timeout ago.
+# - PostgreSQL commits concurrently. Nothing older than the oldest other
+#   transaction that has written (pg_stat_activity) can still commit, and
+#   history ids are trusted up to the sequence value sampled before it began.
+# - Other databases fall back to a fixed overlap.
+
+# Margin for clock skew between the application and the database server
+OVERLAP = timedelta(seconds=2)
+
+POSTGRES_SAMPLE_SQL = """
+    SELECT clock_timestamp(),
+           (SELECT min(xact_start) FROM pg_stat_activity
+            WHERE backend_xid IS NOT NULL AND pid <> pg_backend_pid() AND datname = current_database()),
+           pg_sequence_last_value(pg_get_serial_sequence(%s, 'id')::regclass)
+"""
+
+
+class Horizon:
+    """
+    How complete the reads made in a ``reading`` block are.
+
+    ``stations_before``: every station change stamped before this time was
+    visible. ``checkpoint``: database time and last allocated history id,
+    to hand to the next read's ``history_floor`` (None where history ids
+    become visible in order).
+    """
+
+    def __init__(self, stations_before, checkpoint=None, oldest_writer=None):
+        self.stations_before = stations_before
+        self.checkpoint = checkpoint
+        self.oldest_writer = oldest_writer
+
+    def history_floor(self, floor, last_read, checkpoint):
+        """
+        History id up to which every event has been read.
+
+        Args:
+            floor: The floor after the previous read
+            last_read: The highest history id read so far
+            checkpoint: The previous read's ``checkpoint``
+        """
+        if self.oldest_writer is None:
+            return max(floor, last_read)
+        # Ids allocated after the checkpoint belong to transactions started
+        # after it; if none of those started before the oldest writer still
+        # running, every id up to the checkpoint's has committed or aborted
+        if checkpoint is not None and checkpoint[0] <= self.oldest_writer:
+            return max(floor, min(checkpoint[1], last_read))
+        return floor
+
+
+@contextmanager
+def reading(using=None, stations=True):
+    """
+    Run incremental reads of station data and yield their ``Horizon``.
+
+    Args:
+        using: Database alias, by default the current shard
+        stations: Whether station stamps are read; on SQLite the block then
+            reads from a single snapshot
+    """
+    using = using or sharding.current_db()
+    connection = connections[using]
+    if connection.vendor == 'sqlite':
+        if not stations:
+            yield Horizon(timezone.now() - OVERLAP)
+            return
+        busy_timeout = timedelta(seconds=connection.settings_dict['OPTIONS'].get('timeout', 5))
+        stations_before = timezone.now() - 2 * busy_timeout - OVERLAP
+        if connection.in_atomic_block:
+            yield Horizon(stations_before)
+            return
+        # atomic() would begin with the configured BEGIN IMMEDIATE and wait
+        # for the write lock; a deferred transaction only pins a snapshot
+        with connection.cursor() as cursor:
+            cursor.execute('BEGIN DEFERRED')
+        try:
+            yield Horizon(stations_before)
+        finally:
+            with connection.cursor() as cursor:
+                cursor.execute('COMMIT')
+    elif connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute(POSTGRES_SAMPLE_SQL, [StationHistory._meta.db_table])
+            now, oldest_writer, last_id = cursor.fetchone()
+        oldest_writer = min(oldest_writer or now, now)
+        yield Horizon(oldest_writer - OVERLAP, (now.timestamp(), last_id or 0), oldest_writer.timestamp())
+    else:
+        yield Horizon(timezone.now() - OVERLAP)
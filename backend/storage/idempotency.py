@@ -0,0 +1,243 @@
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.response import Response
+
+from .models import IdempotencyKey
+
+HEADER = 'Idempotency-Key'
+MAX_KEY_LENGTH = IdempotencyKey._meta.get_field('key').max_length
+
+
+def _options():
+    options = {'max_entries': 10000, 'ttl': 86400, 'lock_timeout': 60}
+    options.update(getattr(settings, 'STORAGE_IDEMPOTENCY', {}))
+    return options
+
+
+class ResponseCache:
+    """
+    Bounded LRU of completed responses, with a time to live.
+
+    Sits in front of the IdempotencyKey table so a retry of a recent write
+    is answered without a query. Each worker process keeps its own.
+    """
+
+    def __init__(self, max_entries, ttl):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] <= time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key, value, created_at):
+        expires_at = created_at.timestamp() + self.ttl
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache():
+    """Return the process-wide response cache, created from settings on first use"""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            options = _options()
+            _cache = ResponseCache(options['max_entries'], options['ttl'])
+        return _cache
+
+
+class IdempotentResponse(Exception):
+    """Raised before the handler runs when the request must not be executed"""
+
+    def __init__(self, response):
+        super().__init__(response.status_code)
+        self.response = response
+
+
+def fingerprint(request, body=None):
+    """SHA-256 of the request's method, path and body (``request.body`` unless given)"""
+    digest = hashlib.sha256()
+    if body is None:
+        body = request.body
+    for part in (request.method.encode(), request.get_full_path().encode(), body):
+        digest.update(part)
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+def _replay(stored_fingerprint, status_code, body, request_fingerprint):
+    if status_code is None:
+        return Response(
+            {'error': 'Uma requisição com esta Idempotency-Key ainda está em andamento.'},
+            status=status.HTTP_409_CONFLICT,
+        )
+    if stored_fingerprint != request_fingerprint:
+        return Response(
+            {'error': 'Idempotency-Key já usada em outra requisição.'},
+            status=status.HTTP_422_UNPROCESSABLE_ENTITY,
+        )
+    return Response(
+        json.loads(body) if body else None,
+        status=status_code,
+        headers={'Idempotent-Replayed': 'true'},
+    )
+
+
+def begin(request, body=None):
+    """
+    Claim the request's Idempotency-Key before the write runs.
+
+    ``body`` is the raw request body, for requests whose stream was already
+    consumed by parsing ``request.data``.
+
+    Returns the claim ``(key, fingerprint, created_at)``, or None for
+    requests without a key (and safe methods). A key already completed by
+    an identical request raises IdempotentResponse with the stored
+    response; a key in progress or used for a different request raises it
+    with 409/422.
+    """
+    key = request.headers.get(HEADER)
+    if key is None or request.method in SAFE_METHODS:
+        return None
+    if not key or len(key) > MAX_KEY_LENGTH:
+        raise IdempotentResponse(Response(
+            {'error': f'Idempotency-Key deve ter entre 1 e {MAX_KEY_LENGTH} caracteres.'},
+            status=status.HTTP_400_BAD_REQUEST,
+        ))
+
+    request_fingerprint = fingerprint(request, body)
+    cached = get_cache().get(key)
+    if cached is not None:
+        raise IdempotentResponse(_replay(*cached, request_fingerprint))
+
+    options = _options()
+    now = timezone.now()
+    try:
+        with transaction.atomic():
+            IdempotencyKey.objects.create(key=key, fingerprint=request_fingerprint, created_at=now)
+        return key, request_fingerprint, now
+    except IntegrityError:
+        pass
+
+    entry = IdempotencyKey.objects.filter(key=key).first()
+    if entry is None:
+        # Released by a failed request in the meantime
+        raise IdempotentResponse(_replay(None, None, '', request_fingerprint))
+
+    expired = entry.created_at <= now - timedelta(seconds=options['ttl'])
+    # A claim never completed, e.g. the worker died mid-request
+    abandoned = entry.status_code is None and entry.created_at <= now - timedelta(seconds=options['lock_timeout'])
+    if not expired and not abandoned:
+        if entry.status_code is not None:
+            get_cache().set(key, (entry.fingerprint, entry.status_code, entry.response), entry.created_at)
+        raise IdempotentResponse(_replay(entry.fingerprint, entry.status_code, entry.response, request_fingerprint))
+
+    # Take over the stale claim; only one concurrent retry can match the old created_at
+    claimed = IdempotencyKey.objects.filter(key=key, created_at=entry.created_at).update(
+        fingerprint=request_fingerprint, status_code=None, response='', created_at=now
+    )
+    if not claimed:
+        raise IdempotentResponse(_replay(None, None, '', request_fingerprint))
+    return key, request_fingerprint, now
+
+
+def complete(claim, response):
+    """
+    Store the response of a claimed key.
+
+    Only successful responses are kept; after an error the claim is
+    released so the client can retry the same request.
+    """
+    key, request_fingerprint, created_at = claim
+    if not 200 <= response.status_code < 300:
+        release(claim)
+        return
+
+    claimed = IdempotencyKey.objects.filter(key=key, created_at=created_at, status_code=None)
+
+    body = json.dumps(response.data, cls=DjangoJSONEncoder) if response.data is not None else ''
+    if claimed.update(status_code=response.status_code, response=body):
+        get_cache().set(key, (request_fingerprint, response.status_code, body), created_at)
+
+
+def release(claim):
+    """Drop a claimed key without storing a response, so the request can be retried"""
+    key, _, created_at = claim
+    IdempotencyKey.objects.filter(key=key, created_at=created_at, status_code=None).delete()
+
+
+def purge():
+    """Delete expired keys; returns the number deleted"""
+    cutoff = timezone.now() - timedelta(seconds=_options()['ttl'])
+    deleted, _ = IdempotencyKey.objects.filter(created_at__lte=cutoff).delete()
+    return deleted
+
+
+class IdempotentMixin:
+    """
+    Honor the ``Idempotency-Key`` header on a viewset's unsafe methods.
+
+    The first request with a key runs normally and its successful response
+    is stored; retries with the same key and request get the stored
+    response (with ``Idempotent-Replayed: true``) without running the
+    handler again.
+    """
+
+    def initial(self, request, *args, **kwargs):
+        self.idempotency_claim = None
+        # Keep the raw body: hooks run by initial() (routing, permissions,
+        # throttles) may parse request.data, which consumes the stream
+        body = request.body if HEADER in request.headers and request.method not in SAFE_METHODS else None
+        super().initial(request, *args, **kwargs)
+        self.idempotency_claim = begin(request, body)
+
+    def handle_exception(self, exc):
+        if isinstance(exc, IdempotentResponse):
+            return exc.response
+        try:
+            return super().handle_exception(exc)
+        except BaseException:
+            # Re-raised without a response, so finalize_response never runs
+            claim = getattr(self, 'idempotency_claim', None)
+            if claim is not None:
+                self.idempotency_claim = None
+                release(claim)
+            raise
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        claim = getattr(self, 'idempotency_claim', None)
+        if claim is not None:
+            self.idempotency_claim = None
+            complete(claim, response)
+        return super().finalize_response(request, response, *args, **kwargs)
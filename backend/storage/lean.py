@@ -0,0 +1,113 @@
+from operator import itemgetter
+
+from django.utils import timezone
+from rest_framework import fields, relations
+
+# Fields whose to_representation returns the database value unchanged
+PASSTHROUGH_FIELDS = (fields.BooleanField, fields.CharField, fields.FloatField, fields.IntegerField)
+
+
+def _datetime_getter(column):
+    """DateTimeField.to_representation for ISO 8601 output, without the field lookups"""
+
+    def get(row):
+        value = row[column]
+        if value is None:
+            return None
+        value = timezone.localtime(value).isoformat()
+        if value.endswith('+00:00'):
+            value = value[:-6] + 'Z'
+        return value
+
+    return get
+
+
+def _field_getter(field, column):
+    def get(row):
+        value = row[column]
+        return None if value is None else field.to_representation(value)
+
+    return get
+
+
+class ValuesMapper:
+    """
+    Build a serializer's read representation from ``.values()`` rows.
+
+    The serializer's fields are inspected once and compiled into one getter
+    per output key, so listing skips model instantiation and the per-field
+    attribute lookups of ``to_representation`` while producing the same
+    schema. Fields the mapper cannot derive from a column (e.g. a method
+    source) are supplied through ``computed``: ``{key: (columns, function)}``
+    where ``function`` receives the row.
+
+    Every method takes an optional list of output keys (a sparse fieldset);
+    the query then only selects the columns those keys need.
+    """
+
+    def __init__(self, serializer_class, computed=None):
+        self.serializer_class = serializer_class
+        self.computed = computed or {}
+        self._fields = None
+        self._plans = {}
+
+    def _compile(self):
+        compiled = {}
+        for key, field in self.serializer_class().fields.items():
+            if key in self.computed:
+                columns, getter = self.computed[key]
+                compiled[key] = (tuple(columns), tuple(columns), getter)
+                continue
+
+            if isinstance(field, relations.PrimaryKeyRelatedField):
+                column, path = f'{field.source}_id', field.source
+            else:
+                column = path = field.source.replace('.', '__')
+
+            if isinstance(field, fields.DateTimeField):
+                getter = _datetime_getter(column)
+            elif isinstance(field, PASSTHROUGH_FIELDS) or isinstance(field, relations.PrimaryKeyRelatedField):
+                getter = itemgetter(column)
+            else:
+                getter = _field_getter(field, column)
+            compiled[key] = ((column,), (path,), getter)
+        return compiled
+
+    @property
+    def keys(self):
+        """Output keys, in the serializer's order"""
+        if self._fields is None:
+            self._fields = self._compile()
+        return tuple(self._fields)
+
+    def _plan(self, keys):
+        """Return (columns, model field paths, getters) for a set of output keys"""
+        all_keys = self.keys
+        keys = all_keys if keys is None else tuple(keys)
+        plan = self._plans.get(keys)
+        if plan is None:
+            columns, paths, getters = [], [], []
+            for key in keys:
+                key_columns, key_paths, getter = self._fields[key]
+                columns.extend(key_columns)
+                paths.extend(key_paths)
+                getters.append((key, getter))
+            plan = self._plans[keys] = (
+                tuple(dict.fromkeys(columns)), tuple(dict.fromkeys(paths)), tuple(getters)
+            )
+        return plan
+
+    def values(self, queryset, keys=None, extra=()):
+        """Restrict a queryset to the columns the keys need, plus ``extra`` columns"""
+        columns = self._plan(keys)[0]
+        return queryset.values(*columns, *(column for column in extra if column not in columns))
+
+    def only(self, queryset, keys=None, extra=()):
+        """Defer the model fields the keys do not need, keeping model instances"""
+        paths = self._plan(keys)[1]
+        return queryset.only(*paths, *(path for path in extra if path not in paths))
+
+    def map(self, rows, keys=None):
+        """Return the serialized representation of each row"""
+        getters = self._plan(keys)[2]
+        return [{key: get(row) for key, get in getters} for row in rows]
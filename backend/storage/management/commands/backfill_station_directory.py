@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from storage import sharding
+
+
+class Command(BaseCommand):
+    help = 'Registra no diretório as estações criadas sem particionamento (rode antes de ativar DJANGO_SHARDS)'
+
+    def handle(self, *args, **options):
+        added = sharding.backfill_directory()
+        self.stdout.write(self.style.SUCCESS(f'{added} estações registradas no diretório.'))
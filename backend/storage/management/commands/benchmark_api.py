@@ -0,0 +1,158 @@
+import logging
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, setup_test_environment, teardown_test_environment
+from django.utils import timezone
+from storage import benchmark
+from storage.models import Station
+
+
+class Command(BaseCommand):
+    help = 'Executa o benchmark de carga da API de armazenamento em um banco de dados temporário'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--stations', type=int, default=100, help='Estações criadas no banco temporário')
+        parser.add_argument('--history', type=int, default=10000, help='Eventos de histórico criados')
+        parser.add_argument('--clients', type=int, default=8, help='Clientes concorrentes')
+        parser.add_argument('--requests', type=int, default=500, help='Requisições por cenário')
+        parser.add_argument('--seed', type=int, default=42, help='Semente dos dados e das requisições')
+        parser.add_argument('--output', help='Salva o resultado em JSON neste arquivo')
+        parser.add_argument('--baseline', help='Compara o resultado com um JSON salvo anteriormente')
+        parser.add_argument(
+            '--tolerance',
+            type=float,
+            default=0.2,
+            help='Aumento relativo de p95 tolerado em relação ao baseline (padrão: 0.2)',
+        )
+
+    def handle(self, *args, **options):
+        baseline = benchmark.load_report(options['baseline']) if options['baseline'] else None
+
+        # Never touch real data: run against a freshly migrated test database
+        setup_test_environment()
+        # Expected 4xx responses would otherwise be logged for every request
+        request_logger = logging.getLogger('django.request')
+        log_level = request_logger.level
+        request_logger.setLevel(logging.ERROR)
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            call_command(
+                'setup_initial_data',
+                stations=options['stations'],
+                history=options['history'],
+                seed=options['seed'],
+                stdout=self.stdout,
+            )
+            report = self._run(options)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            request_logger.setLevel(log_level)
+            teardown_test_environment()
+
+        self._print(report)
+        if options['output']:
+            benchmark.save_report(options['output'], report)
+            self.stdout.write(f"Resultado salvo em {options['output']}")
+
+        if baseline is not None:
+            regressions = benchmark.compare(baseline, report, options['tolerance'])
+            if regressions:
+                raise CommandError('Regressões em relação ao baseline:\n' + '\n'.join(regressions))
+            self.stdout.write(self.style.SUCCESS('Nenhuma regressão em relação ao baseline.'))
+
+    def _run(self, options):
+        station_ids = list(Station.objects.order_by('id').values_list('id', flat=True))
+        count = options['requests']
+
+        def station(index):
+            return station_ids[index % len(station_ids)]
+
+        scenarios = {
+            'station-list': lambda client, i: client.get('/api/stations/'),
+            'station-detail': lambda client, i: client.get(f'/api/stations/{station(i)}/'),
+            'station-update': lambda client, i: client.patch(
+                f'/api/stations/{station(i)}/',
+                {'volume_percentage': (i * 7) % 100},
+                content_type='application/json',
+            ),
+            'station-confirm-collection': lambda client, i: client.post(
+                f'/api/stations/{station(i)}/confirm_collection/'
+            ),
+            'stationhistory-list': lambda client, i: client.get(
+                f'/api/history/?station_id={station(i)}'
+            ),
+        }
+
+        results = {}
+        for name, request in scenarios.items():
+            requests = count
+            if name == 'station-confirm-collection':
+                # Every station has a pending collection at the start of the
+                # scenario and is confirmed once
+                Station.objects.update(
+                    collection_requested=True, collection_requested_at=timezone.now(), volume_percentage=90
+                )
+                requests = min(count, len(station_ids))
+            results[name] = self._scenario(request, requests, options['clients'])
+
+        return {
+            'meta': {
+                'created_at': timezone.now().isoformat(),
+                'db_profile': getattr(settings, 'DB_PROFILE', connection.vendor),
+                'stations': options['stations'],
+                'history': options['history'],
+                'clients': options['clients'],
+                'requests': count,
+            },
+            'scenarios': results,
+        }
+
+    def _scenario(self, request, count, clients):
+        """Issue ``count`` requests from ``clients`` threads and summarize them"""
+        local = threading.local()
+        lock = threading.Lock()
+        latencies = []
+        queries = []
+        statuses = Counter()
+
+        def issue(index):
+            if not hasattr(local, 'client'):
+                local.client = Client()
+            with CaptureQueriesContext(connection) as captured:
+                with benchmark.Timer() as timer:
+                    response = request(local.client, index)
+            with lock:
+                latencies.append(timer.elapsed)
+                queries.append(len(captured))
+                statuses[response.status_code] += 1
+
+        # The barrier makes every worker thread run exactly one close
+        barrier = threading.Barrier(clients)
+
+        def close_connection(_):
+            barrier.wait()
+            connection.close()
+
+        with ThreadPoolExecutor(max_workers=clients) as executor:
+            with benchmark.Timer() as total:
+                list(executor.map(issue, range(count)))
+            list(executor.map(close_connection, range(clients)))
+
+        return benchmark.summarize(latencies, queries, total.elapsed, statuses)
+
+    def _print(self, report):
+        self.stdout.write(
+            f"{'cenário':<28} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'req/s':>9} {'queries':>8}"
+        )
+        for name, result in report['scenarios'].items():
+            self.stdout.write(
+                f"{name:<28} {result['p50_ms']:>9} {result['p95_ms']:>9} {result['p99_ms']:>9} "
+                f"{result['throughput_rps']:>9} {result['queries_per_request']:>8}"
+            )
@@ -0,0 +1,121 @@
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connection, transaction
+from storage import services
+from storage.models import Station
+
+
+class Command(BaseCommand):
+    help = 'Mede a vazão de escrita (atualizações de volume) no perfil de banco de dados atual'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--writers', type=int, default=8, help='Threads escrevendo em paralelo')
+        parser.add_argument('--updates', type=int, default=200, help='Atualizações por thread')
+        parser.add_argument('--stations', type=int, default=4, help='Estações disputadas pelas threads')
+        parser.add_argument(
+            '--compare',
+            nargs='+',
+            metavar='PROFILE',
+            help='Executa o benchmark em cada perfil (ex.: sqlite edge postgres) e compara',
+        )
+        parser.add_argument('--json', action='store_true', help='Imprime apenas o resultado em JSON')
+
+    def handle(self, *args, **options):
+        if options['compare']:
+            self._compare(options)
+            return
+
+        # Scratch database, like benchmark_api: the configured one is never written
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            result = self._run(options['writers'], options['updates'], options['stations'])
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+        if options['json']:
+            self.stdout.write(json.dumps(result))
+        else:
+            self._report([result])
+
+    def _run(self, writers, updates, station_count):
+        """Hammer a set of scratch stations with volume updates and time it"""
+        stations = [
+            Station.objects.create(name=f'benchmark-{index}', volume_percentage=0)
+            for index in range(station_count)
+        ]
+        errors = []
+        lock = threading.Lock()
+
+        def write(worker):
+            try:
+                for iteration in range(updates):
+                    station = stations[(worker + iteration) % station_count]
+                    try:
+                        with transaction.atomic():
+                            locked = services.lock_station(station.pk)
+                            old_percentage = locked.volume_percentage
+                            locked.volume_percentage = (iteration * 7) % 80
+                            locked.save(update_fields=['volume_percentage', 'updated_at'])
+                            services.record_volume_update(locked, old_percentage)
+                    except OperationalError as exc:
+                        with lock:
+                            errors.append(str(exc))
+            finally:
+                connection.close()
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=writers) as executor:
+            list(executor.map(write, range(writers)))
+        elapsed = time.perf_counter() - started
+
+        attempted = writers * updates
+        return {
+            'profile': settings.DB_PROFILE,
+            'vendor': connection.vendor,
+            'writers': writers,
+            'updates': attempted,
+            'errors': len(errors),
+            'seconds': round(elapsed, 3),
+            'updates_per_second': round((attempted - len(errors)) / elapsed, 1),
+        }
+
+    def _compare(self, options):
+        """Run the benchmark in a subprocess per profile, each on its own scratch database"""
+        results = []
+        manage = Path(settings.BASE_DIR) / 'manage.py'
+
+        for profile in options['compare']:
+            completed = subprocess.run(
+                [
+                    sys.executable, str(manage), 'benchmark_db_writes', '--json',
+                    '--writers', str(options['writers']),
+                    '--updates', str(options['updates']),
+                    '--stations', str(options['stations']),
+                ],
+                env=dict(os.environ, DJANGO_DB_PROFILE=profile), check=True, capture_output=True, text=True
+            )
+            results.append(json.loads(completed.stdout.strip().splitlines()[-1]))
+
+        if options['json']:
+            self.stdout.write(json.dumps(results))
+        else:
+            self._report(results)
+
+    def _report(self, results):
+        if not results:
+            raise CommandError('Nenhum resultado.')
+
+        self.stdout.write(f"{'perfil':<10} {'atualizações':>12} {'erros':>6} {'segundos':>9} {'att/s':>9}")
+        for result in results:
+            self.stdout.write(
+                f"{result['profile']:<10} {result['updates']:>12} {result['errors']:>6} "
+                f"{result['seconds']:>9} {result['updates_per_second']:>9}"
+            )
@@ -0,0 +1,80 @@
+import json
+import time
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from rest_framework.renderers import JSONRenderer
+from storage.models import Station, StationHistory
+from storage.renderers import FastJSONRenderer, orjson
+from storage.serializers import StationHistorySerializer, StationSerializer
+from storage.views import history_values, station_values
+
+
+class Command(BaseCommand):
+    help = 'Compara a serialização das listagens (serializer + JSON) com o caminho enxuto (.values() + orjson)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--rows', type=int, nargs='+', default=[10000, 100000], help='Tamanhos de listagem a medir'
+        )
+        parser.add_argument('--seed', type=int, default=42, help='Semente dos dados')
+
+    def handle(self, *args, **options):
+        sizes = sorted(options['rows'])
+        if not sizes or sizes[0] < 1:
+            raise CommandError('Informe tamanhos de listagem positivos.')
+        if orjson is None:
+            self.stdout.write(self.style.WARNING('orjson não está instalado; o renderizador usa o json padrão.'))
+
+        # Never touch real data: run against a freshly migrated test database
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            call_command(
+                'setup_initial_data',
+                stations=sizes[-1],
+                history=sizes[-1],
+                seed=options['seed'],
+                stdout=self.stdout,
+            )
+            results = self._run(sizes)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        self.stdout.write(f"{'listagem':<10} {'linhas':>8} {'antes linhas/s':>15} {'depois linhas/s':>16} {'ganho':>7}")
+        for name, size, before, after in results:
+            self.stdout.write(
+                f'{name:<10} {size:>8} {size / before:>15.0f} {size / after:>16.0f} {before / after:>6.1f}x'
+            )
+
+    def _run(self, sizes):
+        results = []
+        for size in sizes:
+            stations = Station.objects.order_by('id')[:size]
+            history = StationHistory.objects.select_related('station').order_by('-timestamp', '-id')[:size]
+
+            for name, queryset, serializer_class, mapper in (
+                ('stations', stations, StationSerializer, station_values),
+                ('history', history, StationHistorySerializer, history_values),
+            ):
+                before, expected = self._time(
+                    lambda: JSONRenderer().render(serializer_class(queryset.all(), many=True).data)
+                )
+                after, body = self._time(
+                    lambda: FastJSONRenderer().render(mapper.map(mapper.values(queryset.all())))
+                )
+                # orjson may spell floats differently (1e-7 for 1e-07); compare values
+                if json.loads(body) != json.loads(expected):
+                    raise CommandError(f'A listagem {name} enxuta difere da serializada.')
+                results.append((name, size, before, after))
+        return results
+
+    def _time(self, function):
+        """Best of three runs, including the query"""
+        best = None
+        for _ in range(3):
+            started = time.perf_counter()
+            result = function()
+            elapsed = time.perf_counter() - started
+            best = elapsed if best is None else min(best, elapsed)
+        return best, result
@@ -0,0 +1,72 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.core.validators import MaxValueValidator, MinValueValidator
+from django.db import connection, transaction
+from rest_framework import serializers
+from storage.models import Station
+from storage.serializers import StationSerializer
+from storage.validators import validate_volume_percentage
+
+
+class LegacyStationSerializer(StationSerializer):
+    """The update path before validation was consolidated, for comparison"""
+
+    def validate_volume_percentage(self, value):
+        if value < 0 or value > 100:
+            raise serializers.ValidationError("Volume percentage must be between 0 and 100")
+        return value
+
+    def update(self, instance, validated_data):
+        # ModelSerializer.update: full save(), which runs full_clean() again
+        return serializers.ModelSerializer.update(self, instance, validated_data)
+
+    class Meta(StationSerializer.Meta):
+        extra_kwargs = {
+            'volume_percentage': {
+                'validators': [MinValueValidator(0), MaxValueValidator(100), validate_volume_percentage],
+            },
+        }
+
+
+class Command(BaseCommand):
+    help = 'Compara o custo de CPU por atualização de volume antes e depois da validação única'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--updates', type=int, default=2000, help='Atualizações por caminho')
+
+    def handle(self, *args, **options):
+        updates = options['updates']
+
+        # Runs on a throwaway test database; every write is rolled back anyway
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            results = {
+                'antes': self._measure(LegacyStationSerializer, updates),
+                'depois': self._measure(StationSerializer, updates),
+            }
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        self.stdout.write(f"{'caminho':<8} {'CPU µs/att':>11} {'total µs/att':>13}")
+        for name, (cpu, wall) in results.items():
+            self.stdout.write(f'{name:<8} {cpu:>11.1f} {wall:>13.1f}')
+        speedup = results['antes'][0] / results['depois'][0]
+        self.stdout.write(self.style.SUCCESS(f'CPU por atualização: {speedup:.2f}x mais rápido'))
+
+    def _measure(self, serializer_class, updates):
+        """Return (CPU, wall) microseconds per validated update"""
+        with transaction.atomic():
+            station = Station.objects.create(name='benchmark', volume_percentage=0)
+            cpu_started = time.process_time()
+            wall_started = time.perf_counter()
+            for index in range(updates):
+                serializer = serializer_class(
+                    station, data={'volume_percentage': index % 80}, partial=True
+                )
+                serializer.is_valid(raise_exception=True)
+                station = serializer.save()
+            cpu = time.process_time() - cpu_started
+            wall = time.perf_counter() - wall_started
+            transaction.set_rollback(True)
+        return cpu / updates * 1e6, wall / updates * 1e6
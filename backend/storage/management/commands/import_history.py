@@ -0,0 +1,288 @@
+import csv
+import gzip
+import hashlib
+import json
+import time
+from itertools import islice
+from pathlib import Path
+
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import F, OuterRef, Subquery
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from storage import cache as station_cache
+from storage import services
+from storage import sharding
+from storage.fields import OPERATION_TYPES
+from storage.models import COLLECTION_THRESHOLD, HistoryImport, Station, StationHistory
+from storage.validators import validate_volume_percentage
+
+FORMATS = {'.csv': 'csv', '.ndjson': 'ndjson', '.jsonl': 'ndjson'}
+# Keeps IN (...) lists below the database's parameter limits
+LOOKUP_BATCH_SIZE = 500
+MAX_REPORTED_ERRORS = 20
+
+
+class Command(BaseCommand):
+    help = 'Importa leituras históricas de estações a partir de arquivos CSV/NDJSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument('paths', nargs='+', help='Arquivos .csv, .ndjson ou .jsonl (opcionalmente .gz)')
+        parser.add_argument('--format', choices=['csv', 'ndjson'], help='Formato, quando a extensão não indica')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Linhas por INSERT')
+        parser.add_argument('--transaction-size', type=int, default=20000, help='Linhas por transação')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1 or options['transaction_size'] < 1:
+            raise CommandError('Os tamanhos de lote e de transação devem ser positivos.')
+
+        for path in options['paths']:
+            self._import(Path(path), options)
+
+    def _import(self, path, options):
+        """
+        Import one file, resuming after its last committed chunk.
+
+        The file is read as a stream: rows are parsed and validated one
+        chunk (``--transaction-size`` rows) at a time and inserted with
+        ``bulk_create``, skipping Station.save()/full_clean(). Each chunk
+        commits together with the file's checkpoint.
+        """
+        if not path.is_file():
+            raise CommandError(f'Arquivo não encontrado: {path}')
+        file_format = options['format'] or self._detect_format(path)
+
+        checkpoint, _ = HistoryImport.objects.get_or_create(
+            source_hash=self._hash(path), defaults={'path': str(path)}
+        )
+        if checkpoint.completed_at is not None:
+            self.stdout.write(self.style.WARNING(
+                f'{path} já foi importado em {checkpoint.completed_at:%Y-%m-%d %H:%M}; nada a fazer.'
+            ))
+            return
+
+        skipped = checkpoint.rows_processed
+        if skipped:
+            self.stdout.write(f'Retomando {path} após a linha {skipped}.')
+
+        # Per-file state: station ids by name and each station's last imported volume
+        self._stations = {}
+        self._last_volume = {}
+        self._reported = checkpoint.rows_invalid
+
+        started = time.perf_counter()
+        processed = 0
+        with self._open(path) as handle:
+            rows = islice(self._read(handle, file_format), skipped, None)
+            while chunk := list(islice(rows, options['transaction_size'])):
+                first_line = skipped + processed + 1
+                with transaction.atomic():
+                    # The lock keeps a concurrent run of the same file from
+                    # committing the same chunk twice
+                    locked = HistoryImport.objects.select_for_update().get(pk=checkpoint.pk)
+                    if locked.rows_processed != skipped + processed:
+                        raise CommandError(f'{path} está sendo importado por outro processo.')
+                    imported, invalid, created = self._import_chunk(chunk, first_line, options['batch_size'])
+                    HistoryImport.objects.filter(pk=checkpoint.pk).update(
+                        rows_processed=F('rows_processed') + len(chunk),
+                        rows_imported=F('rows_imported') + imported,
+                        rows_invalid=F('rows_invalid') + invalid,
+                        stations_created=F('stations_created') + created,
+                        updated_at=timezone.now(),
+                    )
+                processed += len(chunk)
+                elapsed = time.perf_counter() - started
+                self.stdout.write(
+                    f'{skipped + processed} linhas processadas ({processed / elapsed:.0f} linhas/s)'
+                )
+
+        HistoryImport.objects.filter(pk=checkpoint.pk).update(completed_at=timezone.now())
+        checkpoint.refresh_from_db()
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'{path}: {checkpoint.rows_imported} leituras importadas, {checkpoint.rows_invalid} inválidas, '
+            f'{checkpoint.stations_created} estações criadas ({processed / elapsed if elapsed else 0:.0f} linhas/s).'
+        ))
+
+    def _detect_format(self, path):
+        suffixes = path.suffixes
+        if suffixes and suffixes[-1] == '.gz':
+            suffixes = suffixes[:-1]
+        if not suffixes or suffixes[-1] not in FORMATS:
+            raise CommandError(f'Formato de {path} desconhecido; use --format.')
+        return FORMATS[suffixes[-1]]
+
+    def _hash(self, path):
+        digest = hashlib.sha256()
+        with path.open('rb') as handle:
+            while block := handle.read(1 << 20):
+                digest.update(block)
+        return digest.hexdigest()
+
+    def _open(self, path):
+        if path.suffix == '.gz':
+            return gzip.open(path, 'rt', encoding='utf-8', newline='')
+        return path.open(encoding='utf-8', newline='')
+
+    def _read(self, handle, file_format):
+        """Yield raw rows: dicts for CSV, unparsed lines for NDJSON"""
+        if file_format == 'csv':
+            yield from csv.DictReader(handle)
+            return
+        for line in handle:
+            if line.strip():
+                yield line
+
+    def _import_chunk(self, rows, first_line, batch_size):
+        """
+        Validate and insert one chunk of rows.
+
+        Returns:
+            tuple: (rows imported, rows invalid, stations created)
+        """
+        parsed = []
+        invalid = 0
+        for line, raw in enumerate(rows, first_line):
+            try:
+                parsed.append(self._parse(raw))
+            except ValueError as error:
+                invalid += 1
+                self._reported += 1
+                if self._reported <= MAX_REPORTED_ERRORS:
+                    self.stderr.write(f'Linha {line}: {error}')
+
+        created = self._resolve_stations({row['station_name'] for row in parsed}, batch_size)
+        self._load_last_volumes({self._stations[row['station_name']] for row in parsed})
+
+        history = []
+        for row in parsed:
+            station_id = self._stations[row['station_name']]
+            previous = row['previous_volume_percentage']
+            if previous is None and row['operation_type'] in ('update', 'collection_complete'):
+                previous = self._last_volume.get(station_id)
+            history.append(StationHistory(
+                station_id=station_id,
+                operation_type=row['operation_type'],
+                volume_percentage=row['volume_percentage'],
+                previous_volume_percentage=previous,
+                timestamp=row['timestamp'],
+                notes=row['notes'],
+            ))
+            self._last_volume[station_id] = row['volume_percentage']
+        StationHistory.objects.bulk_create(history, batch_size=batch_size)
+
+        self._sync_volumes({event.station_id for event in history})
+        return len(history), invalid, created
+
+    def _parse(self, raw):
+        """Validate a raw row, raising ValueError with the reason if it is invalid"""
+        if isinstance(raw, str):
+            try:
+                raw = json.loads(raw)
+            except ValueError:
+                raise ValueError('JSON inválido.')
+            if not isinstance(raw, dict):
+                raise ValueError('A linha deve ser um objeto JSON.')
+
+        name = str(raw.get('station_name') or '').strip()
+        if not name or len(name) > Station._meta.get_field('name').max_length:
+            raise ValueError('Nome da estação ausente ou longo demais.')
+
+        try:
+            timestamp = parse_datetime(str(raw.get('timestamp') or ''))
+        except ValueError:
+            timestamp = None
+        if timestamp is None:
+            raise ValueError('Data/hora inválida. Use o formato ISO 8601.')
+        if timezone.is_naive(timestamp):
+            timestamp = timezone.make_aware(timestamp)
+
+        operation_type = raw.get('operation_type') or 'update'
+        if operation_type not in OPERATION_TYPES:
+            raise ValueError('Tipo de operação inválido.')
+
+        volume = self._volume(raw.get('volume_percentage'))
+        previous = raw.get('previous_volume_percentage')
+        previous = None if previous in (None, '') else self._volume(previous)
+
+        # Exports carry the derived description; only explicit notes are stored
+        notes = raw.get('notes') or None
+        if notes == StationHistory.describe_values(operation_type, volume, previous):
+            notes = None
+
+        return {
+            'station_name': name,
+            'timestamp': timestamp,
+            'operation_type': operation_type,
+            'volume_percentage': volume,
+            'previous_volume_percentage': previous,
+            'notes': notes,
+        }
+
+    def _volume(self, value):
+        try:
+            value = float(value)
+            validate_volume_percentage(value)
+        except (TypeError, ValueError):
+            raise ValueError('Volume inválido.')
+        except ValidationError as error:
+            raise ValueError(' '.join(error.messages))
+        return value
+
+    def _resolve_stations(self, names, batch_size):
+        """Map station names to ids, bulk creating unknown stations; returns the number created"""
+        missing = sorted(names - self._stations.keys())
+        for start in range(0, len(missing), LOOKUP_BATCH_SIZE):
+            # Names are not unique; the oldest station with a name wins
+            existing = Station.objects.filter(name__in=missing[start:start + LOOKUP_BATCH_SIZE]).order_by('-id')
+            self._stations.update(existing.values_list('name', 'id'))
+
+        stations = [Station(name=name, volume_percentage=0) for name in missing if name not in self._stations]
+        sharding.assign_ids(stations)
+        Station.objects.bulk_create(stations, batch_size=batch_size)
+        self._stations.update((station.name, station.pk) for station in stations)
+        return len(stations)
+
+    def _load_last_volumes(self, station_ids):
+        """
+        Seed the last volume of stations not seen yet in this run.
+
+        Taken from the station's latest stored event, so that a resumed
+        import links its first rows to the chunks committed before.
+        """
+        latest = StationHistory.objects.filter(station=OuterRef('pk')).order_by('-timestamp', '-id')
+        unseen = sorted(station_ids - self._last_volume.keys())
+        for start in range(0, len(unseen), LOOKUP_BATCH_SIZE):
+            stations = Station.objects.filter(pk__in=unseen[start:start + LOOKUP_BATCH_SIZE]).annotate(
+                last_volume=Subquery(latest.values('volume_percentage')[:1])
+            )
+            self._last_volume.update(stations.values_list('pk', 'last_volume'))
+
+    def _sync_volumes(self, station_ids):
+        """
+        Set each station's volume to its latest history event.
+
+        Stations left at or above the collection threshold are flagged for
+        collection like a sensor update would.
+        """
+        latest = StationHistory.objects.filter(station=OuterRef('pk')).order_by('-timestamp', '-id')
+        station_ids = sorted(station_ids)
+        for start in range(0, len(station_ids), LOOKUP_BATCH_SIZE):
+            Station.objects.filter(pk__in=station_ids[start:start + LOOKUP_BATCH_SIZE]).update(
+                volume_percentage=Subquery(latest.values('volume_percentage')[:1]),
+                updated_at=timezone.now(),
+            )
+        # update() bypasses Station.save
+        station_cache.invalidate_stations(station_ids)
+        station_cache.invalidate_history(station_ids)
+
+        for start in range(0, len(station_ids), LOOKUP_BATCH_SIZE):
+            full = Station.objects.filter(
+                pk__in=station_ids[start:start + LOOKUP_BATCH_SIZE],
+                collection_requested=False,
+                volume_percentage__gte=COLLECTION_THRESHOLD,
+            )
+            for station in full.select_for_update():
+                services.request_collection(station)
@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from storage import idempotency
+
+
+class Command(BaseCommand):
+    help = 'Remove as chaves de idempotência expiradas (STORAGE_IDEMPOTENCY ttl)'
+
+    def handle(self, *args, **options):
+        deleted = idempotency.purge()
+        self.stdout.write(self.style.SUCCESS(f'{deleted} chaves de idempotência removidas.'))
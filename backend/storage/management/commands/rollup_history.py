@@ -0,0 +1,155 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Count, F, Max, Min, Q, Sum
+from django.db.models.functions import Trunc
+from django.utils import timezone
+from storage import cache as station_cache
+from storage import sharding
+from storage.models import StationHistory, StationHistoryRollup
+
+
+class Command(BaseCommand):
+    help = 'Agrega o histórico antigo em resumos por hora/dia e remove os eventos brutos'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--retention-days',
+            type=int,
+            default=getattr(settings, 'STORAGE_HISTORY_RETENTION_DAYS', 90),
+            help='Dias de eventos brutos mantidos; os mais antigos viram resumos por hora',
+        )
+        parser.add_argument(
+            '--hourly-retention-days',
+            type=int,
+            default=getattr(settings, 'STORAGE_HISTORY_ROLLUP_RETENTION_DAYS', 365),
+            help='Dias de resumos por hora mantidos; os mais antigos viram resumos diários',
+        )
+
+    def handle(self, *args, **options):
+        retention_days = options['retention_days']
+        hourly_retention_days = options['hourly_retention_days']
+        if retention_days < 0 or hourly_retention_days < retention_days:
+            raise CommandError('Os períodos de retenção devem ser crescentes e não negativos.')
+
+        now = timezone.now()
+
+        # Only complete buckets are rolled up, so the cutoffs are bucket-aligned
+        raw_cutoff = self._bucket_start(now - timedelta(days=retention_days), 'hour')
+        hourly_cutoff = self._bucket_start(now - timedelta(days=hourly_retention_days), 'day')
+        for alias in sharding.aliases():
+            prefix = f'[{alias}] ' if sharding.enabled() else ''
+            with sharding.using(alias):
+                with transaction.atomic(using=alias):
+                    events, buckets = self._rollup_events(raw_cutoff)
+                self.stdout.write(f'{prefix}{events} eventos agregados em {buckets} resumos por hora.')
+
+                with transaction.atomic(using=alias):
+                    hourly, buckets = self._rollup_hourly(hourly_cutoff)
+                self.stdout.write(f'{prefix}{hourly} resumos por hora agregados em {buckets} resumos diários.')
+
+        self.stdout.write(self.style.SUCCESS('Histórico compactado com sucesso!'))
+
+    def _bucket_start(self, moment, period):
+        """Truncate a datetime to the start of its bucket in the current timezone"""
+        moment = timezone.localtime(moment)
+        if period == 'day':
+            return moment.replace(hour=0, minute=0, second=0, microsecond=0)
+        return moment.replace(minute=0, second=0, microsecond=0)
+
+    def _rollup_events(self, cutoff):
+        """Aggregate raw events older than cutoff into hourly rollups and prune them"""
+        events = StationHistory.objects.filter(timestamp__lt=cutoff)
+        rows = list(
+            events
+            .annotate(bucket=Trunc('timestamp', 'hour'))
+            .values('station_id', 'bucket')
+            .annotate(
+                bucket_samples=Count('id'),
+                bucket_collections=Count('id', filter=Q(operation_type='collection_complete')),
+                bucket_min=Min('volume_percentage'),
+                bucket_max=Max('volume_percentage'),
+                bucket_sum=Sum('volume_percentage'),
+            )
+        )
+        buckets = self._merge(StationHistoryRollup.Period.HOUR, rows)
+        deleted, _ = events.delete()
+        station_cache.invalidate_history(row['station_id'] for row in rows)
+        return deleted, buckets
+
+    def _rollup_hourly(self, cutoff):
+        """Aggregate hourly rollups older than cutoff into daily rollups and prune them"""
+        hourly = StationHistoryRollup.objects.filter(
+            period=StationHistoryRollup.Period.HOUR, period_start__lt=cutoff
+        )
+        rows = (
+            hourly
+            .annotate(bucket=Trunc('period_start', 'day'))
+            .values('station_id', 'bucket')
+            .annotate(
+                bucket_samples=Sum('samples'),
+                bucket_collections=Sum('collections'),
+                bucket_min=Min('min_volume'),
+                bucket_max=Max('max_volume'),
+                bucket_sum=Sum(F('avg_volume') * F('samples')),
+            )
+        )
+        buckets = self._merge(StationHistoryRollup.Period.DAY, rows)
+        deleted, _ = hourly.delete()
+        return deleted, buckets
+
+    def _merge(self, period, rows):
+        """
+        Write aggregated rows as rollups of the given period.
+
+        Buckets that already exist (e.g. late-imported events for an hour that
+        was rolled up before) are merged instead of overwritten.
+        """
+        rows = list(rows)
+        if not rows:
+            return 0
+
+        existing = {
+            (rollup.station_id, rollup.period_start): rollup
+            for rollup in StationHistoryRollup.objects.filter(
+                period=period,
+                station_id__in={row['station_id'] for row in rows},
+                period_start__gte=min(row['bucket'] for row in rows),
+                period_start__lte=max(row['bucket'] for row in rows),
+            )
+        }
+        created = []
+        updated = []
+
+        for row in rows:
+            rollup = existing.get((row['station_id'], row['bucket']))
+            if rollup is None:
+                created.append(StationHistoryRollup(
+                    station_id=row['station_id'],
+                    period=period,
+                    period_start=row['bucket'],
+                    samples=row['bucket_samples'],
+                    collections=row['bucket_collections'],
+                    min_volume=row['bucket_min'],
+                    max_volume=row['bucket_max'],
+                    avg_volume=row['bucket_sum'] / row['bucket_samples'],
+                ))
+                continue
+
+            samples = rollup.samples + row['bucket_samples']
+            rollup.avg_volume = (rollup.avg_volume * rollup.samples + row['bucket_sum']) / samples
+            rollup.samples = samples
+            rollup.collections += row['bucket_collections']
+            rollup.min_volume = min(rollup.min_volume, row['bucket_min'])
+            rollup.max_volume = max(rollup.max_volume, row['bucket_max'])
+            updated.append(rollup)
+
+        StationHistoryRollup.objects.bulk_create(created, batch_size=500)
+        StationHistoryRollup.objects.bulk_update(
+            updated,
+            ['samples', 'collections', 'min_volume', 'max_volume', 'avg_volume'],
+            batch_size=500
+        )
+        return len(created) + len(updated)
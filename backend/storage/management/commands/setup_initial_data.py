@@ -1,22 +1,97 @@
-from django.core.management.base import BaseCommand
-from storage.models import Station
+import random
+from datetime import timedelta
+from string import ascii_uppercase
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from storage import sharding
+from storage.models import COLLECTION_THRESHOLD, Station, StationHistory
+
+BATCH_SIZE = 1000
+
 
 class Command(BaseCommand):
     help = 'Cria as estações iniciais de armazenamento'
 
-    def handle(self, *args, **kwargs):
+    def add_arguments(self, parser):
+        parser.add_argument('--stations', type=int, default=3, help='Número de estações a criar')
+        parser.add_argument(
+            '--history',
+            type=int,
+            default=0,
+            help='Número de eventos de histórico sintéticos, distribuídos nos últimos 30 dias',
+        )
+        parser.add_argument('--seed', type=int, default=None, help='Semente para dados reproduzíveis')
+
+    def handle(self, *args, **options):
+        if options['stations'] < 1 or options['history'] < 0:
+            raise CommandError('Informe ao menos uma estação e um histórico não negativo.')
+
         # Verificar se já existem estações
         if Station.objects.exists():
             self.stdout.write(self.style.WARNING('Estações já existem no banco de dados.'))
             return
-        
-        # Criar as três estações iniciais
+
+        rng = random.Random(options['seed'])
+
+        # Criar as estações iniciais (A, B, C, ... e depois numeradas)
         stations = [
-            Station(name='Estação A', volume_percentage=0),
-            Station(name='Estação B', volume_percentage=0),
-            Station(name='Estação C', volume_percentage=0),
+            Station(name=f'Estação {self._label(index)}', volume_percentage=0)
+            for index in range(options['stations'])
         ]
-        
-        Station.objects.bulk_create(stations)
-        
+        sharding.assign_ids(stations)
+        stations = Station.objects.bulk_create(stations, batch_size=BATCH_SIZE)
+
+        if options['history']:
+            self._create_history(stations, options['history'], rng)
+
         self.stdout.write(self.style.SUCCESS('Estações iniciais criadas com sucesso!'))
+
+    def _label(self, index):
+        return ascii_uppercase[index] if index < len(ascii_uppercase) else str(index + 1)
+
+    def _create_history(self, stations, count, rng):
+        """
+        Bulk insert synthetic volume updates spread over the last 30 days.
+
+        Events are generated oldest first so each one carries the station's
+        previous volume, starting from empty. Each station then takes the
+        volume of its last event, and is flagged for collection when that
+        volume is at or above the threshold.
+        """
+        now = timezone.now()
+        span = timedelta(days=30).total_seconds()
+        ages = sorted((rng.uniform(0, span) for _ in range(count)), reverse=True)
+        previous = {station.pk: 0.0 for station in stations}
+        latest = {}
+        batch = []
+
+        for age in ages:
+            station = rng.choice(stations)
+            volume = round(rng.uniform(0, 100), 1)
+            batch.append(StationHistory(
+                station=station,
+                operation_type='update',
+                volume_percentage=volume,
+                previous_volume_percentage=previous[station.pk],
+                timestamp=now - timedelta(seconds=age),
+            ))
+            previous[station.pk] = volume
+            latest[station.pk] = batch[-1].timestamp
+            if len(batch) == BATCH_SIZE:
+                StationHistory.objects.bulk_create(batch)
+                batch = []
+        StationHistory.objects.bulk_create(batch)
+
+        seeded = [station for station in stations if station.pk in latest]
+        for station in seeded:
+            station.volume_percentage = previous[station.pk]
+            station.collection_requested = station.volume_percentage >= COLLECTION_THRESHOLD
+            station.collection_requested_at = latest[station.pk] if station.collection_requested else None
+        Station.objects.bulk_update(
+            seeded,
+            ['volume_percentage', 'collection_requested', 'collection_requested_at'],
+            batch_size=BATCH_SIZE
+        )
+
+        self.stdout.write(f'{count} eventos de histórico criados.')
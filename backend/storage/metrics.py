@@ -0,0 +1,136 @@
+import bisect
+import threading
+from collections import defaultdict
+
+# Histogram bucket upper bounds, Prometheus style (an implicit +Inf follows)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+
+class Histogram:
+    """Cumulative-bucket histogram with sum and count"""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def render(self, name, labels):
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            lines.append(f'{name}_bucket{_labels(labels, le=_number(bound))} {cumulative}')
+        lines.append(f'{name}_bucket{_labels(labels, le="+Inf")} {self.count}')
+        lines.append(f'{name}_sum{_labels(labels)} {_number(self.sum)}')
+        lines.append(f'{name}_count{_labels(labels)} {self.count}')
+        return lines
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(labels, **extra):
+    items = list(labels.items()) + list(extra.items())
+    if not items:
+        return ''
+    return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in items) + '}'
+
+
+class MetricsRegistry:
+    """
+    Per-route request metrics kept in process memory.
+
+    Recorded by RequestMetricsMiddleware and rendered in the Prometheus
+    text exposition format by the /metrics endpoint. Each worker process
+    keeps its own registry.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._requests = defaultdict(int)
+            self._latency = {}
+            self._queries = {}
+            self._query_count = defaultdict(int)
+            self._query_seconds = defaultdict(float)
+            self._slow_queries = defaultdict(int)
+
+    def observe_request(self, route, method, status, duration, queries, db_time, slow_queries=0):
+        """Record one request's latency, status and database work"""
+        key = (route, method)
+        with self._lock:
+            self._requests[(route, method, str(status))] += 1
+            self._latency.setdefault(key, Histogram(LATENCY_BUCKETS)).observe(duration)
+            self._queries.setdefault(key, Histogram(QUERY_BUCKETS)).observe(queries)
+            self._query_count[route] += queries
+            self._query_seconds[route] += db_time
+            if slow_queries:
+                self._slow_queries[route] += slow_queries
+
+    def render(self, extra=()):
+        """
+        Render every metric in the Prometheus text format.
+
+        Args:
+            extra: Iterable of ``(name, type, help, value)`` tuples for
+                gauges/counters owned by other modules
+        """
+        with self._lock:
+            lines = [
+                '# HELP storage_http_requests_total Requests handled, by route, method and status.',
+                '# TYPE storage_http_requests_total counter',
+            ]
+            for (route, method, status), count in sorted(self._requests.items()):
+                lines.append(
+                    f'storage_http_requests_total{_labels(dict(route=route, method=method, status=status))} {count}'
+                )
+
+            lines += [
+                '# HELP storage_http_request_duration_seconds Request latency, by route and method.',
+                '# TYPE storage_http_request_duration_seconds histogram',
+            ]
+            for (route, method), histogram in sorted(self._latency.items()):
+                lines += histogram.render(
+                    'storage_http_request_duration_seconds', dict(route=route, method=method)
+                )
+
+            lines += [
+                '# HELP storage_http_request_db_queries Database queries per request, by route and method.',
+                '# TYPE storage_http_request_db_queries histogram',
+            ]
+            for (route, method), histogram in sorted(self._queries.items()):
+                lines += histogram.render('storage_http_request_db_queries', dict(route=route, method=method))
+
+            for name, kind, description, values in (
+                ('storage_db_queries_total', 'counter', 'Database queries executed, by route.', self._query_count),
+                ('storage_db_query_seconds_total', 'counter', 'Time spent in database queries, by route.',
+                 self._query_seconds),
+                ('storage_db_slow_queries_total', 'counter', 'Queries slower than the slow query threshold, by route.',
+                 self._slow_queries),
+            ):
+                lines += [f'# HELP {name} {description}', f'# TYPE {name} {kind}']
+                for route, value in sorted(values.items()):
+                    lines.append(f'{name}{_labels(dict(route=route))} {_number(value)}')
+
+        for name, kind, description, value in extra:
+            lines += [f'# HELP {name} {description}', f'# TYPE {name} {kind}', f'{name} {_number(value)}']
+
+        return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry()
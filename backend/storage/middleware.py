@@ -0,0 +1,114 @@
+import logging
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+
+from . import replicas
+from .metrics import registry
+
+slow_query_logger = logging.getLogger('storage.slow_queries')
+
+
+class QueryRecorder:
+    """Database execute wrapper counting and timing the queries of one request"""
+
+    def __init__(self, route_getter, slow_threshold):
+        self.route_getter = route_getter
+        self.slow_threshold = slow_threshold
+        self.count = 0
+        self.duration = 0.0
+        self.slow = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - started
+            self.count += 1
+            self.duration += elapsed
+            if self.slow_threshold is not None and elapsed >= self.slow_threshold:
+                self.slow += 1
+                slow_query_logger.warning(
+                    'Slow query (%.1f ms) on %s [%s]: %s',
+                    elapsed * 1000,
+                    self.route_getter(),
+                    context['connection'].alias,
+                    sql,
+                )
+
+
+class RequestMetricsMiddleware:
+    """
+    Record per-route latency and database work for every request.
+
+    Routes are identified by URL name (e.g. ``station-list``). Each response
+    gets a ``Server-Timing`` header with the database and total time, and
+    queries slower than ``STORAGE_SLOW_QUERY_MS`` are logged to the
+    ``storage.slow_queries`` logger. Metrics are exposed at ``/metrics``.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        threshold_ms = getattr(settings, 'STORAGE_SLOW_QUERY_MS', None)
+        recorder = QueryRecorder(
+            lambda: self._route(request),
+            threshold_ms / 1000 if threshold_ms is not None else None,
+        )
+
+        started = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(recorder))
+            response = self.get_response(request)
+        duration = time.perf_counter() - started
+
+        registry.observe_request(
+            self._route(request),
+            request.method,
+            response.status_code,
+            duration,
+            recorder.count,
+            recorder.duration,
+            recorder.slow,
+        )
+        response['Server-Timing'] = (
+            f'db;dur={recorder.duration * 1000:.1f};desc="{recorder.count} queries", '
+            f'total;dur={duration * 1000:.1f}'
+        )
+        return response
+
+    @staticmethod
+    def _route(request):
+        match = getattr(request, 'resolver_match', None)
+        if match is None:
+            return 'unmatched'
+        return match.url_name or match.route
+
+
+class ReplicaPinningMiddleware:
+    """
+    Read-your-writes on top of the read replicas.
+
+    A successful write pins its client to the primary database for
+    ``STORAGE_REPLICA_PIN_SECONDS`` with a cookie; while pinned, every read
+    of the client goes to the primary, so it never sees data older than its
+    own writes through a lagging replica. Does nothing without replicas.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not replicas.enabled():
+            return self.get_response(request)
+
+        with replicas.pinned(replicas.is_pinned(request)):
+            response = self.get_response(request)
+        if request.method not in ('GET', 'HEAD', 'OPTIONS', 'TRACE') and response.status_code < 400:
+            replicas.pin(response)
+        return response
@@ -0,0 +1,25 @@
+# Generated by Django 5.2 on 2026-10-17 14:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('storage', '0002_alter_station_volume_percentage'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='stationhistory',
+            options={'ordering': ['-timestamp', '-id']},
+        ),
+        migrations.AddIndex(
+            model_name='stationhistory',
+            index=models.Index(fields=['station', 'timestamp'], name='history_station_ts_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='stationhistory',
+            index=models.Index(fields=['timestamp', 'id'], name='history_ts_id_idx'),
+        ),
+    ]
@@ -0,0 +1,63 @@
+# Generated by Django 5.2 on 2026-10-17 14:22
+
+import django.db.models.deletion
+import storage.fields
+from django.db import migrations, models
+
+OPERATION_TYPES = {
+    'create': 1,
+    'update': 2,
+    'collection_request': 3,
+    'collection_complete': 4,
+}
+
+
+def operation_names_to_codes(apps, schema_editor):
+    StationHistory = apps.get_model('storage', 'StationHistory')
+    for name, code in OPERATION_TYPES.items():
+        StationHistory.objects.filter(operation_type=name).update(operation_type=str(code))
+
+
+def operation_codes_to_names(apps, schema_editor):
+    StationHistory = apps.get_model('storage', 'StationHistory')
+    for name, code in OPERATION_TYPES.items():
+        StationHistory.objects.filter(operation_type=str(code)).update(operation_type=name)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('storage', '0003_stationhistory_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='stationhistory',
+            name='previous_volume_percentage',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.RunPython(operation_names_to_codes, operation_codes_to_names),
+        migrations.AlterField(
+            model_name='stationhistory',
+            name='operation_type',
+            field=storage.fields.OperationTypeField(choices=[('create', 'create'), ('update', 'update'), ('collection_request', 'collection_request'), ('collection_complete', 'collection_complete')]),
+        ),
+        migrations.CreateModel(
+            name='StationHistoryRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.CharField(choices=[('hour', 'Hour'), ('day', 'Day')], max_length=4)),
+                ('period_start', models.DateTimeField()),
+                ('samples', models.PositiveIntegerField()),
+                ('collections', models.PositiveIntegerField(default=0)),
+                ('min_volume', models.FloatField()),
+                ('max_volume', models.FloatField()),
+                ('avg_volume', models.FloatField()),
+                ('station', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='history_rollups', to='storage.station')),
+            ],
+            options={
+                'ordering': ['-period_start'],
+                'constraints': [models.UniqueConstraint(fields=('station', 'period', 'period_start'), name='unique_history_rollup_bucket')],
+            },
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2 on 2026-10-17 15:02
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('storage', '0004_compact_history'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='stationhistory',
+            name='timestamp',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2 on 2026-10-17 15:48
+
+import storage.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('storage', '0005_alter_stationhistory_timestamp'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='station',
+            name='volume_percentage',
+            field=models.FloatField(default=0, validators=[storage.validators.validate_volume_percentage]),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2 on 2026-10-17 14:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('storage', '0006_alter_station_volume_percentage'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='station',
+            index=models.Index(fields=['collection_requested', 'volume_percentage'], name='station_collection_volume_idx'),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.2 on 2026-10-17 14:37
+
+from django.db import migrations, models
+
+
+def backfill_requested_at(apps, schema_editor):
+    # The last write is the best available estimate for pending requests
+    Station = apps.get_model('storage', 'Station')
+    Station.objects.filter(collection_requested=True).update(collection_requested_at=models.F('updated_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('storage', '0007_station_collection_volume_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='station',
+            name='collection_requested_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.RunPython(backfill_requested_at, migrations.RunPython.noop),
+    ]
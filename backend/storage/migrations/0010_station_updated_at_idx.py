@@ -0,0 +1,17 @@
+# Generated by Django 5.2 on 2026-10-17 14:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('storage', '0009_historyimport'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='station',
+            index=models.Index(fields=['updated_at'], name='station_updated_at_idx'),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.2 on 2026-10-17 14:55
+
+import storage.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('storage', '0010_station_updated_at_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='station',
+            name='reading_deadband',
+            field=models.FloatField(blank=True, null=True, validators=[storage.validators.validate_volume_percentage]),
+        ),
+        migrations.AddField(
+            model_name='station',
+            name='reading_interval',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 5.2 on 2026-10-17 15:00
+
+from django.core.management.color import no_style
+from django.db import migrations, models
+
+BATCH_SIZE = 1000
+
+
+def backfill_directory(apps, schema_editor):
+    # Existing stations keep their ids; the directory allocates after them
+    alias = schema_editor.connection.alias
+    if alias != 'default':
+        return
+    Station = apps.get_model('storage', 'Station')
+    StationDirectory = apps.get_model('storage', 'StationDirectory')
+    station_ids = list(Station.objects.using(alias).order_by('id').values_list('id', flat=True))
+    for start in range(0, len(station_ids), BATCH_SIZE):
+        StationDirectory.objects.using(alias).bulk_create(
+            StationDirectory(id=pk, site='default') for pk in station_ids[start:start + BATCH_SIZE]
+        )
+    # Explicit ids do not advance the id sequence (PostgreSQL)
+    for sql in schema_editor.connection.ops.sequence_reset_sql(no_style(), [StationDirectory]):
+        schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('storage', '0012_idempotencykey'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StationDirectory',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('site', models.CharField(default='default', max_length=50)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='station',
+            name='site',
+            field=models.CharField(default='default', max_length=50),
+        ),
+        migrations.RunPython(backfill_directory, migrations.RunPython.noop),
+    ]
@@ -1,37 +1,217 @@
 from django.db import models
-from django.core.validators import MinValueValidator, MaxValueValidator
+from django.utils import timezone
+from . import sharding
+from .fields import OperationTypeField
 from .validators import validate_volume_percentage
 
+# Volume (%) at which a collection request is generated automatically
+COLLECTION_THRESHOLD = 80
+
 class Station(models.Model):
     """Model representing a waste storage station"""
     name = models.CharField(max_length=100)
-    volume_percentage = models.FloatField(
-        default=0,
-        validators=[MinValueValidator(0), MaxValueValidator(100), validate_volume_percentage]
-    )
+    # Shard key: the station and its history live on the site's database
+    site = models.CharField(max_length=50, default=sharding.DEFAULT_SITE)
+    volume_percentage = models.FloatField(default=0, validators=[validate_volume_percentage])
     collection_requested = models.BooleanField(default=False)
+    # When the pending collection was requested; orders the collection queue
+    collection_requested_at = models.DateTimeField(blank=True, null=True)
+    # Sensor readings closer than this (%) to the stored volume, and less than
+    # reading_interval seconds after the last write, are not stored; None uses
+    # STORAGE_READING_DEADBAND / STORAGE_READING_INTERVAL
+    reading_deadband = models.FloatField(blank=True, null=True, validators=[validate_volume_percentage])
+    reading_interval = models.PositiveIntegerField(blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            # Backs the summary aggregates and the collection queue (pending stations by fill level)
+            models.Index(fields=['collection_requested', 'volume_percentage'], name='station_collection_volume_idx'),
+            # Backs the delta sync: stations changed since a watermark
+            models.Index(fields=['updated_at'], name='station_updated_at_idx'),
+        ]
+
     def __str__(self):
         return f"{self.name} - {self.volume_percentage}%"
 
-    def save(self, *args, **kwargs):
-        """Override save to ensure validation runs"""
-        self.full_clean()
+    def save(self, *args, validate=True, **kwargs):
+        """
+        Override save to ensure validation runs.
+
+        Keeps ``collection_requested_at`` in step with the flag and, with
+        sharding enabled, takes new stations' ids from the station
+        directory. Admin and
+        shell writes are always validated. A save scoped with
+        ``update_fields`` only validates those fields; callers that already
+        validated the data (e.g. StationSerializer) pass ``validate=False``.
+        """
+        update_fields = kwargs.get('update_fields')
+        if self.collection_requested != (self.collection_requested_at is not None):
+            self.collection_requested_at = timezone.now() if self.collection_requested else None
+            if update_fields is not None:
+                kwargs['update_fields'] = update_fields = [*update_fields, 'collection_requested_at']
+        if validate:
+            if update_fields is None:
+                self.full_clean()
+            else:
+                self.clean_fields(
+                    exclude=[field.name for field in self._meta.fields if field.name not in update_fields]
+                )
+        if self.pk is None and sharding.enabled():
+            sharding.assign_ids([self])
+            kwargs['force_insert'] = True
         super().save(*args, **kwargs)
 
 class StationHistory(models.Model):
-    """Model to store the history of station operations"""
+    """
+    Model to store the history of station operations.
+
+    Records are append-only compact events: the operation type is stored as
+    a small integer and volume changes keep the structured previous value
+    instead of a formatted message. Old events are rolled up into
+    StationHistoryRollup and pruned by the ``rollup_history`` command.
+    """
+
+    # Messages rendered for events that carry no explicit notes
+    DESCRIPTIONS = {
+        'create': 'Estação criada',
+        'update': 'Volume atualizado de {previous}% para {volume}%',
+        'collection_request': 'Pedido de coleta gerado automaticamente',
+        'collection_complete': 'Coleta confirmada. Volume anterior: {previous}%',
+    }
+    # Used instead when the previous volume is unknown (e.g. seeded or imported events)
+    DESCRIPTIONS_WITHOUT_PREVIOUS = {
+        'update': 'Volume definido para {volume}%',
+        'collection_complete': 'Coleta confirmada',
+    }
+
     station = models.ForeignKey(Station, on_delete=models.CASCADE, related_name='history')
-    operation_type = models.CharField(max_length=50)  # 'update', 'collection_request', 'collection_complete'
+    operation_type = OperationTypeField()  # 'create', 'update', 'collection_request', 'collection_complete'
     volume_percentage = models.FloatField()
-    timestamp = models.DateTimeField(auto_now_add=True)
+    previous_volume_percentage = models.FloatField(blank=True, null=True)
+    # A default rather than auto_now_add, so seeded and imported events keep their time
+    timestamp = models.DateTimeField(default=timezone.now)
     notes = models.TextField(blank=True, null=True)
 
     def __str__(self):
         return f"{self.station.name} - {self.operation_type} - {self.timestamp}"
 
+    def save(self, *args, **kwargs):
+        """Override save to keep history append-only"""
+        if not self._state.adding:
+            raise ValueError('StationHistory records are append-only and cannot be changed.')
+        super().save(*args, **kwargs)
+
+    def describe(self):
+        """Return the notes, or a message derived from the structured values"""
+        return self.describe_values(
+            self.operation_type, self.volume_percentage, self.previous_volume_percentage, self.notes
+        )
+
+    @classmethod
+    def describe_values(cls, operation_type, volume, previous, notes=None):
+        """describe() for rows read with ``.values()``"""
+        if notes:
+            return notes
+        template = cls.DESCRIPTIONS[operation_type]
+        if previous is None:
+            template = cls.DESCRIPTIONS_WITHOUT_PREVIOUS.get(operation_type, template)
+        return template.format(previous=previous, volume=volume)
+
     class Meta:
         """Records will be ordered by timestamp in descending order"""
-        ordering = ['-timestamp']
+        ordering = ['-timestamp', '-id']
+        indexes = [
+            # Backs per-station history listing and time-range filters
+            models.Index(fields=['station', 'timestamp'], name='history_station_ts_idx'),
+            # Backs the unfiltered, cursor-paginated listing
+            models.Index(fields=['timestamp', 'id'], name='history_ts_id_idx'),
+        ]
+
+class StationHistoryRollup(models.Model):
+    """Model storing aggregated volume statistics for pruned history events"""
+
+    class Period(models.TextChoices):
+        HOUR = 'hour'
+        DAY = 'day'
+
+    station = models.ForeignKey(Station, on_delete=models.CASCADE, related_name='history_rollups')
+    period = models.CharField(max_length=4, choices=Period.choices)
+    period_start = models.DateTimeField()
+    samples = models.PositiveIntegerField()
+    collections = models.PositiveIntegerField(default=0)
+    min_volume = models.FloatField()
+    max_volume = models.FloatField()
+    avg_volume = models.FloatField()
+
+    def __str__(self):
+        return f"{self.station.name} - {self.period} - {self.period_start}"
+
+    class Meta:
+        """Rollups will be ordered by bucket start in descending order"""
+        ordering = ['-period_start']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['station', 'period', 'period_start'], name='unique_history_rollup_bucket'
+            ),
+        ]
+
+class HistoryImport(models.Model):
+    """
+    Checkpoint of a history file loaded by the ``import_history`` command.
+
+    Files are identified by the SHA-256 of their content. ``rows_processed``
+    advances in the same transaction as each imported chunk, so an
+    interrupted import resumes after the last committed row and a finished
+    file is not imported twice.
+    """
+
+    source_hash = models.CharField(max_length=64, unique=True)
+    path = models.CharField(max_length=500)
+    rows_processed = models.PositiveBigIntegerField(default=0)
+    rows_imported = models.PositiveBigIntegerField(default=0)
+    rows_invalid = models.PositiveBigIntegerField(default=0)
+    stations_created = models.PositiveIntegerField(default=0)
+    started_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    completed_at = models.DateTimeField(blank=True, null=True)
+
+    def __str__(self):
+        return f"{self.path} - {self.rows_processed} linhas"
+
+
+class IdempotencyKey(models.Model):
+    """
+    Outcome of a write sent with an ``Idempotency-Key`` header.
+
+    The row is inserted before the write runs (``status_code`` is null
+    while it is in progress) and completed with the response, so a retry
+    with the same key replays the response instead of writing again.
+    ``fingerprint`` is the SHA-256 of the method, path and body, to reject
+    a key reused for a different request.
+    """
+
+    key = models.CharField(max_length=255, unique=True)
+    fingerprint = models.CharField(max_length=64)
+    status_code = models.PositiveSmallIntegerField(blank=True, null=True)
+    response = models.TextField(blank=True)
+    created_at = models.DateTimeField(default=timezone.now, db_index=True)
+
+    def __str__(self):
+        return f"{self.key} - {self.status_code or 'em andamento'}"
+
+
+class StationDirectory(models.Model):
+    """
+    Site of every station, on the default database.
+
+    Station ids are allocated here (see ``sharding.assign_ids``), so they
+    are unique across shards and each id maps to the shard holding it.
+    """
+
+    site = models.CharField(max_length=50, default=sharding.DEFAULT_SITE)
+
+    def __str__(self):
+        return f"{self.pk} - {self.site}"
+
@@ -1,7 +1,19 @@
-from rest_framework.pagination import PageNumberPagination
+from rest_framework.pagination import CursorPagination, PageNumberPagination
 
 class StandardResultsSetPagination(PageNumberPagination):
     """Standard pagination for API results"""
     page_size = 10
     page_size_query_param = 'page_size'
     max_page_size = 100
+
+class HistoryCursorPagination(CursorPagination):
+    """
+    Keyset pagination for history records.
+
+    Pages are addressed by an opaque cursor on ``(timestamp, id)`` instead of
+    an offset, so fetching any page costs the same no matter how deep it is.
+    """
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+    ordering = ('-timestamp', '-id')
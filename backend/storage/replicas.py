@@ -0,0 +1,111 @@
+import contextvars
+import math
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+
+# Cookie holding the time (epoch seconds) until which a client reads from the primary
+PIN_COOKIE = 'storage_primary'
+
+# Whether reads in the current context may be served by a replica
+_replica_reads = contextvars.ContextVar('storage_replica_reads', default=False)
+# Whether the current client wrote recently and must read from the primary
+_pinned = contextvars.ContextVar('storage_replica_pinned', default=False)
+
+
+def replica_map():
+    """STORAGE_REPLICAS: replica alias by primary database alias"""
+    return getattr(settings, 'STORAGE_REPLICAS', {})
+
+
+def enabled():
+    """Whether any database has a replica"""
+    return bool(replica_map())
+
+
+def pin_seconds():
+    """How long a client reads from the primary after writing"""
+    return getattr(settings, 'STORAGE_REPLICA_PIN_SECONDS', 5)
+
+
+def primary(alias):
+    """The primary of a replica alias; other aliases are returned unchanged"""
+    for primary_alias, replica_alias in replica_map().items():
+        if replica_alias == alias:
+            return primary_alias
+    return alias
+
+
+def active():
+    """Whether reads in the current context go to replicas"""
+    return _replica_reads.get() and not _pinned.get() and enabled()
+
+
+def for_read(alias):
+    """Database alias to read ``alias``'s data from in the current context"""
+    if active():
+        return replica_map().get(alias, alias)
+    return alias
+
+
+@contextmanager
+def replica_reads(allowed=True):
+    """Let reads in the block be served by replicas (False: primary only)"""
+    token = _replica_reads.set(allowed)
+    try:
+        yield
+    finally:
+        _replica_reads.reset(token)
+
+
+def allow_replica_reads():
+    """Let the rest of the current ``replica_reads`` block read from replicas"""
+    _replica_reads.set(True)
+
+
+@contextmanager
+def pinned(value=True):
+    """Send reads in the block to the primary, whatever the view allows"""
+    token = _pinned.set(value)
+    try:
+        yield
+    finally:
+        _pinned.reset(token)
+
+
+def is_pinned(request):
+    """Whether the request's client wrote within the pinning window"""
+    try:
+        until = float(request.COOKIES.get(PIN_COOKIE, ''))
+    except ValueError:
+        return False
+    return until > time.time()
+
+
+def pin(response):
+    """Pin the client to the primary for the pinning window"""
+    window = pin_seconds()
+    response.set_cookie(
+        PIN_COOKIE, f'{time.time() + window:.3f}', max_age=math.ceil(window), httponly=True, samesite='Lax'
+    )
+
+
+class ReplicaReadMixin:
+    """
+    Serve a viewset's ``replica_actions`` from the read replicas.
+
+    Other actions, and every request of a client pinned to the primary by
+    ``ReplicaPinningMiddleware``, read from the primary.
+    """
+
+    replica_actions = ('list', 'retrieve')
+
+    def dispatch(self, request, *args, **kwargs):
+        with replica_reads(False):
+            return super().dispatch(request, *args, **kwargs)
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        if self.action in self.replica_actions:
+            allow_replica_reads()
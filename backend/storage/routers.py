@@ -0,0 +1,77 @@
+from . import replicas
+from . import sharding
+
+
+class ShardRouter:
+    """
+    Route station data to the database of its site.
+
+    Stations, their history and rollups live on the shard of the station's
+    site (STORAGE_SHARDS); all other models stay on the default database.
+    Saved instances stay on the database they were loaded from, new
+    stations go to their site's shard, and other queries use the shard
+    bound to the current request (see ``sharding.ShardRoutingMixin``).
+    While migrate runs, data migrations use the database being migrated.
+    """
+
+    def _db_for(self, model, hints):
+        if model._meta.app_label != 'storage' or model._meta.model_name not in sharding.SHARDED_MODELS:
+            return None
+        migrating = sharding.migrating_db()
+        if migrating is not None:
+            return migrating
+        instance = hints.get('instance')
+        if instance is not None:
+            if instance._state.db:
+                return instance._state.db
+            if model._meta.model_name == 'station':
+                return sharding.for_site(instance.site)
+            station = model._meta.get_field('station').get_cached_value(instance, None)
+            if station is not None and station._state.db:
+                return station._state.db
+        return sharding.current_db()
+
+    def db_for_read(self, model, **hints):
+        return self._db_for(model, hints)
+
+    def db_for_write(self, model, **hints):
+        return self._db_for(model, hints)
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db == sharding.DEFAULT_DB:
+            return None
+        # Shards only hold station data
+        return app_label == 'storage' and (model_name is None or model_name in sharding.SHARDED_MODELS)
+
+
+class ReplicaRouter(ShardRouter):
+    """
+    Shard routing with read replicas.
+
+    Station data is located as by ShardRouter; reads then go to the
+    replica of that database when the current request allows it (see
+    ``replicas.ReplicaReadMixin``), while writes, including writes of
+    instances loaded from a replica, always go to the primary. Replicas
+    are migrated like their primary so their test databases get the same
+    schema; in production they are copies of it.
+    """
+
+    def db_for_read(self, model, **hints):
+        alias = self._db_for(model, hints)
+        if alias is None or alias == sharding.migrating_db():
+            return alias
+        return replicas.for_read(replicas.primary(alias))
+
+    def db_for_write(self, model, **hints):
+        alias = self._db_for(model, hints)
+        if alias is None or alias == sharding.migrating_db():
+            return alias
+        return replicas.primary(alias)
+
+    def allow_relation(self, obj1, obj2, **hints):
+        if replicas.primary(obj1._state.db) == replicas.primary(obj2._state.db):
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return super().allow_migrate(replicas.primary(db), app_label, model_name, **hints)
@@ -1,23 +1,85 @@
 from rest_framework import serializers
+from rest_framework.permissions import SAFE_METHODS
+from . import sharding
 from .models import Station, StationHistory
 
-class StationSerializer(serializers.ModelSerializer):
-    """Serializer for the Station model with custom validation"""
+
+def parse_fields(params, available):
+    """
+    Parse a ``?fields=a,b`` sparse fieldset.
+
+    Returns the selected names in the order of ``available``, or None when
+    the parameter is absent. Unknown names raise a ValidationError (HTTP 400).
+    """
+    value = params.get('fields')
+    if value is None:
+        return None
+
+    selected = {name.strip() for name in value.split(',') if name.strip()}
+    unknown = selected - set(available)
+    if not selected or unknown:
+        raise serializers.ValidationError(
+            {'fields': f"Campos inválidos: {', '.join(sorted(unknown)) or value}. Disponíveis: {', '.join(available)}."}
+        )
+    return [name for name in available if name in selected]
+
+
+class SparseFieldsMixin:
+    """Narrow a serializer to the request's ``?fields=`` on read requests"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        request = self.context.get('request')
+        if request is None or request.method not in SAFE_METHODS:
+            return
+        selected = parse_fields(request.query_params, list(self.fields))
+        if selected is not None:
+            for name in set(self.fields) - set(selected):
+                self.fields.pop(name)
+
+
+class StationSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    """
+    Serializer for the Station model.
+
+    Field validation (including the model's validate_volume_percentage) runs
+    once in is_valid(); saves then skip the model's full_clean() and write
+    only the submitted columns.
+    """
     
-    def validate_volume_percentage(self, value):
-        """Validate that volume percentage is between 0 and 100"""
-        if value < 0 or value > 100:
-            raise serializers.ValidationError("Volume percentage must be between 0 and 100")
+    def validate_site(self, value):
+        """The site is the shard key: one of the configured sites, set on creation and never changed"""
+        if self.instance is not None and value != self.instance.site:
+            raise serializers.ValidationError('O site de uma estação não pode ser alterado.')
+        if value not in sharding.sites():
+            raise serializers.ValidationError('Site desconhecido.')
         return value
     
+    def create(self, validated_data):
+        """Create a station from already validated data"""
+        station = Station(**validated_data)
+        station.save(validate=False)
+        return station
+    
+    def update(self, instance, validated_data):
+        """Apply validated fields and save only those columns"""
+        for attr, value in validated_data.items():
+            setattr(instance, attr, value)
+        instance.save(update_fields=[*validated_data, 'updated_at'], validate=False)
+        return instance
+    
     class Meta:
         model = Station
         fields = '__all__'
+        read_only_fields = ('collection_requested_at',)
 
-class StationHistorySerializer(serializers.ModelSerializer):
+class StationHistorySerializer(SparseFieldsMixin, serializers.ModelSerializer):
     """Serializer for the StationHistory model with additional fields"""
     # Returns the station name in the generated JSON, reducing the number of potential requests
     station_name = serializers.CharField(source='station.name', read_only=True)
+    operation_type = serializers.CharField(read_only=True)
+    # Generated events store structured values, the message is derived on read
+    notes = serializers.CharField(source='describe', read_only=True)
     
     class Meta:
         model = StationHistory
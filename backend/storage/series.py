@@ -0,0 +1,105 @@
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+import numpy as np
+from rest_framework.fields import DateTimeField
+
+from .models import StationHistory
+
+DEFAULT_POINTS = 500
+MAX_POINTS = 5000
+# Rows fetched per round trip while scanning a station's history
+SCAN_CHUNK_SIZE = 5000
+
+EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+MICROSECOND = timedelta(microseconds=1)
+
+
+def lttb(x, y, points):
+    """
+    Indices of the points kept by Largest-Triangle-Three-Buckets.
+
+    The first and last points are always kept; the others are split into
+    ``points - 2`` equal buckets and from each bucket the point forming the
+    largest triangle with the previously kept point and the next bucket's
+    average is kept. Bucket bounds and averages are computed for all
+    buckets at once; only the selection, which depends on the previous
+    bucket's choice, walks the buckets.
+
+    Args:
+        x: Increasing x values
+        y: y values
+        points: Number of points to keep (at least 3)
+    """
+    n = len(x)
+    if points >= n:
+        return np.arange(n)
+
+    # Bucket i covers [starts[i], starts[i + 1]); starts[-1] is the last point
+    starts = (np.arange(points - 1) * ((n - 2) / (points - 2))).astype(np.int64) + 1
+    sizes = np.diff(starts)
+    average_x = np.add.reduceat(x[:-1], starts[:-1]) / sizes
+    average_y = np.add.reduceat(y[:-1], starts[:-1]) / sizes
+    next_x = np.append(average_x[1:], x[-1])
+    next_y = np.append(average_y[1:], y[-1])
+
+    selected = np.empty(points, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+    previous = 0
+    for bucket in range(points - 2):
+        low, high = starts[bucket], starts[bucket + 1]
+        ax, ay = x[previous], y[previous]
+        area = np.abs(
+            (ax - next_x[bucket]) * (y[low:high] - ay) - (ax - x[low:high]) * (next_y[bucket] - ay)
+        )
+        previous = low + int(area.argmax())
+        selected[bucket + 1] = previous
+    return selected
+
+
+def load(station_id, start=None, end=None):
+    """
+    Read a station's volume readings in time order.
+
+    Streams the ``(station, timestamp)`` index range in chunks.
+
+    Returns:
+        tuple: (timestamps in epoch microseconds, volumes) as NumPy arrays
+    """
+    rows = StationHistory.objects.filter(station_id=station_id)
+    if start is not None:
+        rows = rows.filter(timestamp__gte=start)
+    if end is not None:
+        rows = rows.filter(timestamp__lte=end)
+    rows = rows.order_by('timestamp', 'id').values_list('timestamp', 'volume_percentage')
+
+    times, volumes = [], []
+    for timestamp, volume in rows.iterator(chunk_size=SCAN_CHUNK_SIZE):
+        times.append((timestamp - EPOCH) // MICROSECOND)
+        volumes.append(volume)
+    return np.array(times, dtype=np.int64), np.array(volumes, dtype=np.float64)
+
+
+def series(station_id, start=None, end=None, points=DEFAULT_POINTS):
+    """
+    A station's fill curve downsampled to at most ``points`` points.
+
+    Returns:
+        dict: the number of readings in the range and the kept points, each
+        with ``timestamp`` and ``volume_percentage``
+    """
+    times, volumes = load(station_id, start, end)
+    # Hours from the first reading keep the triangle areas well scaled
+    hours = (times - times[0]) / 3.6e9 if len(times) else times.astype(np.float64)
+    kept = lttb(hours, volumes, points)
+
+    field = DateTimeField()
+    return {
+        'source_points': len(times),
+        'points': [
+            {
+                'timestamp': field.to_representation(EPOCH + int(times[index]) * MICROSECOND),
+                'volume_percentage': float(volumes[index]),
+            }
+            for index in kept
+        ],
+    }
@@ -0,0 +1,186 @@
+import threading
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from . import cache as station_cache
+from . import history_writer
+from . import sharding
+from .models import COLLECTION_THRESHOLD, Station, StationHistory
+
+# Station state transitions: update -> collection_request -> collection_complete.
+# Each transition is a conditional UPDATE on the current state, run inside a
+# transaction holding the station row lock, so concurrent sensor updates and
+# operator confirmations can neither duplicate nor lose a transition.
+
+
+_coalesced = 0
+_coalesced_lock = threading.Lock()
+
+
+def is_significant_reading(station, volume, now=None):
+    """
+    Whether a sensor reading must be stored.
+
+    Readings within the station's dead-band of the stored volume are
+    jitter: they are dropped until the reading interval has passed since
+    the station was last written, when the latest reading is stored again.
+    Drift is not lost, since readings are compared to the stored volume
+    rather than to the previous reading. A reading that crosses the
+    collection threshold is always stored.
+    """
+    threshold = COLLECTION_THRESHOLD
+    if (volume >= threshold) != (station.volume_percentage >= threshold):
+        return True
+    if volume >= threshold and not station.collection_requested:
+        return True
+
+    deadband = station.reading_deadband
+    if deadband is None:
+        deadband = getattr(settings, 'STORAGE_READING_DEADBAND', 0)
+    if abs(volume - station.volume_percentage) >= deadband:
+        return True
+
+    interval = station.reading_interval
+    if interval is None:
+        interval = getattr(settings, 'STORAGE_READING_INTERVAL', 0)
+    return (now or timezone.now()) - station.updated_at >= timedelta(seconds=interval)
+
+
+def count_coalesced(count=1):
+    """Count readings dropped by the dead-band"""
+    global _coalesced
+    with _coalesced_lock:
+        _coalesced += count
+
+
+def coalesced_readings():
+    """Number of readings dropped by the dead-band since the process started"""
+    with _coalesced_lock:
+        return _coalesced
+
+
+def record_history(events):
+    """
+    Persist unsaved StationHistory events.
+
+    With STORAGE_HISTORY_WRITE_BEHIND enabled the events are handed to the
+    background writer once the current transaction commits, so the request
+    does not wait for the inserts; otherwise they are inserted immediately
+    in the current transaction.
+    """
+    events = list(events)
+    if not events:
+        return
+    if history_writer.is_enabled():
+        # The writer thread inserts them on the shard they were recorded on
+        db = sharding.current_db()
+        for event in events:
+            event._state.db = db
+        transaction.on_commit(lambda: history_writer.get_writer().submit(events), using=db)
+    else:
+        StationHistory.objects.bulk_create(events)
+        station_cache.invalidate_history(event.station_id for event in events)
+
+
+def lock_station(pk):
+    """Fetch a station with its row locked until the transaction ends"""
+    return Station.objects.select_for_update().get(pk=pk)
+
+
+def request_collection(station):
+    """
+    Flag a station for collection if it is at or above the threshold.
+
+    Must run inside a transaction. The flag is set with a conditional
+    UPDATE, so only the writer that actually flips it records the
+    collection_request event.
+
+    Returns:
+        bool: True if this call generated the collection request
+    """
+    now = timezone.now()
+    requested = Station.objects.filter(
+        pk=station.pk,
+        collection_requested=False,
+        volume_percentage__gte=COLLECTION_THRESHOLD,
+    ).update(collection_requested=True, collection_requested_at=now, updated_at=now)
+
+    if not requested:
+        return False
+
+    station.refresh_from_db(fields=['collection_requested', 'collection_requested_at', 'updated_at'])
+    record_history([StationHistory(
+        station=station,
+        operation_type='collection_request',
+        volume_percentage=station.volume_percentage
+    )])
+    station_cache.invalidate_stations([station.pk])
+    return True
+
+
+def record_volume_update(station, old_percentage):
+    """
+    Record a volume update and request collection when the threshold is reached.
+
+    Must run in the same transaction that saved the new volume.
+
+    Returns:
+        bool: True if the update generated a collection request
+    """
+    record_history([StationHistory(
+        station=station,
+        operation_type='update',
+        volume_percentage=station.volume_percentage,
+        previous_volume_percentage=old_percentage
+    )])
+    return request_collection(station)
+
+
+def confirm_collection(pk):
+    """
+    Confirm a pending collection, resetting the station volume to zero.
+
+    Returns:
+        Station: The updated station, or None if no collection was requested
+    """
+    return confirm_collections([pk]).get(pk)
+
+
+def confirm_collections(pks):
+    """
+    Confirm the pending collections of several stations in one transaction.
+
+    Stations without a pending request (or that do not exist) are left
+    untouched and missing from the result.
+
+    Returns:
+        dict: The updated stations, keyed by id
+    """
+    with transaction.atomic(using=sharding.current_db()):
+        stations = Station.objects.select_for_update().in_bulk(pks)
+        pending = [pk for pk, station in stations.items() if station.collection_requested]
+        if not pending:
+            return {}
+
+        confirmed = Station.objects.filter(pk__in=pending, collection_requested=True).update(
+            volume_percentage=0,
+            collection_requested=False,
+            collection_requested_at=None,
+            updated_at=timezone.now()
+        )
+        if not confirmed:
+            return {}
+
+        updated = Station.objects.in_bulk(pending)
+        record_history(StationHistory(
+            station=station,
+            operation_type='collection_complete',
+            volume_percentage=0,
+            previous_volume_percentage=stations[pk].volume_percentage
+        ) for pk, station in updated.items())
+        station_cache.invalidate_stations(updated.keys())
+
+    return updated
@@ -0,0 +1,286 @@
+import contextvars
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.management.color import no_style
+from django.db import connections, transaction
+from rest_framework.exceptions import ValidationError
+
+# Stations of sites without a shard of their own, and everything that is not
+# station data (directory, idempotency keys, imports, auth), live here
+DEFAULT_DB = 'default'
+DEFAULT_SITE = 'default'
+
+# Models stored on their station's shard
+SHARDED_MODELS = frozenset({'station', 'stationhistory', 'stationhistoryrollup'})
+
+# Database alias the current request works on; None outside a routed request
+_current = contextvars.ContextVar('storage_shard', default=None)
+# Database being migrated by the running migrate command, see bind_migration
+_migrating = contextvars.ContextVar('storage_migrating', default=None)
+
+# Process-wide threads for fan_out, see get_pool
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def shard_map():
+    """STORAGE_SHARDS: database alias by site"""
+    return getattr(settings, 'STORAGE_SHARDS', {})
+
+
+def enabled():
+    """Whether any site has a database of its own"""
+    return any(alias != DEFAULT_DB for alias in shard_map().values())
+
+
+def sites():
+    """Sites stations can belong to: the default site and every site with a shard"""
+    return [DEFAULT_SITE, *(site for site in shard_map() if site != DEFAULT_SITE)]
+
+
+def aliases():
+    """Every database holding station data, default first"""
+    return list(dict.fromkeys([DEFAULT_DB, *shard_map().values()]))
+
+
+def for_site(site):
+    """Database alias holding a site's stations"""
+    return shard_map().get(site, DEFAULT_DB)
+
+
+def current_db():
+    """Database alias for station data in the current context"""
+    return _current.get() or DEFAULT_DB
+
+
+def is_routed():
+    """Whether the current context is bound to a single shard"""
+    return _current.get() is not None
+
+
+@contextmanager
+def using(alias):
+    """Route station queries in the block to ``alias`` (None: unbound)"""
+    token = _current.set(alias)
+    try:
+        yield
+    finally:
+        _current.reset(token)
+
+
+def activate(alias):
+    """Bind the rest of the current ``using`` block to ``alias``"""
+    _current.set(alias)
+
+
+def migrating_db():
+    """Database alias being migrated, or None outside migrate"""
+    return _migrating.get()
+
+
+def bind_migration(using, **kwargs):
+    """
+    pre_migrate receiver: route station data to the database being migrated.
+
+    Data migrations query through the default manager, which the routers
+    would otherwise send to the default database whichever shard runs them.
+    """
+    _migrating.set(using)
+
+
+def unbind_migration(**kwargs):
+    """post_migrate receiver, see bind_migration"""
+    _migrating.set(None)
+
+
+def _directory_key(pk):
+    return f'storage:shard:{pk}'
+
+
+def for_station(pk):
+    """
+    Database alias holding a station, from the station directory.
+
+    Sites never change, so lookups are cached without expiry. Unknown ids
+    resolve to the default database, where they are simply not found.
+    """
+    if not enabled():
+        return DEFAULT_DB
+    return group_by_shard([pk]).popitem()[0]
+
+
+def group_by_shard(station_ids):
+    """
+    Split station ids by the database holding them.
+
+    Returns:
+        dict: ``{alias: [ids in the given order]}``
+    """
+    station_ids = list(station_ids)
+    if not enabled():
+        return {current_db(): station_ids}
+
+    from .cache import get_cache
+    from .models import StationDirectory
+
+    cache = get_cache()
+    keys = {pk: _directory_key(pk) for pk in dict.fromkeys(station_ids)}
+    found = cache.get_many(keys.values())
+    sites = {pk: found[key] for pk, key in keys.items() if key in found}
+    missing = [pk for pk in keys if pk not in sites]
+    if missing:
+        looked_up = dict(StationDirectory.objects.filter(pk__in=missing).values_list('pk', 'site'))
+        cache.set_many({keys[pk]: site for pk, site in looked_up.items()}, None)
+        sites.update(looked_up)
+
+    groups = {}
+    for pk in station_ids:
+        groups.setdefault(for_site(sites.get(pk, DEFAULT_SITE)), []).append(pk)
+    return groups
+
+
+def assign_ids(stations):
+    """
+    Give unsaved stations ids from the station directory.
+
+    With sharding enabled, ids are allocated on the default database for
+    every station, sharded or not, so they are unique across shards and a
+    station's shard can be found from its id alone. Otherwise stations
+    keep the ids of their own table.
+    """
+    from .models import StationDirectory
+
+    stations = [station for station in stations if station.pk is None]
+    if not stations or not enabled():
+        return
+    entries = StationDirectory.objects.bulk_create(
+        [StationDirectory(site=station.site) for station in stations]
+    )
+    for station, entry in zip(stations, entries):
+        station.pk = entry.pk
+
+
+def backfill_directory(batch_size=1000):
+    """
+    Add directory entries for stations of the default database that lack one.
+
+    Stations created while sharding was disabled have ids from their own
+    table; this registers them and moves the directory's id sequence past
+    them, so that sharding can be enabled. Returns the number of entries
+    added.
+    """
+    from .models import Station, StationDirectory
+
+    missing = list(
+        Station.objects.using(DEFAULT_DB).exclude(pk__in=StationDirectory.objects.values('pk'))
+        .order_by('pk').values_list('pk', 'site')
+    )
+    connection = connections[DEFAULT_DB]
+    with transaction.atomic(using=DEFAULT_DB):
+        for start in range(0, len(missing), batch_size):
+            StationDirectory.objects.bulk_create(
+                StationDirectory(pk=pk, site=site) for pk, site in missing[start:start + batch_size]
+            )
+        with connection.cursor() as cursor:
+            for sql in connection.ops.sequence_reset_sql(no_style(), [StationDirectory]):
+                cursor.execute(sql)
+    return len(missing)
+
+
+def station_deleted(sender, instance, **kwargs):
+    """post_delete receiver for Station: drop the station's directory entry"""
+    from .cache import get_cache
+    from .models import StationDirectory
+
+    if not enabled():
+        return
+    StationDirectory.objects.filter(pk=instance.pk).delete()
+    get_cache().delete(_directory_key(instance.pk))
+
+
+def get_pool():
+    """Return the process-wide fan_out pool, creating it from settings on first use"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'STORAGE_SHARD_WORKERS', 8), thread_name_prefix='storage-shard'
+            )
+        return _pool
+
+
+def fan_out(function):
+    """
+    Run ``function(alias)`` on every shard in parallel.
+
+    In a context already bound to a shard (or without sharding) it runs
+    once, inline. Otherwise each shard runs on a thread of the shared
+    pool, in a copy of the caller's context (e.g. replica reads), with
+    its own connections, which are closed when it is done.
+
+    Returns:
+        list: The result for each shard
+    """
+    if is_routed() or not enabled():
+        return [function(current_db())]
+
+    def run(alias):
+        try:
+            with using(alias):
+                return function(alias)
+        finally:
+            connections.close_all()
+
+    shards = aliases()
+    contexts = [contextvars.copy_context() for _ in shards]
+    return list(get_pool().map(lambda context, alias: context.run(run, alias), contexts, shards))
+
+
+class ShardRoutingMixin:
+    """
+    Bind each request of a viewset to the shard holding its data.
+
+    ``get_shard`` picks the database alias; None leaves the request
+    unbound, so that its fleet-wide queries fan out across shards. A
+    ``?site=`` parameter always selects that site's shard, and views narrow
+    their querysets to the site with ``filter_site``.
+    """
+
+    def dispatch(self, request, *args, **kwargs):
+        with using(None):
+            return super().dispatch(request, *args, **kwargs)
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        site = request.query_params.get('site')
+        if site is not None and site not in sites():
+            raise ValidationError({'site': 'Site desconhecido.'})
+        alias = for_site(site) if site is not None else self.get_shard()
+        if alias is not None:
+            activate(alias)
+
+    def filter_site(self, queryset, lookup='site'):
+        """
+        Narrow a queryset to the ``?site=`` site, if one was given.
+
+        Args:
+            queryset: Station data queryset
+            lookup: Lookup of the station's site from the queryset's model
+        """
+        site = self.request.query_params.get('site')
+        return queryset if site is None else queryset.filter(**{lookup: site})
+
+    def get_shard(self):
+        """Database alias for the request, or None to fan out"""
+        pk = self.kwargs.get('pk')
+        if pk is not None and str(pk).isdigit():
+            return for_station(int(pk))
+        return None
+
+    def require_shard(self):
+        """Reject requests that can only be served by a single shard when none was selected"""
+        if enabled() and not is_routed():
+            raise ValidationError({'site': 'Informe o site (ou station_id) com o banco particionado por site.'})
@@ -0,0 +1,83 @@
+from collections import namedtuple
+from datetime import datetime, timezone as dt_timezone
+
+from django.core import signing
+
+from . import sharding
+
+SALT = 'storage.sync'
+
+# stations_since: stations changed after this time are sent (None: all)
+# history_floor: every history event up to this id has been sent
+# history_read: the highest history id sent; events between the floor and
+#     it may have committed late and are sent again
+# checkpoint: the horizon checkpoint of the read that issued the watermark
+Watermark = namedtuple('Watermark', 'stations_since history_floor history_read checkpoint')
+
+INITIAL = Watermark(None, 0, 0, None)
+
+
+def _salt(site=None):
+    # Watermarks are only valid on the shard, and for the site, that issued them
+    salt = f'{SALT}:{sharding.current_db()}'
+    return salt if site is None else f'{salt}:{site}'
+
+
+class InvalidWatermark(ValueError):
+    """Raised for a watermark that was not issued by this server"""
+
+
+def encode(watermark, site=None):
+    """Build the opaque token for a watermark of a ``?site=`` sync (or of the whole shard)"""
+    stations_since = watermark.stations_since
+    return signing.dumps(
+        {
+            's': stations_since.timestamp() if stations_since else None,
+            'h': watermark.history_floor,
+            'r': watermark.history_read,
+            'c': watermark.checkpoint,
+        },
+        salt=_salt(site),
+        compress=True,
+    )
+
+
+def decode(token, site=None):
+    """
+    Read a watermark token issued for ``site``.
+
+    Tokens issued before ``r``/``c`` existed only carry the floor.
+    """
+    try:
+        value = signing.loads(token, salt=_salt(site))
+        stations_since = value['s']
+        history_floor = int(value['h'])
+        history_read = int(value.get('r', history_floor))
+        checkpoint = value.get('c')
+        if checkpoint is not None:
+            checkpoint = (float(checkpoint[0]), int(checkpoint[1]))
+    except (signing.BadSignature, KeyError, IndexError, TypeError, ValueError):
+        raise InvalidWatermark(token)
+    if stations_since is not None:
+        stations_since = datetime.fromtimestamp(stations_since, tz=dt_timezone.utc)
+    return Watermark(stations_since, history_floor, history_read, checkpoint)
+
+
+def next_watermark(watermark, horizon, history_read):
+    """
+    Watermark for the next sync, given the one just served.
+
+    Args:
+        watermark: The watermark the sync was served from
+        horizon: The ``horizon.Horizon`` of the sync's reads
+        history_read: The highest history id sent so far
+    """
+    stations_since = horizon.stations_before
+    if watermark.stations_since is not None:
+        stations_since = max(stations_since, watermark.stations_since)
+    return Watermark(
+        stations_since,
+        horizon.history_floor(watermark.history_floor, history_read, watermark.checkpoint),
+        history_read,
+        horizon.checkpoint,
+    )
@@ -1,8 +1,81 @@
-from django.test import TestCase
+import asyncio
+import csv
+import gzip
+import json
+import sqlite3
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from datetime import timedelta
+from pathlib import Path
+from io import StringIO
+from unittest import mock, skipUnless
+
+import numpy as np
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.core.management import call_command
+from django.db import OperationalError, connection, connections
+from django.db.models.query import QuerySet
+from django.test import AsyncClient, SimpleTestCase, TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.utils import timezone
+from django.utils.http import http_date
 from django.urls import reverse
 from rest_framework import status
-from rest_framework.test import APITestCase
-from .models import Station, StationHistory
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient, APITestCase
+from . import benchmark
+from . import export as history_export
+from . import forecast as station_forecast
+from . import series as station_series
+from . import history_writer
+from . import horizon
+from . import idempotency
+from . import services
+from . import replicas
+from . import sharding
+from . import sync
+from . import cache as station_cache
+from .events import broker
+from .metrics import registry
+from .renderers import FastJSONRenderer
+from .routers import ReplicaRouter
+from .serializers import StationHistorySerializer, StationSerializer
+from .views import history_values, station_values
+from .fields import OPERATION_TYPES
+from .history_writer import HistoryWriter, get_writer
+from .management.commands.import_history import Command as ImportHistoryCommand
+from .lean import ValuesMapper
+from .models import HistoryImport, IdempotencyKey, Station, StationDirectory, StationHistory, StationHistoryRollup
+
+# For tests of the single-database setup: with DJANGO_SHARDS set, their
+# fleet-wide requests would query the shards from other threads, outside
+# the test's transaction. ShardingTests cover the sharded endpoints.
+single_database = override_settings(STORAGE_SHARDS={})
+
+class SQLiteConnectionTests(TransactionTestCase):
+    """Test cases for the SQLite connection-created hook"""
+    
+    def _pragma(self, name):
+        with connection.cursor() as cursor:
+            cursor.execute(f'PRAGMA {name}')
+            return cursor.fetchone()[0]
+    
+    def test_pragmas_applied_to_new_connections(self):
+        """Test that configured pragmas are applied when a connection opens"""
+        try:
+            with override_settings(SQLITE_PRAGMAS={'synchronous': 'OFF', 'busy_timeout': 1234}):
+                connection.close()
+                connection.ensure_connection()
+                self.assertEqual(self._pragma('synchronous'), 0)  # OFF
+                self.assertEqual(self._pragma('busy_timeout'), 1234)
+        finally:
+            # Reopen with the regular settings
+            connection.close()
+
 
 class StationModelTests(TestCase):
     """Test cases for Station model"""
@@ -14,6 +87,17 @@ class StationModelTests(TestCase):
         self.assertEqual(station.volume_percentage, 50)
         self.assertFalse(station.collection_requested)
     
+    def test_save_validates_volume(self):
+        """Test that direct (admin/shell) saves are still validated"""
+        station = Station(name="Invalid Station", volume_percentage=150)
+        with self.assertRaises(DjangoValidationError):
+            station.save()
+        
+        station = Station.objects.create(name="Scoped Station", volume_percentage=50)
+        station.volume_percentage = -1
+        with self.assertRaises(DjangoValidationError):
+            station.save(update_fields=['volume_percentage'])
+    
     def test_station_str_representation(self):
         """Test string representation of a station"""
         station = Station.objects.create(name="Test Station", volume_percentage=50)
@@ -40,6 +124,50 @@ class StationHistoryModelTests(TestCase):
         self.assertEqual(history.volume_percentage, 60)
         self.assertEqual(history.notes, "Test update")
     
+    def test_operation_type_stored_compactly(self):
+        """Test that the operation type is stored as a small integer"""
+        history = StationHistory.objects.create(
+            station=self.station,
+            operation_type="collection_request",
+            volume_percentage=85,
+        )
+        
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT operation_type FROM storage_stationhistory WHERE id = %s', [history.id]
+            )
+            self.assertEqual(cursor.fetchone()[0], OPERATION_TYPES['collection_request'])
+        history.refresh_from_db()
+        self.assertEqual(history.operation_type, 'collection_request')
+    
+    def test_history_is_append_only(self):
+        """Test that saved history records cannot be modified"""
+        history = StationHistory.objects.create(
+            station=self.station,
+            operation_type="update",
+            volume_percentage=60,
+        )
+        history.volume_percentage = 70
+        
+        with self.assertRaises(ValueError):
+            history.save()
+    
+    def test_describe_structured_event(self):
+        """Test that generated events derive their message from structured values"""
+        history = StationHistory.objects.create(
+            station=self.station,
+            operation_type="update",
+            volume_percentage=60,
+            previous_volume_percentage=50,
+        )
+        self.assertIsNone(history.notes)
+        self.assertEqual(history.describe(), 'Volume atualizado de 50% para 60%')
+    
+    def test_describe_without_previous_volume(self):
+        """Test that events with an unknown previous volume do not render it"""
+        self.assertEqual(StationHistory.describe_values('update', 60, None), 'Volume definido para 60%')
+        self.assertEqual(StationHistory.describe_values('collection_complete', 0, None), 'Coleta confirmada')
+    
     def test_history_ordering(self):
         """Test that history records are ordered by timestamp in descending order"""
         StationHistory.objects.create(
@@ -61,6 +189,276 @@ class StationHistoryModelTests(TestCase):
         self.assertEqual(histories[1].notes, "First update")
 
 
+class SetupInitialDataCommandTests(TestCase):
+    """Test cases for the setup_initial_data management command"""
+    
+    def test_default_stations(self):
+        """Test that the three initial stations are created by default"""
+        call_command('setup_initial_data', stdout=StringIO())
+        
+        names = list(Station.objects.order_by('id').values_list('name', flat=True))
+        self.assertEqual(names, ['Estação A', 'Estação B', 'Estação C'])
+        self.assertFalse(StationHistory.objects.exists())
+    
+    def test_scaled_seed(self):
+        """Test seeding many stations and synthetic history"""
+        call_command('setup_initial_data', stations=30, history=250, seed=1, stdout=StringIO())
+        
+        self.assertEqual(Station.objects.count(), 30)
+        self.assertEqual(StationHistory.objects.count(), 250)
+        oldest = StationHistory.objects.order_by('timestamp').first().timestamp
+        self.assertLess(oldest, timezone.now() - timedelta(days=1))
+        
+        # Each event chains from the station's previous one
+        station = Station.objects.order_by('id').first()
+        events = list(station.history.order_by('timestamp', 'id'))
+        self.assertEqual(events[0].previous_volume_percentage, 0)
+        for previous, event in zip(events, events[1:]):
+            self.assertEqual(event.previous_volume_percentage, previous.volume_percentage)
+        
+        # Stations end at their last seeded volume
+        for station in Station.objects.all():
+            last = station.history.order_by('timestamp', 'id').last()
+            volume = last.volume_percentage if last else 0
+            self.assertEqual(station.volume_percentage, volume)
+            self.assertEqual(station.collection_requested, volume >= 80)
+
+
+class ImportHistoryCommandTests(TestCase):
+    """Test cases for the import_history management command"""
+    
+    def setUp(self):
+        """Write a CSV file with readings for two stations"""
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.existing = Station.objects.create(name="Estação A", volume_percentage=0)
+        self.path = self.write('readings.csv', [
+            'station_name,timestamp,operation_type,volume_percentage',
+            'Estação A,2024-01-01T00:00:00+00:00,update,10',
+            'Estação A,2024-01-01T01:00:00+00:00,update,20',
+            'Estação Nova,2024-01-01T00:00:00+00:00,,30',
+            'Estação Nova,ontem,update,40',
+            'Estação Nova,2024-01-01T02:00:00+00:00,update,150',
+            'Estação Nova,2024-01-01T03:00:00+00:00,collection_complete,0',
+        ])
+    
+    def write(self, name, lines):
+        """Write lines to a file in the temporary directory"""
+        path = Path(self.directory.name) / name
+        path.write_text('\n'.join(lines) + '\n', encoding='utf-8')
+        return str(path)
+    
+    def run_import(self, *paths, **options):
+        """Run the command, returning its output"""
+        out = StringIO()
+        call_command('import_history', *paths, stdout=out, stderr=StringIO(), **options)
+        return out.getvalue()
+    
+    def test_import_readings(self):
+        """Test that valid readings are imported and invalid ones reported"""
+        output = self.run_import(self.path, transaction_size=2)
+        
+        self.assertIn('4 leituras importadas, 2 inválidas, 1 estações criadas', output)
+        self.assertEqual(StationHistory.objects.count(), 4)
+        new = Station.objects.get(name='Estação Nova')
+        self.assertEqual(new.volume_percentage, 0)
+        self.existing.refresh_from_db()
+        self.assertEqual(self.existing.volume_percentage, 20)
+        update = StationHistory.objects.get(station=self.existing, volume_percentage=20)
+        self.assertEqual(update.previous_volume_percentage, 10)
+        self.assertEqual(update.describe(), 'Volume atualizado de 10.0% para 20.0%')
+    
+    def test_rerun_is_idempotent(self):
+        """Test that importing the same file twice inserts nothing the second time"""
+        self.run_import(self.path)
+        output = self.run_import(self.path)
+        
+        self.assertIn('nada a fazer', output)
+        self.assertEqual(StationHistory.objects.count(), 4)
+    
+    def test_resume_after_failure(self):
+        """Test that a failed import resumes after the last committed chunk"""
+        original = ImportHistoryCommand._import_chunk
+        calls = []
+        
+        def failing_chunk(command, *args):
+            calls.append(args)
+            if len(calls) == 2:
+                raise RuntimeError('interrompido')
+            return original(command, *args)
+        
+        with mock.patch.object(ImportHistoryCommand, '_import_chunk', failing_chunk):
+            with self.assertRaises(RuntimeError):
+                self.run_import(self.path, transaction_size=2)
+        self.assertEqual(HistoryImport.objects.get().rows_processed, 2)
+        self.assertEqual(StationHistory.objects.count(), 2)
+        
+        output = self.run_import(self.path, transaction_size=2)
+        self.assertIn('Retomando', output)
+        self.assertEqual(StationHistory.objects.count(), 4)
+        self.assertEqual(Station.objects.filter(name='Estação Nova').count(), 1)
+    
+    def test_resume_links_previous_volume(self):
+        """Test that a resumed import takes the previous volume from the committed chunks"""
+        path = self.write('resume.csv', [
+            'station_name,timestamp,operation_type,volume_percentage',
+            'Estação A,2024-01-01T00:00:00+00:00,update,10',
+            'Estação A,2024-01-01T01:00:00+00:00,update,20',
+            'Estação A,2024-01-01T02:00:00+00:00,update,30',
+        ])
+        original = ImportHistoryCommand._import_chunk
+        calls = []
+        
+        def failing_chunk(command, *args):
+            calls.append(args)
+            if len(calls) == 2:
+                raise RuntimeError('interrompido')
+            return original(command, *args)
+        
+        with mock.patch.object(ImportHistoryCommand, '_import_chunk', failing_chunk):
+            with self.assertRaises(RuntimeError):
+                self.run_import(path, transaction_size=2)
+        self.run_import(path, transaction_size=2)
+        
+        resumed = StationHistory.objects.get(volume_percentage=30)
+        self.assertEqual(resumed.previous_volume_percentage, 20)
+    
+    def test_import_requests_collection(self):
+        """Test that a station imported above the threshold is flagged for collection"""
+        path = self.write('full.csv', [
+            'station_name,timestamp,operation_type,volume_percentage',
+            'Estação A,2024-01-01T00:00:00+00:00,update,50',
+            'Estação A,2024-01-01T01:00:00+00:00,update,90',
+            'Estação Nova,2024-01-01T01:00:00+00:00,update,60',
+        ])
+        
+        self.run_import(path)
+        
+        self.existing.refresh_from_db()
+        self.assertTrue(self.existing.collection_requested)
+        self.assertIsNotNone(self.existing.collection_requested_at)
+        self.assertEqual(
+            StationHistory.objects.filter(station=self.existing, operation_type='collection_request').count(), 1
+        )
+        self.assertFalse(Station.objects.get(name='Estação Nova').collection_requested)
+    
+    def test_import_exported_ndjson(self):
+        """Test that an NDJSON export can be imported back"""
+        record = {
+            'station_name': 'Estação Exportada',
+            'operation_type': 'update',
+            'volume_percentage': 50.0,
+            'previous_volume_percentage': 40.0,
+            'timestamp': '2024-02-01T12:00:00+00:00',
+            'notes': 'Volume atualizado de 40.0% para 50.0%',
+        }
+        path = self.write('export.ndjson', [json.dumps(record), 'not json'])
+        
+        self.run_import(path)
+        
+        history = StationHistory.objects.get(station__name='Estação Exportada')
+        self.assertIsNone(history.notes)
+        self.assertEqual(history.previous_volume_percentage, 40)
+        self.assertEqual(HistoryImport.objects.get().rows_invalid, 1)
+
+
+class BenchmarkHelperTests(SimpleTestCase):
+    """Test cases for the benchmark report helpers"""
+    
+    def test_percentile(self):
+        """Test nearest-rank percentiles"""
+        values = list(range(1, 101))
+        self.assertEqual(benchmark.percentile(values, 0.50), 50)
+        self.assertEqual(benchmark.percentile(values, 0.95), 95)
+        self.assertEqual(benchmark.percentile(values, 0.99), 99)
+        self.assertEqual(benchmark.percentile([], 0.95), 0.0)
+    
+    def test_compare_detects_regressions(self):
+        """Test that slower or chattier scenarios are reported"""
+        baseline = {'scenarios': {
+            'station-list': {'p95_ms': 10.0, 'queries_per_request': 1.0},
+            'station-detail': {'p95_ms': 5.0, 'queries_per_request': 1.0},
+        }}
+        current = {'scenarios': {
+            'station-list': {'p95_ms': 11.0, 'queries_per_request': 1.2},
+            'station-detail': {'p95_ms': 7.0, 'queries_per_request': 3.0},
+        }}
+        
+        regressions = benchmark.compare(baseline, current, tolerance=0.2)
+        self.assertEqual(regressions, [
+            'station-detail: p95_ms 5.0 -> 7.0',
+            'station-detail: queries_per_request 1.0 -> 3.0',
+        ])
+
+
+@single_database
+class RollupHistoryCommandTests(TestCase):
+    """Test cases for the rollup_history management command"""
+    
+    def setUp(self):
+        """Set up test data"""
+        self.station = Station.objects.create(name="Rollup Test Station", volume_percentage=50)
+        self.now = timezone.now()
+    
+    def _event(self, age, volume, operation_type='update'):
+        history = StationHistory.objects.create(
+            station=self.station,
+            operation_type=operation_type,
+            volume_percentage=volume,
+        )
+        StationHistory.objects.filter(pk=history.pk).update(timestamp=self.now - age)
+        return history
+    
+    def test_rollup_prunes_old_events(self):
+        """Test that events past retention become hourly rollups"""
+        old = timezone.localtime(self.now - timedelta(days=10)).replace(minute=30)
+        for minute, volume in ((0, 20), (5, 40), (10, 90)):
+            self._event(self.now - old + timedelta(minutes=minute), volume)
+        self._event(self.now - old, 0, 'collection_complete')
+        recent = self._event(timedelta(hours=1), 60)
+        
+        call_command('rollup_history', retention_days=7, hourly_retention_days=30, stdout=StringIO())
+        
+        self.assertEqual(list(StationHistory.objects.values_list('id', flat=True)), [recent.id])
+        rollup = StationHistoryRollup.objects.get()
+        self.assertEqual(rollup.period, 'hour')
+        self.assertEqual(rollup.period_start, old.replace(minute=0, second=0, microsecond=0))
+        self.assertEqual(rollup.samples, 4)
+        self.assertEqual(rollup.collections, 1)
+        self.assertEqual(rollup.min_volume, 0)
+        self.assertEqual(rollup.max_volume, 90)
+        self.assertEqual(rollup.avg_volume, 37.5)
+    
+    def test_rollup_merges_late_events(self):
+        """Test that a re-run merges into existing buckets"""
+        age = timedelta(days=10)
+        self._event(age, 20)
+        call_command('rollup_history', retention_days=7, hourly_retention_days=30, stdout=StringIO())
+        self._event(age, 40)
+        call_command('rollup_history', retention_days=7, hourly_retention_days=30, stdout=StringIO())
+        
+        rollup = StationHistoryRollup.objects.get()
+        self.assertEqual(rollup.samples, 2)
+        self.assertEqual(rollup.avg_volume, 30)
+    
+    def test_hourly_rollups_become_daily(self):
+        """Test that hourly rollups past their retention become daily rollups"""
+        day = timezone.localtime(self.now - timedelta(days=60)).replace(hour=12, minute=0)
+        self._event(self.now - day, 10)
+        self._event(self.now - day - timedelta(hours=2), 30)
+        
+        call_command('rollup_history', retention_days=7, hourly_retention_days=30, stdout=StringIO())
+        
+        rollup = StationHistoryRollup.objects.get()
+        self.assertEqual(rollup.period, 'day')
+        self.assertEqual(rollup.period_start, day.replace(hour=0, second=0, microsecond=0))
+        self.assertEqual(rollup.samples, 2)
+        self.assertEqual(rollup.min_volume, 10)
+        self.assertEqual(rollup.max_volume, 30)
+        self.assertEqual(rollup.avg_volume, 20)
+
+
+@single_database
 class StationAPITests(APITestCase):
     """Test cases for Station API endpoints"""
     
@@ -111,6 +509,23 @@ class StationAPITests(APITestCase):
         history = StationHistory.objects.filter(station=self.station, operation_type='update')
         self.assertEqual(history.count(), 1)
     
+    def test_update_volume_validated_once(self):
+        """Test that an invalid volume is rejected with a single error"""
+        response = self.client.patch(self.detail_url, {'volume_percentage': 150}, format='json')
+        
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(len(response.data['volume_percentage']), 1)
+    
+    def test_update_skips_full_clean(self):
+        """Test that the API update path does not re-validate in Station.save"""
+        with mock.patch.object(Station, 'full_clean') as full_clean:
+            response = self.client.patch(self.detail_url, {'volume_percentage': 40}, format='json')
+        
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        full_clean.assert_not_called()
+        self.station.refresh_from_db()
+        self.assertEqual(self.station.volume_percentage, 40)
+    
     def test_update_volume_over_threshold(self):
         """Test updating a station's volume above 80% threshold"""
         data = {'name': self.station.name, 'volume_percentage': 85}
@@ -160,6 +575,113 @@ class StationAPITests(APITestCase):
         self.assertIn('error', response.data)
 
 
+class StationHistoryAdminTests(TestCase):
+    """Test cases for the StationHistory admin"""
+    
+    def setUp(self):
+        """Set up test data"""
+        self.user = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.client.force_login(self.user)
+        for index in range(10):
+            station = Station.objects.create(name=f"Admin Station {index}", volume_percentage=index)
+            StationHistory.objects.create(
+                station=station,
+                operation_type="update",
+                volume_percentage=index,
+            )
+    
+    def test_changelist_query_count(self):
+        """Test that the changelist does not query each row's station"""
+        url = reverse('admin:storage_stationhistory_changelist')
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        
+        with CaptureQueriesContext(connection) as few_rows:
+            self.client.get(url)
+        for index in range(10, 20):
+            station = Station.objects.create(name=f"Admin Station {index}", volume_percentage=index)
+            StationHistory.objects.create(
+                station=station,
+                operation_type="update",
+                volume_percentage=index,
+            )
+        with CaptureQueriesContext(connection) as more_rows:
+            self.client.get(url)
+        
+        self.assertEqual(len(few_rows), len(more_rows))
+
+
+class StationBulkUpdateAPITests(APITestCase):
+    """Test cases for the bulk volume-ingest endpoint"""
+    
+    def setUp(self):
+        """Set up test data"""
+        self.station_a = Station.objects.create(name="Bulk Station A", volume_percentage=10)
+        self.station_b = Station.objects.create(name="Bulk Station B", volume_percentage=20)
+        self.url = reverse('station-bulk-update')
+    
+    def test_bulk_update_volumes(self):
+        """Test applying several readings in one request"""
+        data = [
+            {'id': self.station_a.id, 'volume_percentage': 30},
+            {'id': self.station_b.id, 'volume_percentage': 40.5},
+        ]
+        response = self.client.post(self.url, data, format='json')
+        
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['updated'], 2)
+        self.assertEqual(response.data['failed'], 0)
+        self.station_a.refresh_from_db()
+        self.station_b.refresh_from_db()
+        self.assertEqual(self.station_a.volume_percentage, 30)
+        self.assertEqual(self.station_b.volume_percentage, 40.5)
+        self.assertEqual(StationHistory.objects.filter(operation_type='update').count(), 2)
+    
+    def test_bulk_update_collection_request(self):
+        """Test that the 80% rule fires once per station in a batch"""
+        data = [
+            {'id': self.station_a.id, 'volume_percentage': 85},
+            {'id': self.station_a.id, 'volume_percentage': 90},
+        ]
+        response = self.client.post(self.url, data, format='json')
+        
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.station_a.refresh_from_db()
+        self.assertEqual(self.station_a.volume_percentage, 90)
+        self.assertTrue(self.station_a.collection_requested)
+        history = StationHistory.objects.filter(station=self.station_a)
+        self.assertEqual(history.filter(operation_type='update').count(), 2)
+        self.assertEqual(history.filter(operation_type='collection_request').count(), 1)
+    
+    def test_bulk_update_partial_failure(self):
+        """Test that invalid readings are reported without rejecting the batch"""
+        data = [
+            {'id': self.station_a.id, 'volume_percentage': 150},
+            {'id': 999999, 'volume_percentage': 50},
+            {'id': self.station_b.id, 'volume_percentage': 'full'},
+            {'id': self.station_b.id, 'volume_percentage': 60},
+        ]
+        response = self.client.post(self.url, data, format='json')
+        
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['updated'], 1)
+        self.assertEqual(response.data['failed'], 3)
+        statuses = [result['status'] for result in response.data['results']]
+        self.assertEqual(statuses, ['error', 'error', 'error', 'ok'])
+        self.station_a.refresh_from_db()
+        self.station_b.refresh_from_db()
+        self.assertEqual(self.station_a.volume_percentage, 10)
+        self.assertEqual(self.station_b.volume_percentage, 60)
+    
+    def test_bulk_update_requires_list(self):
+        """Test that a non-list body is rejected"""
+        response = self.client.post(self.url, {'id': self.station_a.id}, format='json')
+        
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('error', response.data)
+
+
+@single_database
 class StationHistoryAPITests(APITestCase):
     """Test cases for StationHistory API endpoints"""
     
@@ -198,6 +720,77 @@ class StationHistoryAPITests(APITestCase):
         self.assertEqual(len(response.data['results']), 1)
         self.assertEqual(response.data['results'][0]['station'], self.station.id)
     
+    def test_filter_history_by_operation_type(self):
+        """Test filtering history by operation type"""
+        StationHistory.objects.create(
+            station=self.station,
+            operation_type="collection_request",
+            volume_percentage=85,
+        )
+        
+        response = self.client.get(f"{self.list_url}?operation_type=collection_request")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data['results']), 1)
+        self.assertEqual(response.data['results'][0]['operation_type'], 'collection_request')
+    
+    def test_filter_history_by_time_range(self):
+        """Test filtering history with since/until"""
+        old = StationHistory.objects.create(
+            station=self.station,
+            operation_type="update",
+            volume_percentage=20,
+        )
+        StationHistory.objects.filter(pk=old.pk).update(
+            timestamp=self.history.timestamp - timedelta(days=2)
+        )
+        since = (self.history.timestamp - timedelta(days=1)).isoformat()
+        until = (self.history.timestamp - timedelta(days=1)).isoformat()
+        
+        response = self.client.get(self.list_url, {'since': since})
+        self.assertEqual([r['id'] for r in response.data['results']], [self.history.id])
+        
+        response = self.client.get(self.list_url, {'until': until})
+        self.assertEqual([r['id'] for r in response.data['results']], [old.id])
+    
+    def test_filter_history_invalid_datetime(self):
+        """Test that an unparseable since parameter returns 400"""
+        response = self.client.get(self.list_url, {'since': 'yesterday'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+    
+    def test_history_cursor_pagination(self):
+        """Test that history pages are linked by cursor without overlap"""
+        for volume in range(5):
+            StationHistory.objects.create(
+                station=self.station,
+                operation_type="update",
+                volume_percentage=volume,
+            )
+        
+        response = self.client.get(self.list_url, {'page_size': 4})
+        self.assertEqual(len(response.data['results']), 4)
+        self.assertIsNotNone(response.data['next'])
+        first_page = [r['id'] for r in response.data['results']]
+        
+        response = self.client.get(response.data['next'])
+        second_page = [r['id'] for r in response.data['results']]
+        self.assertEqual(len(second_page), 2)
+        self.assertIsNone(response.data['next'])
+        self.assertFalse(set(first_page) & set(second_page))
+    
+    def test_list_history_query_count(self):
+        """Test that listing history runs a constant number of queries"""
+        for index in range(10):
+            station = Station.objects.create(name=f"Station {index}", volume_percentage=index)
+            StationHistory.objects.create(
+                station=station,
+                operation_type="update",
+                volume_percentage=index,
+            )
+        
+        with self.assertNumQueries(1):
+            response = self.client.get(self.list_url)
+        self.assertEqual(len(response.data['results']), 11)
+    
     def test_retrieve_history(self):
         """Test retrieving a specific history record"""
         response = self.client.get(self.detail_url)
@@ -206,3 +799,1662 @@ class StationHistoryAPITests(APITestCase):
         self.assertEqual(response.data['operation_type'], 'update')
         self.assertEqual(response.data['notes'], 'Test update')
 
+
+
+@single_database
+class StationHistoryExportTests(APITestCase):
+    """Test cases for the streaming history export"""
+    
+    def setUp(self):
+        """Set up test data"""
+        self.station = Station.objects.create(name="Export Station", volume_percentage=30)
+        self.other = Station.objects.create(name="Other Station", volume_percentage=0)
+        self.start = timezone.now() - timedelta(hours=10)
+        StationHistory.objects.bulk_create([
+            StationHistory(
+                station=self.station if hour % 2 else self.other,
+                operation_type='update',
+                volume_percentage=hour * 10,
+                previous_volume_percentage=(hour - 1) * 10,
+                timestamp=self.start + timedelta(hours=hour)
+            )
+            for hour in range(1, 7)
+        ])
+        self.url = reverse('stationhistory-export')
+    
+    def read(self, response):
+        """Join the streamed body"""
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content)
+    
+    def test_export_csv(self):
+        """Test exporting history as CSV in chronological order"""
+        response = self.client.get(self.url)
+        
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        rows = list(csv.DictReader(self.read(response).decode().splitlines()))
+        self.assertEqual(len(rows), 6)
+        self.assertEqual(rows[0]['station_name'], 'Export Station')
+        self.assertEqual(rows[0]['volume_percentage'], '10.0')
+        self.assertEqual(rows[0]['notes'], 'Volume atualizado de 0.0% para 10.0%')
+    
+    def test_export_ndjson_filtered(self):
+        """Test exporting a station's time range as NDJSON"""
+        response = self.client.get(self.url, {
+            'format': 'ndjson',
+            'station_id': self.station.id,
+            'since': (self.start + timedelta(hours=2)).isoformat(),
+        })
+        
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        records = [json.loads(line) for line in self.read(response).decode().splitlines()]
+        self.assertEqual([record['volume_percentage'] for record in records], [30, 50])
+        self.assertEqual(records[0]['operation_type'], 'update')
+    
+    def test_export_gzip(self):
+        """Test that the export is compressed when the client accepts gzip"""
+        response = self.client.get(self.url, HTTP_ACCEPT_ENCODING='gzip, deflate')
+        
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        body = gzip.decompress(self.read(response)).decode()
+        self.assertEqual(len(body.splitlines()), 7)
+    
+    def test_export_gzip_refused(self):
+        """Test that gzip listed with q=0 is not used"""
+        response = self.client.get(self.url, HTTP_ACCEPT_ENCODING='gzip;q=0, deflate')
+        
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertEqual(len(self.read(response).decode().splitlines()), 7)
+    
+    def test_accepts_gzip(self):
+        """Test the Accept-Encoding q-values"""
+        self.assertTrue(history_export.accepts_gzip('deflate, gzip;q=0.5'))
+        self.assertTrue(history_export.accepts_gzip('*'))
+        self.assertFalse(history_export.accepts_gzip('gzip; q=0.0'))
+        self.assertFalse(history_export.accepts_gzip('*, gzip;q=0'))
+        self.assertFalse(history_export.accepts_gzip('br, *;q=0'))
+        self.assertFalse(history_export.accepts_gzip(''))
+    
+    def test_export_streams_in_chunks(self):
+        """Test that rows are read in chunks and sent in several parts"""
+        with mock.patch.object(history_export, 'ROWS_PER_CHUNK', 2):
+            response = self.client.get(self.url, {'format': 'ndjson'})
+            parts = [part for part in response.streaming_content if part]
+        self.assertEqual(len(parts), 3)
+    
+    async def test_export_asgi(self):
+        """Test that the export streams asynchronously under ASGI"""
+        response = await AsyncClient().get(self.url, {'format': 'ndjson'})
+        
+        self.assertTrue(response.is_async)
+        body = b''.join([part async for part in response.streaming_content])
+        self.assertEqual(len(body.splitlines()), 6)
+    
+    def test_export_invalid_filter(self):
+        """Test that invalid filters are rejected before streaming"""
+        response = self.client.get(self.url, {'until': 'yesterday'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+@single_database
+class LeanReadPathTests(APITestCase):
+    """Test that the .values() list path matches the serializers"""
+    
+    def setUp(self):
+        """Set up stations and history with nullable fields set and unset"""
+        station_cache.get_cache().clear()
+        self.station = Station.objects.create(name="Lean Station ☃", volume_percentage=85.5)
+        Station.objects.filter(pk=self.station.pk).update(
+            collection_requested=True, collection_requested_at=timezone.now()
+        )
+        Station.objects.create(name="Idle Station", volume_percentage=0)
+        StationHistory.objects.create(station=self.station, operation_type='create', volume_percentage=0)
+        StationHistory.objects.create(
+            station=self.station, operation_type='update', volume_percentage=85.5,
+            previous_volume_percentage=0, notes="Leitura manual \u2028"
+        )
+    
+    def test_station_mapping_matches_serializer(self):
+        """Test that stations map to the serializer's representation"""
+        queryset = Station.objects.order_by('id')
+        self.assertEqual(
+            station_values.map(station_values.values(queryset)),
+            StationSerializer(queryset, many=True).data
+        )
+    
+    def test_history_mapping_matches_serializer(self):
+        """Test that history rows map to the serializer's representation"""
+        queryset = StationHistory.objects.select_related('station')
+        self.assertEqual(
+            history_values.map(history_values.values(queryset)),
+            StationHistorySerializer(queryset, many=True).data
+        )
+    
+    def test_list_responses_unchanged(self):
+        """Test that list responses render the serializer output byte for byte"""
+        response = self.client.get(reverse('station-list'))
+        expected = JSONRenderer().render(StationSerializer(Station.objects.all(), many=True).data)
+        self.assertEqual(response.content, expected)
+        
+        response = self.client.get(reverse('stationhistory-list'))
+        expected = StationHistorySerializer(StationHistory.objects.all(), many=True).data
+        self.assertEqual(json.loads(response.content)['results'], json.loads(JSONRenderer().render(expected)))
+    
+    def test_fast_renderer_matches_json_renderer(self):
+        """Test that orjson output is identical, including dates and separators"""
+        data = {'when': timezone.now(), 'items': [1.5, None, True, 'ã\u2029'], 2: 'int key'}
+        self.assertEqual(FastJSONRenderer().render(data), JSONRenderer().render(data))
+    
+    def test_fast_renderer_float_values(self):
+        """Test that tiny and large floats keep their value, if not their spelling"""
+        data = {'floats': [1e-07, 1.5e-05, 1e+16, 1e+21, 33.333333333333336, 0.1]}
+        rendered = FastJSONRenderer().render(data)
+        self.assertEqual(json.loads(rendered), json.loads(JSONRenderer().render(data)))
+        self.assertEqual(json.loads(rendered), data)
+    
+    def test_mapper_computed_fields(self):
+        """Test that computed fields override the serializer field"""
+        mapper = ValuesMapper(StationSerializer, computed={'name': (('name',), lambda row: row['name'].upper())})
+        rows = mapper.map(mapper.values(Station.objects.order_by('id')))
+        self.assertEqual(rows[0]['name'], 'LEAN STATION ☃')
+
+
+@single_database
+class SparseFieldsAndConditionalTests(APITestCase):
+    """Test cases for ?fields= sparse fieldsets and Last-Modified"""
+    
+    def setUp(self):
+        """Set up a station with history"""
+        station_cache.get_cache().clear()
+        self.station = Station.objects.create(name="Sparse Station", volume_percentage=40)
+        self.history = StationHistory.objects.create(
+            station=self.station, operation_type='update', volume_percentage=40, previous_volume_percentage=30
+        )
+        self.mobile_fields = 'id,volume_percentage,collection_requested'
+    
+    def test_station_list_fields(self):
+        """Test that the listing selects and returns only the requested fields"""
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('station-list'), {'fields': self.mobile_fields})
+        
+        self.assertEqual(list(response.data[0]), ['id', 'volume_percentage', 'collection_requested'])
+        self.assertNotIn('"name"', queries[0]['sql'])
+    
+    def test_unknown_field_rejected(self):
+        """Test that unknown field names return 400"""
+        response = self.client.get(reverse('station-list'), {'fields': 'id,password'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('password', str(response.data['fields']))
+    
+    def test_station_detail_fields(self):
+        """Test that a sparse detail shares the cache entry but has its own ETag"""
+        url = reverse('station-detail', args=[self.station.id])
+        full = self.client.get(url)
+        
+        with self.assertNumQueries(0):
+            sparse = self.client.get(url, {'fields': self.mobile_fields})
+        self.assertEqual(sparse.data, {'id': self.station.id, 'volume_percentage': 40, 'collection_requested': False})
+        self.assertNotEqual(sparse['ETag'], full['ETag'])
+        
+        response = self.client.get(url, {'fields': self.mobile_fields}, HTTP_IF_NONE_MATCH=sparse['ETag'])
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+    
+    def test_update_ignores_fields(self):
+        """Test that ?fields= does not narrow the writable fields"""
+        response = self.client.patch(
+            reverse('station-detail', args=[self.station.id]) + '?fields=id',
+            {'volume_percentage': 60},
+            format='json'
+        )
+        self.assertEqual(response.data['volume_percentage'], 60)
+    
+    def test_station_listing_uses_etag_only(self):
+        """Test that listings carry no Last-Modified, which a deletion would not advance"""
+        url = reverse('station-list')
+        response = self.client.get(url)
+        self.assertFalse(response.has_header('Last-Modified'))
+        etag = response['ETag']
+        
+        Station.objects.create(name="Deleted Station", volume_percentage=10).delete()
+        self.assertFalse(self.client.get(reverse('station-summary')).has_header('Last-Modified'))
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        
+        detail = reverse('station-detail', args=[self.station.id])
+        response = self.client.get(detail)
+        self.assertEqual(response['Last-Modified'], http_date(self.station.updated_at.timestamp()))
+        response = self.client.get(detail, HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+    
+    def test_history_list_last_modified(self):
+        """Test that an unchanged history poll costs a single index lookup"""
+        url = reverse('stationhistory-list')
+        response = self.client.get(url, {'station_id': self.station.id})
+        self.assertEqual(response['Last-Modified'], http_date(self.history.timestamp.timestamp()))
+        
+        with self.assertNumQueries(1):
+            response = self.client.get(
+                url, {'station_id': self.station.id}, HTTP_IF_MODIFIED_SINCE=response['Last-Modified']
+            )
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+    
+    def test_history_cursor_page_skips_aggregate(self):
+        """Test that later pages only look up Last-Modified for conditional requests"""
+        StationHistory.objects.create(station=self.station, operation_type='update', volume_percentage=50)
+        url = reverse('stationhistory-list')
+        next_page = self.client.get(url, {'page_size': 1}).data['next']
+        
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(next_page)
+        self.assertEqual(len(response.data['results']), 1)
+        self.assertFalse(response.has_header('Last-Modified'))
+        self.assertFalse(any('MAX(' in query['sql'] for query in queries))
+    
+    def test_history_fields(self):
+        """Test sparse history listing and retrieval"""
+        response = self.client.get(reverse('stationhistory-list'), {'fields': 'id,operation_type'})
+        self.assertEqual(response.data['results'], [{'id': self.history.id, 'operation_type': 'update'}])
+        
+        url = reverse('stationhistory-detail', args=[self.history.id])
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, {'fields': 'id,volume_percentage'})
+        self.assertEqual(response.data, {'id': self.history.id, 'volume_percentage': 40})
+        self.assertNotIn('JOIN', queries[0]['sql'])
+        self.assertNotIn('"notes"', queries[0]['sql'])
+        
+        response = self.client.get(url, {'fields': 'station_name,notes'})
+        self.assertEqual(response.data, {
+            'station_name': 'Sparse Station', 'notes': 'Volume atualizado de 30.0% para 40.0%'
+        })
+        
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+
+class IdempotencyTests(APITestCase):
+    """Test cases for Idempotency-Key handling on station writes"""
+    
+    def setUp(self):
+        """Set up a station and an empty response cache"""
+        idempotency.get_cache().clear()
+        self.station = Station.objects.create(name="Retry Station", volume_percentage=10)
+        self.url = reverse('station-detail', args=[self.station.id])
+    
+    def _patch(self, key, volume):
+        return self.client.patch(self.url, {'volume_percentage': volume}, format='json', HTTP_IDEMPOTENCY_KEY=key)
+    
+    def test_retry_is_replayed(self):
+        """Test that a retried PATCH does not write again"""
+        response = self._patch('reading-1', 40)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotIn('Idempotent-Replayed', response)
+        
+        with self.assertNumQueries(0):
+            retry = self._patch('reading-1', 40)
+        self.assertEqual(retry.status_code, status.HTTP_200_OK)
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertEqual(retry.json(), response.json())
+        self.assertEqual(StationHistory.objects.filter(station=self.station, operation_type='update').count(), 1)
+    
+    def test_unhandled_error_releases_key(self):
+        """Test that a request failing with an unhandled exception can be retried at once"""
+        with mock.patch.object(services, 'record_volume_update', side_effect=RuntimeError('falha')):
+            with self.assertRaises(RuntimeError):
+                self._patch('reading-2', 40)
+        self.assertFalse(IdempotencyKey.objects.filter(key='reading-2').exists())
+        
+        retry = self._patch('reading-2', 40)
+        self.assertEqual(retry.status_code, status.HTTP_200_OK)
+        self.assertEqual(retry.data['volume_percentage'], 40)
+    
+    def test_create_is_replayed(self):
+        """Test that a retried POST creates the station once and replays the same body"""
+        url = reverse('station-list')
+        data = {'name': 'Retry Create', 'volume_percentage': 30}
+        response = self.client.post(url, data, format='json', HTTP_IDEMPOTENCY_KEY='create-1')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        
+        idempotency.get_cache().clear()
+        retry = self.client.post(url, data, format='json', HTTP_IDEMPOTENCY_KEY='create-1')
+        self.assertEqual(retry.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertEqual(retry.json(), response.json())
+        self.assertEqual(Station.objects.filter(name='Retry Create').count(), 1)
+    
+    def test_replay_from_database(self):
+        """Test that a stored key is replayed after the memory cache is lost"""
+        response = self.client.post(
+            reverse('station-confirm-collection', args=[self.station.id]), HTTP_IDEMPOTENCY_KEY='confirm-1'
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        # Errors are not stored, so the request can be retried
+        self.assertFalse(IdempotencyKey.objects.filter(key='confirm-1').exists())
+        
+        Station.objects.filter(pk=self.station.pk).update(collection_requested=True)
+        url = reverse('station-confirm-collection', args=[self.station.id])
+        response = self.client.post(url, HTTP_IDEMPOTENCY_KEY='confirm-1')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        
+        idempotency.get_cache().clear()
+        retry = self.client.post(url, HTTP_IDEMPOTENCY_KEY='confirm-1')
+        self.assertEqual(retry.status_code, status.HTTP_200_OK)
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertEqual(retry.json(), response.json())
+        self.assertEqual(
+            StationHistory.objects.filter(station=self.station, operation_type='collection_complete').count(), 1
+        )
+    
+    def test_key_reuse_and_conflicts(self):
+        """Test that a key reused for another request or still in progress is rejected"""
+        self._patch('reading-2', 40)
+        response = self._patch('reading-2', 50)
+        self.assertEqual(response.status_code, status.HTTP_422_UNPROCESSABLE_ENTITY)
+        
+        IdempotencyKey.objects.create(key='in-flight', fingerprint='x' * 64)
+        response = self._patch('in-flight', 50)
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        
+        response = self._patch('x' * 256, 50)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.station.refresh_from_db()
+        self.assertEqual(self.station.volume_percentage, 40)
+    
+    @override_settings(STORAGE_IDEMPOTENCY={'ttl': 60, 'lock_timeout': 5})
+    def test_expired_and_abandoned_keys(self):
+        """Test that stale keys are taken over and purged"""
+        IdempotencyKey.objects.create(
+            key='abandoned', fingerprint='x' * 64, created_at=timezone.now() - timedelta(seconds=10)
+        )
+        response = self._patch('abandoned', 40)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotIn('Idempotent-Replayed', response)
+        
+        IdempotencyKey.objects.update(created_at=timezone.now() - timedelta(minutes=5))
+        self.assertEqual(idempotency.purge(), 1)
+    
+    def test_without_key(self):
+        """Test that requests without a key are not recorded"""
+        self._patch('', 40)
+        self.client.patch(self.url, {'volume_percentage': 40}, format='json')
+        self.client.get(self.url, HTTP_IDEMPOTENCY_KEY='read-1')
+        self.assertFalse(IdempotencyKey.objects.exists())
+
+
+class ReadingDeadbandTests(APITestCase):
+    """Test cases for the sensor reading dead-band"""
+    
+    def setUp(self):
+        """Set up a station"""
+        self.station = Station.objects.create(name="Noisy Station", volume_percentage=50)
+        self.url = reverse('station-detail', args=[self.station.id])
+    
+    def _history(self):
+        return StationHistory.objects.filter(station=self.station).count()
+    
+    def _reading(self, volume):
+        """Send one bulk_update reading, returning its result"""
+        response = self.client.post(
+            reverse('station-bulk-update'), [{'id': self.station.id, 'volume_percentage': volume}], format='json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data['results'][0]
+    
+    @override_settings(STORAGE_READING_DEADBAND=1.0, STORAGE_READING_INTERVAL=900)
+    def test_jitter_is_coalesced(self):
+        """Test that readings within the dead-band are not stored"""
+        coalesced = services.coalesced_readings()
+        for volume in (50.3, 49.6, 50.9, 49.2):
+            result = self._reading(volume)
+            self.assertTrue(result['coalesced'])
+            self.assertEqual(result['volume_percentage'], 50)
+        self.assertEqual(self._history(), 0)
+        self.assertEqual(services.coalesced_readings() - coalesced, 4)
+        
+        result = self._reading(51.5)
+        self.assertNotIn('coalesced', result)
+        self.assertEqual(result['volume_percentage'], 51.5)
+        self.assertEqual(self._history(), 1)
+    
+    @override_settings(STORAGE_READING_DEADBAND=1.0, STORAGE_READING_INTERVAL=900)
+    def test_manual_update_is_stored(self):
+        """Test that a single-station update is never dropped by the dead-band"""
+        response = self.client.patch(self.url, {'volume_percentage': 50.5}, format='json')
+        self.assertEqual(response.data['volume_percentage'], 50.5)
+        self.station.refresh_from_db()
+        self.assertEqual(self.station.volume_percentage, 50.5)
+        self.assertEqual(self._history(), 1)
+    
+    @override_settings(STORAGE_READING_DEADBAND=1.0, STORAGE_READING_INTERVAL=900)
+    def test_interval_and_overrides(self):
+        """Test that the interval and per-station settings apply"""
+        Station.objects.filter(pk=self.station.pk).update(updated_at=timezone.now() - timedelta(minutes=20))
+        self.assertEqual(self._reading(50.2)['volume_percentage'], 50.2)
+        
+        Station.objects.filter(pk=self.station.pk).update(reading_deadband=0)
+        self.assertEqual(self._reading(50.3)['volume_percentage'], 50.3)
+        self.assertEqual(self._history(), 2)
+    
+    @override_settings(STORAGE_READING_DEADBAND=5.0, STORAGE_READING_INTERVAL=900)
+    def test_threshold_crossing_is_stored(self):
+        """Test that a reading reaching the threshold is never coalesced"""
+        Station.objects.filter(pk=self.station.pk).update(volume_percentage=79)
+        self.assertTrue(self._reading(80)['collection_requested'])
+        self.assertEqual(
+            StationHistory.objects.filter(station=self.station, operation_type='collection_request').count(), 1
+        )
+    
+    @override_settings(STORAGE_READING_DEADBAND=1.0, STORAGE_READING_INTERVAL=900)
+    def test_bulk_update(self):
+        """Test that bulk readings apply the dead-band in order"""
+        response = self.client.post(reverse('station-bulk-update'), [
+            {'id': self.station.id, 'volume_percentage': 50.5},
+            {'id': self.station.id, 'volume_percentage': 52},
+            {'id': self.station.id, 'volume_percentage': 52.4},
+        ], format='json')
+        self.assertEqual((response.data['updated'], response.data['coalesced']), (1, 2))
+        self.assertEqual([r.get('coalesced', False) for r in response.data['results']], [True, False, True])
+        self.station.refresh_from_db()
+        self.assertEqual(self.station.volume_percentage, 52)
+        self.assertEqual(self._history(), 1)
+
+
+class StationSeriesTests(APITestCase):
+    """Test cases for the downsampled station series"""
+    
+    def setUp(self):
+        """Set up a station with a sawtooth fill curve"""
+        station_cache.get_cache().clear()
+        self.station = Station.objects.create(name="Series Station", volume_percentage=0)
+        self.url = reverse('station-series', args=[self.station.id])
+        self.start = timezone.now() - timedelta(hours=200)
+        StationHistory.objects.bulk_create([
+            StationHistory(
+                station=self.station,
+                operation_type='update',
+                volume_percentage=float(hour % 50),
+                timestamp=self.start + timedelta(hours=hour),
+            )
+            for hour in range(200)
+        ])
+    
+    def test_lttb(self):
+        """Test that LTTB keeps the ends and the extremes"""
+        x = np.arange(100, dtype=float)
+        y = np.zeros(100)
+        y[37] = 10
+        kept = station_series.lttb(x, y, 10)
+        self.assertEqual(len(kept), 10)
+        self.assertEqual((kept[0], kept[-1]), (0, 99))
+        self.assertIn(37, kept)
+        self.assertTrue(np.all(np.diff(kept) > 0))
+        np.testing.assert_array_equal(station_series.lttb(x[:5], y[:5], 10), np.arange(5))
+    
+    def test_series(self):
+        """Test that the series is downsampled within the range"""
+        response = self.client.get(self.url, {'points': 20})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['source_points'], 200)
+        self.assertEqual(len(response.data['points']), 20)
+        self.assertEqual(response.data['points'][0]['volume_percentage'], 0)
+        self.assertEqual(response.data['points'][-1]['volume_percentage'], 49)
+        # The sawtooth's resets are kept
+        volumes = [point['volume_percentage'] for point in response.data['points']]
+        self.assertGreaterEqual(sum(1 for a, b in zip(volumes, volumes[1:]) if b < a), 3)
+        
+        response = self.client.get(self.url, {
+            'from': (self.start + timedelta(hours=10)).isoformat(),
+            'to': (self.start + timedelta(hours=19)).isoformat(),
+        })
+        self.assertEqual(response.data['source_points'], 10)
+        self.assertEqual([point['volume_percentage'] for point in response.data['points']], list(range(10, 20)))
+    
+    def test_series_cache(self):
+        """Test that the series is cached until the station's history changes"""
+        response = self.client.get(self.url, {'points': 20})
+        self.assertEqual(response['X-Cache'], 'MISS')
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url, {'points': 20})
+        self.assertEqual(response['X-Cache'], 'HIT')
+        
+        self.client.patch(reverse('station-detail', args=[self.station.id]), {'volume_percentage': 30}, format='json')
+        response = self.client.get(self.url, {'points': 20})
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.data['source_points'], 201)
+    
+    def test_invalid_parameters(self):
+        """Test that invalid ranges and sizes are rejected"""
+        for params in ({'points': '2'}, {'points': '5001'}, {'from': 'yesterday'},
+                       {'from': timezone.now().isoformat(), 'to': self.start.isoformat()}):
+            response = self.client.get(self.url, params)
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        
+        response = self.client.get(reverse('station-series', args=[999999]))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class StationDirectoryTests(APITestCase):
+    """Test cases for station id allocation and sites"""
+    
+    @override_settings(STORAGE_SHARDS={})
+    def test_no_directory_without_sharding(self):
+        """Test that stations keep their own ids while sharding is disabled"""
+        Station.objects.create(name="Directory A", volume_percentage=0)
+        self.assertFalse(StationDirectory.objects.exists())
+    
+    @override_settings(STORAGE_SHARDS={'north': 'shard_north'})
+    def test_ids_from_directory(self):
+        """Test that station ids are allocated by the directory and released on delete"""
+        first = Station.objects.create(name="Directory A", volume_percentage=0)
+        second = Station.objects.create(name="Directory B", volume_percentage=0)
+        self.assertEqual(
+            dict(StationDirectory.objects.values_list('id', 'site')),
+            {first.id: 'default', second.id: 'default'},
+        )
+        
+        Station.objects.filter(pk=first.pk).delete()
+        self.assertEqual(list(StationDirectory.objects.values_list('id', flat=True)), [second.id])
+    
+    @override_settings(STORAGE_SHARDS={})
+    def test_backfill_directory(self):
+        """Test that stations created without sharding are registered before ids are allocated"""
+        existing = Station.objects.create(name="Directory A", volume_percentage=0)
+        out = StringIO()
+        call_command('backfill_station_directory', stdout=out)
+        self.assertIn('1 estações registradas', out.getvalue())
+        
+        with override_settings(STORAGE_SHARDS={'north': 'shard_north'}):
+            new = Station.objects.create(name="Directory B", volume_percentage=0)
+        self.assertGreater(new.id, existing.id)
+        self.assertEqual(StationDirectory.objects.count(), 2)
+    
+    def test_unknown_site_rejected(self):
+        """Test that stations can only be created on a configured site"""
+        response = self.client.post(reverse('station-list'), {'name': 'Directory B', 'site': 'nowhere'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('site', response.data)
+        
+        response = self.client.get(reverse('station-list'), {'site': 'nowhere'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+    
+    def test_site_cannot_change(self):
+        """Test that the shard key is immutable"""
+        station = Station.objects.create(name="Directory C", volume_percentage=0)
+        url = reverse('station-detail', args=[station.id])
+        response = self.client.patch(url, {'site': 'south'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('site', response.data)
+    
+    # A site without a database of its own shares the default database
+    @override_settings(STORAGE_SHARDS={'north': 'default'})
+    def test_site_filter(self):
+        """Test that ?site= narrows listings to the site's stations and history"""
+        station_cache.get_cache().clear()
+        north = Station.objects.create(name="North", volume_percentage=90, site='north')
+        Station.objects.create(name="Default", volume_percentage=90)
+        StationHistory.objects.create(station=north, operation_type='create', volume_percentage=90)
+        
+        response = self.client.get(reverse('station-list'), {'site': 'north'})
+        self.assertEqual([station['id'] for station in response.data], [north.id])
+        self.assertEqual(self.client.get(reverse('station-summary'), {'site': 'north'}).data['total'], 1)
+        self.assertEqual(len(self.client.get(reverse('station-forecast'), {'site': 'north'}).data), 1)
+        
+        response = self.client.get(reverse('stationhistory-list'), {'site': 'north'})
+        self.assertEqual([event['station'] for event in response.data['results']], [north.id])
+        response = self.client.get(reverse('sync-list'), {'site': 'north'})
+        self.assertEqual([station['id'] for station in response.data['stations']], [north.id])
+        self.assertEqual(response.data['station_count'], 1)
+        
+        # Watermarks are only valid for the site that issued them
+        response = self.client.get(reverse('sync-list'), {'since': response.data['watermark']})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+@skipUnless(
+    len(settings.STORAGE_SHARDS) >= 2,
+    'Defina DJANGO_SHARDS com dois sites, ex.: DJANGO_SHARDS=north=north.sqlite3,south=south.sqlite3',
+)
+class ShardingTests(TransactionTestCase):
+    """Test cases for stations sharded by site (run with DJANGO_SHARDS)"""
+    
+    databases = '__all__'
+    client_class = APIClient
+    
+    def setUp(self):
+        """Create one station per site through the API"""
+        station_cache.get_cache().clear()
+        self.north, self.south = list(settings.STORAGE_SHARDS)[:2]
+        self.stations = {}
+        for site in (self.north, self.south, sharding.DEFAULT_SITE):
+            response = self.client.post(
+                reverse('station-list'), {'name': f'Station {site}', 'volume_percentage': 10, 'site': site},
+                format='json'
+            )
+            self.stations[site] = response.data['id']
+    
+    def test_rows_live_on_their_shard(self):
+        """Test that stations and their history are written to their site's database"""
+        for site, station_id in self.stations.items():
+            alias = sharding.for_site(site)
+            for db in sharding.aliases():
+                self.assertEqual(Station.objects.using(db).filter(pk=station_id).exists(), db == alias)
+            self.assertEqual(StationHistory.objects.using(alias).filter(station_id=station_id).count(), 1)
+    
+    def test_idempotent_create_on_shard(self):
+        """Test that a create routed by its body's site can be retried with an Idempotency-Key"""
+        data = {'name': 'Retry North', 'volume_percentage': 10, 'site': self.north}
+        response = self.client.post(reverse('station-list'), data, format='json', HTTP_IDEMPOTENCY_KEY='north-1')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        
+        retry = self.client.post(reverse('station-list'), data, format='json', HTTP_IDEMPOTENCY_KEY='north-1')
+        self.assertEqual(retry.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(retry.json(), response.json())
+        self.assertEqual(
+            Station.objects.using(sharding.for_site(self.north)).filter(name='Retry North').count(), 1
+        )
+    
+    def test_detail_routes(self):
+        """Test that detail, update and history requests find the station's shard"""
+        station_id = self.stations[self.south]
+        url = reverse('station-detail', args=[station_id])
+        response = self.client.patch(url, {'volume_percentage': 85}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.data['collection_requested'])
+        self.assertEqual(self.client.get(url).data['site'], self.south)
+        
+        response = self.client.get(reverse('stationhistory-list'), {'station_id': station_id})
+        self.assertEqual(
+            [event['operation_type'] for event in response.data['results']], ['collection_request', 'update', 'create']
+        )
+        response = self.client.post(reverse('station-confirm-collection', args=[station_id]))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            Station.objects.using(sharding.for_site(self.south)).get(pk=station_id).volume_percentage, 0
+        )
+    
+    def test_fleet_listings_fan_out(self):
+        """Test that listings and the summary merge every shard"""
+        response = self.client.get(reverse('station-list'))
+        self.assertEqual([station['id'] for station in response.data], sorted(self.stations.values()))
+        
+        response = self.client.get(reverse('station-list'), {'site': self.north})
+        self.assertEqual([station['id'] for station in response.data], [self.stations[self.north]])
+        
+        response = self.client.get(reverse('station-summary'))
+        self.assertEqual(response.data['total'], 3)
+        self.assertEqual(response.data['average_volume'], 10)
+        
+        response = self.client.get(reverse('station-forecast'))
+        self.assertEqual(len(response.data), 3)
+    
+    def test_bulk_update_across_shards(self):
+        """Test that readings for stations on different shards are all applied"""
+        response = self.client.post(reverse('station-bulk-update'), [
+            {'id': station_id, 'volume_percentage': 90} for station_id in self.stations.values()
+        ], format='json')
+        self.assertEqual(response.data['updated'], 3)
+        
+        response = self.client.get(reverse('collection-queue'))
+        self.assertEqual(response.data['count'], 3)
+        self.assertEqual([entry['id'] for entry in response.data['results']], sorted(self.stations.values()))
+        
+        response = self.client.post(reverse('collection-confirm'), list(self.stations.values()), format='json')
+        self.assertEqual(response.data['confirmed'], 3)
+    
+    def test_history_across_shards(self):
+        """Test that history without a station or site merges the newest page of every shard"""
+        response = self.client.get(reverse('stationhistory-list'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            sorted(event['station'] for event in response.data['results']), sorted(self.stations.values())
+        )
+        self.assertIsNone(response.data['next'])
+        
+        response = self.client.get(reverse('stationhistory-list'), {'site': self.north})
+        self.assertEqual(len(response.data['results']), 1)
+        
+        response = self.client.get(reverse('stationhistory-export'))
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        
+        watermark = self.client.get(reverse('sync-list'), {'site': self.north}).data['watermark']
+        response = self.client.get(reverse('sync-list'), {'site': self.south, 'since': watermark})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+    
+    def test_site_sync_export_and_rollup(self):
+        """Test that sync and export read one site's shard and rollups compact every shard"""
+        station_id = self.stations[self.north]
+        response = self.client.get(reverse('sync-list'), {'site': self.north})
+        self.assertEqual([station['id'] for station in response.data['stations']], [station_id])
+        self.assertEqual([event['station'] for event in response.data['history']], [station_id])
+        
+        response = self.client.get(reverse('stationhistory-export'), {'site': self.north, 'format': 'ndjson'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+        self.assertEqual([row['station_name'] for row in rows], [f'Station {self.north}'])
+        
+        for alias in sharding.aliases():
+            StationHistory.objects.using(alias).update(timestamp=timezone.now() - timedelta(days=10))
+        call_command('rollup_history', retention_days=7, hourly_retention_days=30, stdout=StringIO())
+        for site, station_id in self.stations.items():
+            rollups = StationHistoryRollup.objects.using(sharding.for_site(site))
+            self.assertEqual(list(rollups.values_list('station_id', flat=True)), [station_id])
+
+
+class ReplicaRoutingTests(SimpleTestCase):
+    """Test cases for the replica routing decisions"""
+    
+    router = ReplicaRouter()
+    
+    @override_settings(STORAGE_REPLICAS={'default': 'default_replica'})
+    def test_reads_go_to_the_replica_when_allowed(self):
+        """Test that only allowed, unpinned reads of station data use the replica"""
+        self.assertEqual(self.router.db_for_read(Station), 'default')
+        with replicas.replica_reads():
+            self.assertEqual(self.router.db_for_read(Station), 'default_replica')
+            self.assertEqual(self.router.db_for_read(StationHistory), 'default_replica')
+            # Data outside the station models stays on the primary
+            self.assertIsNone(self.router.db_for_read(IdempotencyKey))
+            with replicas.pinned():
+                self.assertEqual(self.router.db_for_read(Station), 'default')
+    
+    @override_settings(STORAGE_REPLICAS={'default': 'default_replica'})
+    def test_writes_go_to_the_primary(self):
+        """Test that instances loaded from a replica are saved on the primary"""
+        station = Station(name='Replica Station')
+        station._state.db = 'default_replica'
+        with replicas.replica_reads():
+            self.assertEqual(self.router.db_for_write(Station, instance=station), 'default')
+            self.assertEqual(self.router.db_for_read(Station, instance=station), 'default_replica')
+        # Replicas get their primary's schema
+        self.assertEqual(
+            self.router.allow_migrate('default_replica', 'storage', 'station'),
+            self.router.allow_migrate('default', 'storage', 'station'),
+        )
+
+
+# The primary doubles as its own replica: routing is unchanged, pinning is on
+@single_database
+@override_settings(STORAGE_REPLICAS={'default': 'default'})
+class ReplicaPinningTests(APITestCase):
+    """Test cases for pinning writers to the primary database"""
+    
+    def setUp(self):
+        """Create a station and clear the response cache"""
+        station_cache.get_cache().clear()
+        self.station = Station.objects.create(name='Pinned Station', volume_percentage=10)
+    
+    def test_writes_pin_the_client(self):
+        """Test that successful writes set the pinning cookie and reads do not"""
+        response = self.client.get(reverse('station-list'))
+        self.assertNotIn(replicas.PIN_COOKIE, response.cookies)
+        
+        url = reverse('station-detail', args=[self.station.id])
+        response = self.client.patch(url, {'volume_percentage': 'full'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertNotIn(replicas.PIN_COOKIE, response.cookies)
+        
+        response = self.client.patch(url, {'volume_percentage': 50}, format='json')
+        cookie = response.cookies[replicas.PIN_COOKIE]
+        self.assertGreater(float(cookie.value), time.time())
+        self.assertEqual(cookie['max-age'], settings.STORAGE_REPLICA_PIN_SECONDS)
+    
+    def test_pinned_clients_skip_replica_cache_entries(self):
+        """Test that listings cached from a replica are not served to pinned clients"""
+        self.assertEqual(self.client.get(reverse('station-list'))['X-Cache'], 'MISS')
+        self.assertEqual(self.client.get(reverse('station-list'))['X-Cache'], 'HIT')
+        
+        self.client.cookies[replicas.PIN_COOKIE] = str(time.time() + 5)
+        self.assertEqual(self.client.get(reverse('station-list'))['X-Cache'], 'MISS')
+        self.assertEqual(self.client.get(reverse('station-list'))['X-Cache'], 'HIT')
+        
+        # A pin that ran out reads from the replica again
+        self.client.cookies[replicas.PIN_COOKIE] = str(time.time() - 1)
+        self.assertEqual(self.client.get(reverse('station-list'))['X-Cache'], 'HIT')
+
+
+@skipUnless(
+    'default' in getattr(settings, 'STORAGE_REPLICAS', {}) and connection.vendor == 'sqlite',
+    'needs DJANGO_REPLICAS=default=<file> on SQLite'
+)
+class ReplicaTests(TransactionTestCase):
+    """Test cases for reads served by a copied SQLite replica (run with DJANGO_REPLICAS)"""
+    
+    databases = '__all__'
+    client_class = APIClient
+    
+    def setUp(self):
+        """Create a station and copy the primary into the replica"""
+        station_cache.get_cache().clear()
+        response = self.client.post(
+            reverse('station-list'), {'name': 'Replicated Station', 'volume_percentage': 10}, format='json'
+        )
+        self.station_id = response.data['id']
+        self.client.cookies.clear()
+        self.copy_to_replica()
+    
+    @staticmethod
+    def copy_to_replica():
+        primary, replica = connections['default'], connections[settings.STORAGE_REPLICAS['default']]
+        primary.ensure_connection()
+        replica.ensure_connection()
+        primary.connection.backup(replica.connection)
+    
+    def test_reads_come_from_the_replica(self):
+        """Test that listings, details and history are read from the replica"""
+        Station.objects.filter(pk=self.station_id).update(volume_percentage=40)
+        
+        response = self.client.get(reverse('station-detail', args=[self.station_id]))
+        self.assertEqual(response.data['volume_percentage'], 10)
+        self.assertEqual(self.client.get(reverse('station-list')).data[0]['volume_percentage'], 10)
+        
+        StationHistory.objects.create(station_id=self.station_id, operation_type='update', volume_percentage=40)
+        response = self.client.get(reverse('stationhistory-list'), {'station_id': self.station_id})
+        self.assertEqual(len(response.data['results']), 1)
+    
+    def test_writers_read_their_writes(self):
+        """Test that a client reads from the primary after writing, until the pin runs out"""
+        url = reverse('station-detail', args=[self.station_id])
+        response = self.client.patch(url, {'volume_percentage': 60}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        
+        self.assertEqual(self.client.get(url).data['volume_percentage'], 60)
+        self.assertEqual(self.client.get(reverse('station-list')).data[0]['volume_percentage'], 60)
+        response = self.client.get(reverse('stationhistory-list'), {'station_id': self.station_id})
+        self.assertEqual(len(response.data['results']), 2)
+        
+        # Other clients still read the lagging replica (the listing above was
+        # read from the primary, so its cache entry is current for everyone)
+        other = APIClient()
+        self.assertEqual(other.get(reverse('station-list')).data[0]['volume_percentage'], 60)
+        response = other.get(reverse('stationhistory-list'), {'station_id': self.station_id})
+        self.assertEqual(len(response.data['results']), 1)
+        
+        self.client.cookies[replicas.PIN_COOKIE] = str(time.time() - 1)
+        response = self.client.get(reverse('stationhistory-list'), {'station_id': self.station_id})
+        self.assertEqual(len(response.data['results']), 1)
+
+
+@single_database
+class SyncTests(APITestCase):
+    """Test cases for the delta sync endpoint"""
+    
+    def setUp(self):
+        """Set up two stations with history"""
+        self.url = reverse('sync-list')
+        self.first = Station.objects.create(name="Sync A", volume_percentage=10)
+        self.second = Station.objects.create(name="Sync B", volume_percentage=20)
+        for station in (self.first, self.second):
+            StationHistory.objects.create(
+                station=station, operation_type='create', volume_percentage=station.volume_percentage
+            )
+    
+    def _age(self, seconds=60):
+        """Move every change behind the read horizon"""
+        past = timezone.now() - timedelta(seconds=seconds)
+        Station.objects.update(updated_at=past)
+    
+    def test_initial_sync(self):
+        """Test that a sync without a watermark returns everything"""
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual({s['id'] for s in response.data['stations']}, {self.first.id, self.second.id})
+        self.assertEqual(len(response.data['history']), 2)
+        self.assertEqual(response.data['station_count'], 2)
+        self.assertFalse(response.data['has_more'])
+        self.assertEqual(response.data['stations'][0], StationSerializer(self.first).data)
+    
+    def test_incremental_sync(self):
+        """Test that a watermark returns only later changes"""
+        self._age()
+        watermark = self.client.get(self.url).data['watermark']
+        
+        response = self.client.get(self.url, {'since': watermark})
+        self.assertEqual(response.data['stations'], [])
+        self.assertEqual(response.data['history'], [])
+        
+        self.client.patch(
+            reverse('station-detail', args=[self.second.id]), {'volume_percentage': 55}, format='json'
+        )
+        response = self.client.get(self.url, {'since': watermark})
+        self.assertEqual([s['id'] for s in response.data['stations']], [self.second.id])
+        self.assertEqual(response.data['stations'][0]['volume_percentage'], 55)
+        self.assertEqual(len(response.data['history']), 1)
+        self.assertEqual(response.data['history'][0]['volume_percentage'], 55)
+    
+    def test_history_limit(self):
+        """Test that history is paged by the watermark"""
+        self._age()
+        response = self.client.get(self.url, {'limit': 1})
+        self.assertTrue(response.data['has_more'])
+        self.assertEqual(len(response.data['history']), 1)
+        first_id = response.data['history'][0]['id']
+        
+        response = self.client.get(self.url, {'limit': 1, 'since': response.data['watermark']})
+        self.assertFalse(response.data['has_more'])
+        self.assertEqual(len(response.data['history']), 1)
+        self.assertGreater(response.data['history'][0]['id'], first_id)
+    
+    def test_invalid_parameters(self):
+        """Test that forged watermarks and bad limits are rejected"""
+        response = self.client.get(self.url, {'since': 'forged'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('since', response.data)
+        
+        for limit in ('0', '5001', 'abc'):
+            response = self.client.get(self.url, {'limit': limit})
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+    
+    def test_sync_queries(self):
+        """Test that an incremental sync uses a fixed number of queries"""
+        self._age()
+        watermark = self.client.get(self.url).data['watermark']
+        # Only the reads: no savepoint, no write lock
+        with self.assertNumQueries(3):
+            self.client.get(self.url, {'since': watermark})
+    
+    def test_late_history_is_sent_again(self):
+        """Test that events between the floor and the last id sent are sent again"""
+        self._age()
+        first, second = StationHistory.objects.order_by('id').values_list('id', flat=True)
+        token = sync.encode(sync.Watermark(timezone.now(), first - 1, second, None))
+        
+        response = self.client.get(self.url, {'since': token})
+        self.assertEqual([event['id'] for event in response.data['history']], [first, second])
+        
+        # SQLite commits ids in order: the floor catches up with what was sent
+        response = self.client.get(self.url, {'since': response.data['watermark']})
+        self.assertEqual(response.data['history'], [])
+    
+    def test_history_floor_waits_for_older_writers(self):
+        """Test that the floor only passes ids allocated before the oldest running writer"""
+        checkpoint = (100.0, 50)
+        # A writer that started before the checkpoint may still commit ids below 50
+        self.assertEqual(horizon.Horizon(None, (110.0, 60), 90.0).history_floor(10, 70, checkpoint), 10)
+        self.assertEqual(horizon.Horizon(None, (110.0, 60), 105.0).history_floor(10, 70, checkpoint), 50)
+        # Never past what was actually sent
+        self.assertEqual(horizon.Horizon(None, (110.0, 60), 105.0).history_floor(10, 30, checkpoint), 30)
+        # Ids are visible in order where there is no writer horizon
+        self.assertEqual(horizon.Horizon(None).history_floor(10, 70, None), 70)
+
+
+@single_database
+@skipUnless(connection.vendor == 'sqlite', 'Testa o bloqueio de escrita do SQLite')
+class SyncWriteLockTests(TransactionTestCase):
+    """Test that a sync reads alongside a running writer on SQLite"""
+    
+    client_class = APIClient
+    
+    def test_sync_does_not_wait_for_writer(self):
+        """Test that a sync is served from a snapshot while the write lock is held"""
+        Station.objects.create(name="Sync A", volume_percentage=10)
+        writer = sqlite3.connect(connection.settings_dict['NAME'])
+        self.addCleanup(writer.close)
+        writer.isolation_level = None
+        writer.execute('BEGIN IMMEDIATE')
+        writer.execute('UPDATE storage_station SET volume_percentage = 50')
+        try:
+            started = time.monotonic()
+            response = self.client.get(reverse('sync-list'))
+            elapsed = time.monotonic() - started
+        finally:
+            writer.execute('ROLLBACK')
+        
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertLess(elapsed, 1)
+        self.assertEqual(response.data['stations'][0]['volume_percentage'], 10)
+
+
+@single_database
+class StationCacheTests(APITestCase):
+    """Test cases for the station read-through cache"""
+    
+    def setUp(self):
+        """Set up test data"""
+        station_cache.get_cache().clear()
+        station_cache.reset_stats()
+        self.station = Station.objects.create(name="Cache Test Station", volume_percentage=50)
+        self.list_url = reverse('station-list')
+        self.detail_url = reverse('station-detail', args=[self.station.id])
+    
+    def test_list_served_from_cache(self):
+        """Test that a repeated listing does not hit the database"""
+        first = self.client.get(self.list_url)
+        self.assertEqual(first['X-Cache'], 'MISS')
+        
+        with self.assertNumQueries(0):
+            second = self.client.get(self.list_url)
+        self.assertEqual(second['X-Cache'], 'HIT')
+        self.assertEqual(second.data, first.data)
+        self.assertEqual(station_cache.stats(), {'hits': 1, 'misses': 1})
+    
+    def test_detail_served_from_cache(self):
+        """Test that a repeated retrieve does not hit the database"""
+        self.client.get(self.detail_url)
+        
+        with self.assertNumQueries(0):
+            response = self.client.get(self.detail_url)
+        self.assertEqual(response.data['name'], 'Cache Test Station')
+    
+    def test_if_none_match_returns_not_modified(self):
+        """Test that an unchanged poll returns 304 without a body"""
+        etag = self.client.get(self.list_url)['ETag']
+        
+        response = self.client.get(self.list_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertFalse(response.content)
+    
+    def test_update_invalidates_cache(self):
+        """Test that a volume update is visible on the next read"""
+        list_etag = self.client.get(self.list_url)['ETag']
+        detail_etag = self.client.get(self.detail_url)['ETag']
+        
+        self.client.patch(self.detail_url, {'volume_percentage': 70}, format='json')
+        
+        response = self.client.get(self.list_url, HTTP_IF_NONE_MATCH=list_etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data[0]['volume_percentage'], 70)
+        response = self.client.get(self.detail_url, HTTP_IF_NONE_MATCH=detail_etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['volume_percentage'], 70)
+    
+    def test_confirm_collection_invalidates_cache(self):
+        """Test that confirming a collection is visible on the next read"""
+        self.client.patch(self.detail_url, {'volume_percentage': 90}, format='json')
+        self.client.get(self.detail_url)
+        
+        self.client.post(reverse('station-confirm-collection', args=[self.station.id]))
+        
+        response = self.client.get(self.detail_url)
+        self.assertEqual(response.data['volume_percentage'], 0)
+        self.assertFalse(response.data['collection_requested'])
+    
+    def test_bulk_update_invalidates_cache(self):
+        """Test that bulk readings are visible on the next read"""
+        self.client.get(self.list_url)
+        
+        self.client.post(
+            reverse('station-bulk-update'),
+            [{'id': self.station.id, 'volume_percentage': 20}],
+            format='json'
+        )
+        
+        response = self.client.get(self.list_url)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.data[0]['volume_percentage'], 20)
+    
+    def test_queryset_delete_invalidates_cache(self):
+        """Test that a bulk delete (e.g. from the admin) drops cached stations"""
+        self.client.get(self.list_url)
+        self.client.get(self.detail_url)
+        
+        Station.objects.filter(pk=self.station.pk).delete()
+        
+        self.assertEqual(self.client.get(self.detail_url).status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(self.client.get(self.list_url).data, [])
+    
+    def test_evicted_version_does_not_resurrect_listings(self):
+        """Test that losing the list version key cannot bring back an older listing"""
+        self.client.get(self.list_url)
+        station_cache.get_cache().delete(station_cache.LIST_VERSION_KEY)
+        
+        self.station.volume_percentage = 30
+        self.station.save()
+        
+        response = self.client.get(self.list_url)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.data[0]['volume_percentage'], 30)
+
+
+@single_database
+class StationSummaryAPITests(APITestCase):
+    """Test cases for the station summary endpoint"""
+    
+    def setUp(self):
+        """Set up test data"""
+        station_cache.get_cache().clear()
+        for name, volume in [('A', 5), ('B', 45), ('C', 85), ('D', 100)]:
+            Station.objects.create(name=f"Summary Station {name}", volume_percentage=volume)
+        Station.objects.filter(volume_percentage__gte=80).update(collection_requested=True)
+        self.url = reverse('station-summary')
+    
+    def test_summary(self):
+        """Test fleet totals, histogram and fullest stations"""
+        with self.assertNumQueries(2):
+            response = self.client.get(self.url, {'top': 2})
+        
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['total'], 4)
+        self.assertAlmostEqual(response.data['average_volume'], 58.75)
+        self.assertEqual(response.data['above_threshold'], 2)
+        self.assertEqual(response.data['collection_requested'], {'requested': 2, 'not_requested': 2})
+        counts = [bucket['count'] for bucket in response.data['histogram']]
+        self.assertEqual(counts, [1, 0, 0, 0, 1, 0, 0, 0, 1, 1])
+        self.assertEqual(
+            [station['name'] for station in response.data['fullest']],
+            ['Summary Station D', 'Summary Station C']
+        )
+    
+    def test_summary_empty(self):
+        """Test the summary without stations"""
+        Station.objects.all().delete()
+        
+        response = self.client.get(self.url)
+        self.assertEqual(response.data['total'], 0)
+        self.assertIsNone(response.data['average_volume'])
+        self.assertEqual(response.data['fullest'], [])
+    
+    def test_summary_invalid_top(self):
+        """Test that an out-of-range top returns 400"""
+        response = self.client.get(self.url, {'top': 0})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+    
+    def test_summary_cached_until_update(self):
+        """Test that the summary is cached and invalidated by station writes"""
+        self.client.get(self.url)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(self.url)['X-Cache'], 'HIT')
+        
+        station = Station.objects.get(name='Summary Station A')
+        self.client.patch(
+            reverse('station-detail', args=[station.id]), {'volume_percentage': 95}, format='json'
+        )
+        
+        response = self.client.get(self.url)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.data['above_threshold'], 3)
+
+
+@single_database
+class StationForecastTests(APITestCase):
+    """Test cases for the fill-rate forecast"""
+    
+    def setUp(self):
+        """Set up a station filling at 10% per hour"""
+        station_cache.get_cache().clear()
+        self.start = timezone.now() - timedelta(days=1)
+        self.station = Station.objects.create(name="Forecast Station", volume_percentage=20)
+        self.add_events(self.station, [('create', 0, 0), ('update', 1, 10), ('update', 2, 20)])
+        Station.objects.filter(pk=self.station.pk).update(updated_at=self.start + timedelta(hours=2))
+        self.url = reverse('station-forecast')
+    
+    def add_events(self, station, events):
+        """Create (operation_type, hours after start, volume) history events"""
+        StationHistory.objects.bulk_create([
+            StationHistory(
+                station=station,
+                operation_type=operation_type,
+                volume_percentage=volume,
+                timestamp=self.start + timedelta(hours=hours)
+            )
+            for operation_type, hours, volume in events
+        ])
+    
+    def test_forecast(self):
+        """Test the predicted threshold and full times"""
+        response = self.client.get(self.url)
+        
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        prediction = response.data[0]
+        self.assertEqual(prediction['name'], 'Forecast Station')
+        self.assertEqual(prediction['samples'], 3)
+        self.assertAlmostEqual(prediction['fill_rate'], 10)
+        self.assertAlmostEqual(
+            (prediction['threshold_at'] - self.start).total_seconds(), 8 * 3600, delta=1
+        )
+        self.assertAlmostEqual((prediction['full_at'] - self.start).total_seconds(), 10 * 3600, delta=1)
+        self.assertEqual(prediction['hours_to_threshold'], 0)
+    
+    def test_forecast_without_history(self):
+        """Test that stations without a fill trend get no prediction"""
+        Station.objects.create(name="Idle Station", volume_percentage=10)
+        
+        prediction = self.client.get(self.url).data[1]
+        self.assertIsNone(prediction['fill_rate'])
+        self.assertIsNone(prediction['threshold_at'])
+        self.assertIsNone(prediction['hours_to_full'])
+    
+    def test_forecast_updates_incrementally(self):
+        """Test that only new history is read and a collection starts a new cycle"""
+        self.client.get(self.url)
+        last_id = station_forecast.refresh().last_id
+        
+        self.add_events(self.station, [('collection_complete', 3, 0), ('update', 4, 5), ('update', 5, 10)])
+        with CaptureQueriesContext(connection) as queries:
+            prediction = self.client.get(self.url).data[0]
+        history_queries = [query['sql'] for query in queries if 'storage_stationhistory' in query['sql']]
+        self.assertIn(f'"id" > {last_id}', history_queries[0])
+        self.assertEqual(prediction['samples'], 3)
+        self.assertAlmostEqual(prediction['fill_rate'], 5)
+    
+    def test_late_history_is_applied_once(self):
+        """Test that an event committed behind newer ids is applied, and only once"""
+        late = StationHistory.objects.get(operation_type='update', volume_percentage=10)
+        StationHistory.objects.filter(pk=late.pk).delete()
+        # A writer older than every checkpoint keeps the floor from moving
+        stalled = horizon.Horizon(None, (timezone.now().timestamp(), 0), 0.0)
+        with mock.patch.object(station_forecast.horizon, 'reading', return_value=nullcontext(stalled)):
+            self.assertEqual(station_forecast.refresh().sums[0, station_forecast.N], 2)
+            
+            StationHistory.objects.bulk_create([late])
+            state = station_forecast.refresh()
+            self.assertEqual(state.sums[0, station_forecast.N], 3)
+            self.assertAlmostEqual(state.fill_rates()[0], 10)
+            
+            self.assertEqual(station_forecast.refresh().sums[0, station_forecast.N], 3)
+    
+    def test_vectorized_fit_matches_polyfit(self):
+        """Test the batched least-squares fit across several stations"""
+        rng = np.random.default_rng(1)
+        stations = np.repeat([3, 1, 2], 20)
+        times = np.tile(np.sort(rng.uniform(0, 48, 20)), 3) * 3600
+        volumes = rng.uniform(0, 100, 60)
+        state = station_forecast.ForecastState()
+        state.apply(np.arange(1, 61), stations, times, volumes, np.zeros(60, dtype=bool))
+        
+        for row, station_id in enumerate(state.station_ids):
+            mask = stations == station_id
+            slope = np.polyfit(times[mask] / 3600, volumes[mask], 1)[0]
+            self.assertAlmostEqual(state.fill_rates()[row], slope)
+
+
+@single_database
+class CollectionQueueAPITests(APITestCase):
+    """Test cases for the collection queue and batch confirmation"""
+    
+    def setUp(self):
+        """Set up stations, three of them with pending collections"""
+        station_cache.get_cache().clear()
+        self.stations = {}
+        for name, volume in [('A', 85), ('B', 95), ('C', 50), ('D', 90), ('E', 85)]:
+            station = Station.objects.create(name=f"Route Station {name}", volume_percentage=0)
+            self.client.patch(
+                reverse('station-detail', args=[station.id]), {'volume_percentage': volume}, format='json'
+            )
+            self.stations[name] = station
+        self.queue_url = reverse('collection-queue')
+        self.confirm_url = reverse('collection-confirm')
+    
+    def test_queue_order(self):
+        """Test that the fullest and longest waiting stations come first"""
+        response = self.client.get(self.queue_url)
+        
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['count'], 4)
+        self.assertEqual(
+            [entry['name'] for entry in response.data['results']],
+            ['Route Station B', 'Route Station D', 'Route Station A', 'Route Station E']
+        )
+        self.assertEqual(response.data['results'][0]['position'], 1)
+        self.assertIsNotNone(response.data['results'][0]['collection_requested_at'])
+        
+        response = self.client.get(self.queue_url, {'limit': 2})
+        self.assertEqual(len(response.data['results']), 2)
+    
+    def test_queue_invalid_limit(self):
+        """Test that an invalid limit returns 400"""
+        response = self.client.get(self.queue_url, {'limit': 'all'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+    
+    def test_requested_at_follows_flag(self):
+        """Test that every path keeps collection_requested_at in step"""
+        station = self.stations['C']
+        self.client.post(
+            reverse('station-bulk-update'), [{'id': station.id, 'volume_percentage': 99}], format='json'
+        )
+        station.refresh_from_db()
+        self.assertTrue(station.collection_requested)
+        self.assertIsNotNone(station.collection_requested_at)
+        
+        self.client.post(reverse('station-confirm-collection', args=[station.id]))
+        station.refresh_from_db()
+        self.assertIsNone(station.collection_requested_at)
+    
+    def test_confirm_route(self):
+        """Test confirming several collections in one request"""
+        ids = [self.stations[name].id for name in ('B', 'C', 'D')]
+        
+        response = self.client.post(self.confirm_url, ids, format='json')
+        
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['confirmed'], 2)
+        self.assertEqual(response.data['failed'], 1)
+        self.assertEqual([result['status'] for result in response.data['results']], ['ok', 'error', 'ok'])
+        self.assertEqual(response.data['results'][0]['station']['volume_percentage'], 0)
+        self.assertEqual(
+            StationHistory.objects.filter(operation_type='collection_complete').count(), 2
+        )
+        history = StationHistory.objects.get(station=self.stations['B'], operation_type='collection_complete')
+        self.assertEqual(history.previous_volume_percentage, 95)
+        
+        queue = self.client.get(self.queue_url).data
+        self.assertEqual([entry['name'] for entry in queue['results']], ['Route Station A', 'Route Station E'])
+    
+    def test_confirm_requires_id_list(self):
+        """Test that the batch confirmation expects a list of ids"""
+        response = self.client.post(self.confirm_url, {'ids': [1]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class StationEventTests(APITestCase):
+    """Test cases for the station event stream"""
+    
+    def setUp(self):
+        """Set up test data"""
+        self.station = Station.objects.create(name="Event Test Station", volume_percentage=50)
+        self.detail_url = reverse('station-detail', args=[self.station.id])
+        self.loop = asyncio.new_event_loop()
+        self.queue = self.loop.run_until_complete(self._subscribe())
+    
+    def tearDown(self):
+        """Drop the subscription and close the loop"""
+        broker.unsubscribe(self.queue)
+        self.loop.close()
+    
+    async def _subscribe(self):
+        return broker.subscribe()
+    
+    def _next_event(self):
+        return self.loop.run_until_complete(asyncio.wait_for(self.queue.get(), 1))
+    
+    def test_update_publishes_event(self):
+        """Test that a volume update is pushed after commit"""
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(self.detail_url, {'volume_percentage': 60}, format='json')
+        
+        event = self._next_event()
+        self.assertEqual(event['type'], 'update')
+        self.assertEqual(event['station']['volume_percentage'], 60)
+    
+    def test_collection_events_published(self):
+        """Test that collection request and confirmation are pushed"""
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(self.detail_url, {'volume_percentage': 90}, format='json')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('station-confirm-collection', args=[self.station.id]))
+        
+        first = self._next_event()
+        second = self._next_event()
+        self.assertEqual(first['type'], 'collection_request')
+        self.assertTrue(first['station']['collection_requested'])
+        self.assertEqual(second['type'], 'collection_complete')
+        self.assertEqual(second['station']['volume_percentage'], 0)
+    
+    def test_bulk_update_requests_collection_once(self):
+        """Test that bulk readings for an already flagged station are pushed as updates"""
+        url = reverse('station-bulk-update')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(url, [{'id': self.station.id, 'volume_percentage': 90}], format='json')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(url, [{'id': self.station.id, 'volume_percentage': 95}], format='json')
+        
+        self.assertEqual(self._next_event()['type'], 'collection_request')
+        second = self._next_event()
+        self.assertEqual(second['type'], 'update')
+        self.assertTrue(second['station']['collection_requested'])
+    
+    def test_no_event_without_commit(self):
+        """Test that nothing is pushed for a rolled back write"""
+        with self.captureOnCommitCallbacks(execute=False):
+            self.client.patch(self.detail_url, {'volume_percentage': 60}, format='json')
+        
+        with self.assertRaises(asyncio.TimeoutError):
+            self.loop.run_until_complete(asyncio.wait_for(self.queue.get(), 0.05))
+
+
+class StationEventStreamTests(SimpleTestCase):
+    """Test cases for the Server-Sent Events endpoint"""
+    
+    async def test_stream_delivers_published_events(self):
+        """Test that published events are written to the stream"""
+        response = await self.async_client.get(reverse('station-events'))
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        
+        stream = aiter(response.streaming_content)
+        self.assertEqual(await anext(stream), b'retry: 3000\n\n')
+        
+        # The subscription is registered once the stream starts
+        self.assertGreaterEqual(broker.subscriber_count, 1)
+        next_chunk = asyncio.ensure_future(anext(stream))
+        await asyncio.sleep(0)
+        broker.publish({'type': 'update', 'station': {'id': 1, 'volume_percentage': 42.0}})
+        
+        chunk = await asyncio.wait_for(next_chunk, 1)
+        self.assertEqual(
+            chunk,
+            b'event: update\ndata: {"id": 1, "volume_percentage": 42.0}\n\n'
+        )
+        await stream.aclose()
+
+
+# Every PATCH must be stored for the history counts to match, and the
+# BEGIN IMMEDIATE lock waits are contention, not slow queries
+@override_settings(STORAGE_READING_DEADBAND=0, STORAGE_SLOW_QUERY_MS=None)
+class StationConcurrencyTests(TransactionTestCase):
+    """Stress tests for concurrent station state transitions"""
+    
+    threads = 8
+    iterations = 15
+    
+    def setUp(self):
+        """Set up test data"""
+        self.station = Station.objects.create(name="Concurrency Station", volume_percentage=0)
+        self.detail_url = reverse('station-detail', args=[self.station.id])
+        self.confirm_url = reverse('station-confirm-collection', args=[self.station.id])
+    
+    def _hammer(self, worker):
+        client = APIClient()
+        statuses = []
+        try:
+            for iteration in range(self.iterations):
+                if worker % 2:
+                    response = client.post(self.confirm_url)
+                else:
+                    volume = 70 + (worker + iteration) % 30
+                    response = client.patch(self.detail_url, {'volume_percentage': volume}, format='json')
+                statuses.append(response.status_code)
+        finally:
+            connection.close()
+        return statuses
+    
+    def test_concurrent_updates_and_confirmations(self):
+        """Test that history stays consistent when many threads hit one station"""
+        with ThreadPoolExecutor(max_workers=self.threads) as executor:
+            results = list(executor.map(self._hammer, range(self.threads)))
+        
+        statuses = [code for worker in results for code in worker]
+        self.assertTrue(set(statuses) <= {status.HTTP_200_OK, status.HTTP_400_BAD_REQUEST})
+        
+        updates = sum(
+            code == status.HTTP_200_OK
+            for worker, codes in enumerate(results) if not worker % 2
+            for code in codes
+        )
+        confirmations = sum(
+            code == status.HTTP_200_OK
+            for worker, codes in enumerate(results) if worker % 2
+            for code in codes
+        )
+        history = list(
+            StationHistory.objects.filter(station=self.station)
+            .exclude(operation_type='create')
+            .order_by('id')
+            .values_list('operation_type', flat=True)
+        )
+        self.assertEqual(history.count('update'), updates)
+        self.assertEqual(history.count('collection_complete'), confirmations)
+        
+        # Requests and confirmations strictly alternate: no duplicate request
+        # while one is pending and no confirmation without a request
+        transitions = [op for op in history if op != 'update']
+        for index, operation in enumerate(transitions):
+            expected = 'collection_request' if index % 2 == 0 else 'collection_complete'
+            self.assertEqual(operation, expected)
+        
+        self.station.refresh_from_db()
+        self.assertEqual(
+            self.station.collection_requested,
+            transitions[-1:] == ['collection_request']
+        )
+
+
+@single_database
+class RequestMetricsTests(APITestCase):
+    """Test cases for the request metrics middleware and /metrics endpoint"""
+    
+    def setUp(self):
+        """Set up test data"""
+        registry.reset()
+        station_cache.get_cache().clear()
+        station_cache.reset_stats()
+        self.station = Station.objects.create(name="Metrics Station", volume_percentage=10)
+    
+    def test_server_timing_header(self):
+        """Test that responses report database and total time"""
+        response = self.client.get(reverse('station-list'))
+        
+        self.assertRegex(
+            response['Server-Timing'],
+            r'^db;dur=[\d.]+;desc="\d+ queries", total;dur=[\d.]+$'
+        )
+    
+    def test_metrics_per_route(self):
+        """Test that requests are counted and timed per route"""
+        self.client.get(reverse('station-list'))
+        self.client.patch(
+            reverse('station-detail', args=[self.station.id]),
+            {'volume_percentage': 20},
+            format='json'
+        )
+        
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        body = response.content.decode()
+        self.assertIn(
+            'storage_http_requests_total{route="station-list",method="GET",status="200"} 1', body
+        )
+        self.assertIn(
+            'storage_http_requests_total{route="station-detail",method="PATCH",status="200"} 1', body
+        )
+        self.assertIn(
+            'storage_http_request_duration_seconds_count{route="station-list",method="GET"} 1', body
+        )
+        self.assertRegex(body, r'storage_db_queries_total\{route="station-detail"\} [1-9]\d*')
+        self.assertIn('storage_station_cache_misses_total 1', body)
+    
+    @override_settings(STORAGE_SLOW_QUERY_MS=0)
+    def test_slow_query_log(self):
+        """Test that queries over the threshold are logged with their route"""
+        with self.assertLogs('storage.slow_queries', level='WARNING') as logs:
+            self.client.get(reverse('stationhistory-list'))
+        
+        self.assertIn('stationhistory-list', logs.output[0])
+        self.assertIn('SELECT', logs.output[0])
+
+
+class HistoryWriterTests(TransactionTestCase):
+    """Test cases for the write-behind history queue"""
+    
+    client_class = APIClient
+    
+    def setUp(self):
+        """Set up test data"""
+        self.station = Station.objects.create(name="Writer Station", volume_percentage=10)
+    
+    def _event(self, volume):
+        return StationHistory(station=self.station, operation_type='update', volume_percentage=volume)
+    
+    def _wait_for(self, count, timeout=2):
+        deadline = time.monotonic() + timeout
+        while StationHistory.objects.count() < count and time.monotonic() < deadline:
+            time.sleep(0.01)
+        return StationHistory.objects.count()
+    
+    def test_flush_on_batch_size(self):
+        """Test that a full batch is written without waiting for the interval"""
+        writer = HistoryWriter(batch_size=2, flush_interval=60)
+        self.addCleanup(writer.stop)
+        
+        writer.submit([self._event(20), self._event(30)])
+        self.assertEqual(self._wait_for(2), 2)
+    
+    def test_flush_on_interval(self):
+        """Test that a partial batch is written once the interval passes"""
+        writer = HistoryWriter(batch_size=100, flush_interval=0.05)
+        self.addCleanup(writer.stop)
+        
+        writer.submit([self._event(20)])
+        self.assertEqual(self._wait_for(1), 1)
+    
+    def test_stop_flushes_pending_events(self):
+        """Test that stopping the writer writes everything still queued"""
+        writer = HistoryWriter(batch_size=100, flush_interval=60)
+        writer.submit([self._event(volume) for volume in range(5)])
+        
+        writer.stop()
+        self.assertEqual(StationHistory.objects.count(), 5)
+    
+    def test_backpressure_writes_inline(self):
+        """Test that producers write inline instead of growing the queue"""
+        class IdleWriter(HistoryWriter):
+            def start(self):
+                pass
+        
+        writer = IdleWriter(max_size=1, put_timeout=0.01)
+        with self.assertLogs('storage.history_writer', 'WARNING') as logs:
+            writer.submit([self._event(volume) for volume in range(3)])
+        
+        self.assertIn('writing 2 events synchronously', logs.output[0])
+        self.assertEqual(writer.pending, 1)
+        self.assertEqual(StationHistory.objects.count(), 2)
+    
+    def test_failed_batch_is_retried(self):
+        """Test that a transient insert failure is retried instead of dropping the batch"""
+        bulk_create = QuerySet.bulk_create
+        failures = iter([OperationalError('database is locked')])
+        
+        def flaky(queryset, *args, **kwargs):
+            failure = next(failures, None)
+            if failure is not None:
+                raise failure
+            return bulk_create(queryset, *args, **kwargs)
+        
+        dropped = history_writer.dropped_events()
+        writer = HistoryWriter(retry_delay=0)
+        with mock.patch.object(QuerySet, 'bulk_create', flaky), \
+                self.assertLogs('storage.history_writer', 'WARNING') as logs:
+            writer._write([self._event(20), self._event(30)])
+        
+        self.assertEqual([record.levelname for record in logs.records], ['WARNING'])
+        self.assertEqual(StationHistory.objects.count(), 2)
+        self.assertEqual(history_writer.dropped_events(), dropped)
+    
+    def test_bad_event_does_not_drop_the_batch(self):
+        """Test that events are written one by one when a batch keeps failing"""
+        dropped = history_writer.dropped_events()
+        orphan = StationHistory(station_id=self.station.id + 1000, operation_type='update', volume_percentage=5)
+        writer = HistoryWriter(retries=1, retry_delay=0)
+        with self.assertLogs('storage.history_writer', 'WARNING') as logs:
+            writer._write([self._event(20), orphan, self._event(30)])
+        
+        errors = [record.getMessage() for record in logs.records if record.levelname == 'ERROR']
+        self.assertEqual(errors, ['Dropped history event for station %s' % orphan.station_id])
+        self.assertEqual(StationHistory.objects.count(), 2)
+        self.assertEqual(history_writer.dropped_events(), dropped + 1)
+    
+    @override_settings(STORAGE_HISTORY_WRITE_BEHIND=True)
+    def test_update_writes_history_behind(self):
+        """Test that a PATCH queues its history and the writer persists it"""
+        response = self.client.patch(
+            reverse('station-detail', args=[self.station.id]),
+            {'volume_percentage': 85},
+            format='json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.data['collection_requested'])
+        
+        get_writer().flush(timeout=2)
+        operations = list(
+            StationHistory.objects.order_by('id').values_list('operation_type', flat=True)
+        )
+        self.assertEqual(operations, ['update', 'collection_request'])
@@ -1,12 +1,15 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import StationViewSet, StationHistoryViewSet
+from .views import CollectionViewSet, StationViewSet, StationHistoryViewSet, SyncViewSet, station_events
 
 router = DefaultRouter()
 router.register(r'stations', StationViewSet)
 router.register(r'history', StationHistoryViewSet)
+router.register(r'collections', CollectionViewSet, basename='collection')
+router.register(r'sync', SyncViewSet, basename='sync')
 
 urlpatterns = [
+    path('events/', station_events, name='station-events'),
     path('', include(router.urls)),
 ]
 
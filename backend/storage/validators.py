@@ -1,16 +1,26 @@
+import math
+
 from django.core.exceptions import ValidationError
 from django.utils.translation import gettext_lazy as _
 
 def validate_volume_percentage(value):
     """
     Validate that volume percentage is between 0 and 100.
+
+    This is the only range check on the field: serializers pick it up from
+    the model field, so it runs once per write.
     
     Args:
         value (float): The volume percentage to validate
         
     Raises:
-        ValidationError: If the value is less than 0 or greater than 100
+        ValidationError: If the value is not finite, less than 0 or greater than 100
     """
+    if not math.isfinite(value):
+        raise ValidationError(
+            _('%(value)s is not a valid volume percentage.'),
+            params={'value': value},
+        )
     if value < 0:
         raise ValidationError(
             _('%(value)s is less than 0. Volume percentage must be non-negative.'),
@@ -18,7 +28,50 @@ def validate_volume_percentage(value):
         )
     if value > 100:
         raise ValidationError(
-            _('%(value)s is greater than 100. Volume percentage cannot exceed 100%.'),
+            _('%(value)s is greater than 100. Volume percentage cannot exceed 100%%.'),
             params={'value': value},
         )
 
+
+def validate_volume_readings(readings):
+    """
+    Validate a batch of ``{id, volume_percentage}`` sensor readings.
+
+    The whole batch is checked in a single pass without building one
+    serializer per item, so thousands of readings stay cheap to validate.
+
+    Args:
+        readings (list): Raw readings as received in the request body
+
+    Returns:
+        tuple: ``(valid, errors)`` where ``valid`` is a list of
+        ``(index, station_id, volume_percentage)`` tuples and ``errors``
+        maps the index of each rejected reading to its error message
+    """
+    valid = []
+    errors = {}
+
+    for index, reading in enumerate(readings):
+        if not isinstance(reading, dict):
+            errors[index] = _('Each reading must be an object with id and volume_percentage.')
+            continue
+
+        station_id = reading.get('id')
+        value = reading.get('volume_percentage')
+
+        if isinstance(station_id, bool) or not isinstance(station_id, int):
+            errors[index] = _('A valid integer station id is required.')
+            continue
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            errors[index] = _('A numeric volume_percentage is required.')
+            continue
+
+        try:
+            validate_volume_percentage(value)
+        except ValidationError as exc:
+            errors[index] = exc.messages[0]
+            continue
+
+        valid.append((index, station_id, float(value)))
+
+    return valid, errors
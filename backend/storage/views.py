@@ -1,60 +1,302 @@
+import asyncio
+import json
+from itertools import chain
+from operator import itemgetter
+
+from django.db import transaction
+from django.db.models import Count, F, Max, Q, Sum
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 from rest_framework import viewsets, status
+from rest_framework.renderers import BrowsableAPIRenderer
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
-from .models import Station, StationHistory
-from .serializers import StationSerializer, StationHistorySerializer
-from .pagination import StandardResultsSetPagination
+from . import cache as station_cache
+from . import export as history_export
+from . import forecast as station_forecast
+from . import history_writer
+from . import horizon
+from . import series as station_series
+from . import services
+from . import replicas
+from . import sharding
+from . import sync
+from .events import broker, publish_station_event
+from .idempotency import IdempotentMixin
+from .fields import OPERATION_TYPES
+from .metrics import registry
+from .models import COLLECTION_THRESHOLD, Station, StationHistory
+from .serializers import StationSerializer, StationHistorySerializer, parse_fields
+from .pagination import HistoryCursorPagination
+from .lean import ValuesMapper
+from .renderers import FastJSONRenderer, HistoryCSVRenderer, HistoryNDJSONRenderer
+from .validators import validate_volume_readings
+
+
+# Read paths for the list endpoints: same schema as the serializers, built from .values() rows
+station_values = ValuesMapper(StationSerializer)
+history_values = ValuesMapper(StationHistorySerializer, computed={
+    'notes': (
+        ('operation_type', 'volume_percentage', 'previous_volume_percentage', 'notes'),
+        lambda row: StationHistory.describe_values(
+            row['operation_type'], row['volume_percentage'], row['previous_volume_percentage'], row['notes']
+        ),
+    ),
+})
+
+
+def parse_datetime_param(params, name):
+    """
+    Parse an ISO 8601 query parameter into an aware datetime.
+
+    Returns None when the parameter is absent and raises a DRF
+    ValidationError (HTTP 400) when it cannot be parsed.
+    """
+
+    value = params.get(name)
+    if value is None:
+        return None
+
+    try:
+        parsed = parse_datetime(value)
+    except ValueError:
+        parsed = None
+    if parsed is None:
+        raise ValidationError({name: 'Data/hora inválida. Use o formato ISO 8601.'})
+
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
 
-class StationViewSet(viewsets.ModelViewSet):
+
+class StationViewSet(IdempotentMixin, sharding.ShardRoutingMixin, replicas.ReplicaReadMixin, viewsets.ModelViewSet):
     """
     ViewSet for managing storage stations.
 
     Provides standard CRUD operations for Station objects
-    with additional collection management functionality.
+    with additional collection management functionality. Requests on a
+    station run on its site's shard; fleet-wide listings fan out across
+    shards. List and retrieve read from the replicas, if any.
     """
 
     queryset = Station.objects.all()
     serializer_class = StationSerializer
+    renderer_classes = [FastJSONRenderer, BrowsableAPIRenderer]
+    # Upper bound on the number of readings accepted by a single bulk_update call
+    bulk_update_max_readings = 10000
+    bulk_batch_size = 500
+    # Width (%) of the summary fill-level histogram bins
+    summary_bin_width = 10
+    summary_default_top = 5
+    summary_max_top = 50
+
+    def get_shard(self):
+        """New stations go to their site's shard; see ``ShardRoutingMixin``"""
+        if self.action == 'create' and sharding.enabled():
+            site = self.request.data.get('site') if isinstance(self.request.data, dict) else None
+            return sharding.for_site(site or sharding.DEFAULT_SITE)
+        return super().get_shard()
+
+    def get_queryset(self):
+        """Stations of the ``?site=`` site, if given"""
+        return self.filter_site(super().get_queryset())
+
+    def list(self, request, *args, **kwargs):
+        """
+        List stations through the read-through cache.
+
+        ``?fields=`` narrows both the selected columns and the response.
+        There is no Last-Modified: the latest ``updated_at`` does not change
+        when a station is deleted, so conditional requests use the ETag.
+        Without ``?site=`` every shard is read in parallel and the rows are
+        merged by id.
+        """
+
+        fields = parse_fields(request.query_params, station_values.keys)
+        key = station_cache.list_key(request)
+        entry = station_cache.lookup(key)
+        hit = entry is not None
+        if not hit:
+            parts = sharding.fan_out(lambda alias: list(station_values.values(
+                self.filter_queryset(self.get_queryset()), fields, extra=('id',)
+            )))
+            rows = parts[0] if len(parts) == 1 else sorted(chain.from_iterable(parts), key=itemgetter('id'))
+            entry = station_cache.store(key, station_values.map(rows, fields))
+        return station_cache.respond(request, entry, hit)
+
+    def retrieve(self, request, *args, **kwargs):
+        """
+        Retrieve a station through the read-through cache.
+
+        The full representation is cached once per station and narrowed to
+        ``?fields=`` in memory, so every fieldset shares the cache entry.
+        """
+
+        pk = str(kwargs[self.lookup_field])
+        if not pk.isdigit():
+            return super().retrieve(request, *args, **kwargs)
+
+        fields = parse_fields(request.query_params, station_values.keys)
+        key = station_cache.detail_key(int(pk))
+        entry = station_cache.lookup(key)
+        hit = entry is not None
+        if not hit:
+            station = self.get_object()
+            entry = station_cache.store(key, StationSerializer(station).data, last_modified=station.updated_at)
+        return station_cache.respond(request, entry, hit, fields)
+
+    @action(detail=False, methods=['get'])
+    def summary(self, request):
+        """
+        Fleet totals computed in the database.
+
+        Returns the station count, average fill, counts by
+        ``collection_requested``, a fill-level histogram and the ``top``
+        fullest stations (default 5). The figures come from one aggregate
+        query plus one query for the fullest stations, and are cached like
+        the station listing.
+        """
+
+        top = request.query_params.get('top', str(self.summary_default_top))
+        if not top.isdigit() or not 1 <= int(top) <= self.summary_max_top:
+            raise ValidationError({'top': f'Informe um número entre 1 e {self.summary_max_top}.'})
+
+        key = station_cache.list_key(request, 'summary')
+        entry = station_cache.lookup(key)
+        hit = entry is not None
+        if not hit:
+            entry = station_cache.store(key, self._summary(int(top)))
+        return station_cache.respond(request, entry, hit)
+
+    @action(detail=False, methods=['get'])
+    def forecast(self, request):
+        """
+        Predicted time for each station to reach the collection threshold and 100%.
+
+        Fill rates are fitted over each station's current fill cycle from
+        its history; see ``storage.forecast``.
+        """
+
+        now = timezone.now()
+
+        def shard_forecast(alias):
+            stations = list(
+                self.get_queryset().order_by('id').values('id', 'name', 'volume_percentage', 'updated_at')
+            )
+            return list(zip(stations, station_forecast.forecast(stations, now)))
+
+        parts = sharding.fan_out(shard_forecast)
+        pairs = parts[0] if len(parts) == 1 else sorted(chain.from_iterable(parts), key=lambda pair: pair[0]['id'])
+        return Response([
+            {'id': station['id'], 'name': station['name'], 'volume_percentage': station['volume_percentage'], **prediction}
+            for station, prediction in pairs
+        ])
+
+    @action(detail=True, methods=['get'])
+    def series(self, request, pk=None):
+        """
+        The station's fill curve between ``from`` and ``to``, downsampled
+        to at most ``points`` points (default 500) with LTTB.
+
+        Results are cached per station, range and size until the station's
+        history changes; see ``storage.series``.
+        """
+
+        points = request.query_params.get('points', str(station_series.DEFAULT_POINTS))
+        if not points.isdigit() or not 3 <= int(points) <= station_series.MAX_POINTS:
+            raise ValidationError({'points': f'Informe um número entre 3 e {station_series.MAX_POINTS}.'})
+        points = int(points)
+        start = parse_datetime_param(request.query_params, 'from')
+        end = parse_datetime_param(request.query_params, 'to')
+        if start and end and start > end:
+            raise ValidationError({'from': 'A data inicial deve ser anterior à final.'})
+
+        station = self.get_object()
+        key = station_cache.series_key(station.pk, start, end, points)
+        entry = station_cache.lookup(key)
+        hit = entry is not None
+        if not hit:
+            data = {'station': station.pk, 'from': start, 'to': end}
+            data.update(station_series.series(station.pk, start, end, points))
+            entry = station_cache.store(key, data)
+        return station_cache.respond(request, entry, hit)
+
+    def _summary(self, top):
+        """Return the summary data, merged across shards"""
+        width = self.summary_bin_width
+        bins = [(lower, lower + width) for lower in range(0, 100, width)]
+        aggregates = {
+            'total': Count('id'),
+            'volume_sum': Sum('volume_percentage'),
+            'above_threshold': Count('id', filter=Q(volume_percentage__gte=COLLECTION_THRESHOLD)),
+            'requested': Count('id', filter=Q(collection_requested=True)),
+        }
+        for index, (lower, upper) in enumerate(bins):
+            # The last bin is closed so that 100% is counted
+            upper_filter = Q(volume_percentage__lt=upper) if upper < 100 else Q(volume_percentage__lte=upper)
+            aggregates[f'bin_{index}'] = Count('id', filter=Q(volume_percentage__gte=lower) & upper_filter)
+        stations = self.get_queryset()
+        fullest = stations.order_by('-volume_percentage', 'id').values(
+            'id', 'name', 'volume_percentage', 'collection_requested'
+        )[:top]
+
+        parts = sharding.fan_out(lambda alias: (stations.aggregate(**aggregates), list(fullest)))
+        totals = {name: sum(part[name] or 0 for part, _ in parts) for name in aggregates}
+        fullest = sorted(
+            chain.from_iterable(rows for _, rows in parts), key=lambda row: (-row['volume_percentage'], row['id'])
+        )[:top]
+
+        summary = {
+            'total': totals['total'],
+            'average_volume': totals['volume_sum'] / totals['total'] if totals['total'] else None,
+            'threshold': COLLECTION_THRESHOLD,
+            'above_threshold': totals['above_threshold'],
+            'collection_requested': {
+                'requested': totals['requested'],
+                'not_requested': totals['total'] - totals['requested'],
+            },
+            'histogram': [
+                {'min': lower, 'max': upper, 'count': totals[f'bin_{index}']}
+                for index, (lower, upper) in enumerate(bins)
+            ],
+            'fullest': fullest,
+        }
+        return summary
 
     def perform_create(self, serializer):
         """Create a new station and record creation in history"""
 
         station = serializer.save()
-        StationHistory.objects.create(
+        services.record_history([StationHistory(
             station=station,
             operation_type='create',
-            volume_percentage=station.volume_percentage,
-            notes='Estação criada'
-        )
+            volume_percentage=station.volume_percentage
+        )])
+        publish_station_event('create', serializer.data)
 
     def perform_update(self, serializer):
         """
         Update station volume and automatically manage collection requests
         when threshold is exceeded.
+
+        Updates are always stored: the sensor dead-band only applies to
+        ``bulk_update``, so manual edits are never dropped. The station row
+        stays locked from reading the previous volume until the history is
+        written, so concurrent updates are applied in turn.
         """
 
-        old_percentage = self.get_object().volume_percentage
-        station = serializer.save()
-        new_percentage = station.volume_percentage
-        
-        # Registrar a atualização no histórico
-        StationHistory.objects.create(
-            station=station,
-            operation_type='update',
-            volume_percentage=new_percentage,
-            notes=f'Volume atualizado de {old_percentage}% para {new_percentage}%'
-        )
+        with transaction.atomic(using=sharding.current_db()):
+            station = services.lock_station(serializer.instance.pk)
+            old_percentage = station.volume_percentage
+            serializer.instance = station
+            station = serializer.save()
 
-       # Verificar se precisa solicitar coleta (80% ou mais)
-        if new_percentage >= 80 and not station.collection_requested:
-            station.collection_requested = True
-            station.save()
-            
-            StationHistory.objects.create(
-                station=station,
-                operation_type='collection_request',
-                volume_percentage=new_percentage,
-                notes='Pedido de coleta gerado automaticamente'
+            # Registra a atualização e solicita coleta se atingir 80% ou mais
+            requested = services.record_volume_update(station, old_percentage)
+            publish_station_event(
+                'collection_request' if requested else 'update', serializer.data
             )
 
     @action(detail=True, methods=['post'])
@@ -66,55 +308,527 @@ class StationViewSet(viewsets.ModelViewSet):
         Returns 400 if no collection was previously requested.
         """
 
-        station = self.get_object()
+        station = services.confirm_collection(self.get_object().pk)
         
-        if not station.collection_requested:
+        if station is None:
             return Response(
                 {'error': 'Não há pedido de coleta para esta estação.'},
                 status=status.HTTP_400_BAD_REQUEST
             )
-            
-        old_percentage = station.volume_percentage
-        station.volume_percentage = 0
-        station.collection_requested = False
-        station.save()
-        
-        # Registrar a coleta no histórico
-        StationHistory.objects.create(
-            station=station,
-            operation_type='collection_complete',
-            volume_percentage=0,
-            notes=f'Coleta confirmada. Volume anterior: {old_percentage}%'
-        )
         
+        station_data = StationSerializer(station).data
+        publish_station_event('collection_complete', station_data)
         return Response({
             'success': True,
             'message': 'Coleta confirmada com sucesso.',
-            'station': StationSerializer(station).data
+            'station': station_data
         })
 
-class StationHistoryViewSet(viewsets.ReadOnlyModelViewSet):
+    @action(detail=False, methods=['post'])
+    def bulk_update(self, request):
+        """
+        Apply a batch of sensor readings in a single transaction.
+
+        Expects a list of ``{"id": ..., "volume_percentage": ...}`` objects.
+        Readings are applied in order, so the automatic collection request
+        fires exactly as it would for the equivalent sequence of PATCH calls.
+        Invalid readings are reported per item and do not reject the batch.
+        Readings within a station's dead-band are acknowledged with
+        ``coalesced: true`` and not stored.
+        """
+
+        readings = request.data
+        if not isinstance(readings, list):
+            return Response(
+                {'error': 'O corpo da requisição deve ser uma lista de leituras.'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if len(readings) > self.bulk_update_max_readings:
+            return Response(
+                {'error': f'Máximo de {self.bulk_update_max_readings} leituras por requisição.'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        valid, errors = validate_volume_readings(readings)
+        results = [None] * len(readings)
+        for index, message in errors.items():
+            results[index] = {'index': index, 'status': 'error', 'error': str(message)}
+
+        coalesced = 0
+        # Each shard applies its stations' readings in its own transaction
+        for alias, station_ids in sharding.group_by_shard(station_id for _, station_id, _ in valid).items():
+            shard_ids = set(station_ids)
+            with sharding.using(alias):
+                coalesced += self._apply_readings([reading for reading in valid if reading[1] in shard_ids], results)
+
+        services.count_coalesced(coalesced)
+        failed = sum(1 for result in results if result['status'] == 'error')
+        return Response({
+            'updated': len(results) - failed - coalesced,
+            'coalesced': coalesced,
+            'failed': failed,
+            'results': results,
+        })
+
+    def _apply_readings(self, valid, results):
+        """
+        Apply validated readings in one transaction, filling in ``results``.
+
+        Returns:
+            int: Number of readings dropped by the dead-band
+        """
+
+        with transaction.atomic(using=sharding.current_db()):
+            stations = Station.objects.select_for_update().in_bulk(
+                {station_id for _, station_id, _ in valid}
+            )
+            now = timezone.now()
+            changed = {}
+            # Stations whose collection was requested by this batch
+            requested = set()
+            history = []
+            coalesced = 0
+
+            for index, station_id, new_percentage in valid:
+                station = stations.get(station_id)
+                if station is None:
+                    results[index] = {
+                        'index': index,
+                        'id': station_id,
+                        'status': 'error',
+                        'error': 'Estação não encontrada.',
+                    }
+                    continue
+
+                if not services.is_significant_reading(station, new_percentage, now):
+                    coalesced += 1
+                    results[index] = {
+                        'index': index,
+                        'id': station_id,
+                        'status': 'ok',
+                        'coalesced': True,
+                        'volume_percentage': station.volume_percentage,
+                        'collection_requested': station.collection_requested,
+                    }
+                    continue
+
+                old_percentage = station.volume_percentage
+                station.volume_percentage = new_percentage
+                station.updated_at = now
+                history.append(StationHistory(
+                    station=station,
+                    operation_type='update',
+                    volume_percentage=new_percentage,
+                    previous_volume_percentage=old_percentage
+                ))
+
+                if new_percentage >= COLLECTION_THRESHOLD and not station.collection_requested:
+                    station.collection_requested = True
+                    station.collection_requested_at = now
+                    requested.add(station_id)
+                    history.append(StationHistory(
+                        station=station,
+                        operation_type='collection_request',
+                        volume_percentage=new_percentage
+                    ))
+
+                changed[station_id] = station
+                results[index] = {
+                    'index': index,
+                    'id': station_id,
+                    'status': 'ok',
+                    'volume_percentage': new_percentage,
+                    'collection_requested': station.collection_requested,
+                }
+
+            # bulk_update skips Station.save, validation already ran above
+            Station.objects.bulk_update(
+                changed.values(),
+                ['volume_percentage', 'collection_requested', 'collection_requested_at', 'updated_at'],
+                batch_size=self.bulk_batch_size
+            )
+            services.record_history(history)
+            station_cache.invalidate_stations(changed.keys())
+            for station_id, station in changed.items():
+                publish_station_event(
+                    'collection_request' if station_id in requested else 'update',
+                    StationSerializer(station).data
+                )
+        return coalesced
+
+class CollectionViewSet(IdempotentMixin, sharding.ShardRoutingMixin, viewsets.ViewSet):
+    """
+    ViewSet for planning and closing out collection routes.
+
+    The queue is read straight off the (collection_requested,
+    volume_percentage) index, so it stays current with every save path at
+    the cost of an index update per write and a top-k read per request.
+    """
+
+    queue_default_limit = 20
+    queue_max_limit = 500
+    # Upper bound on the number of stations confirmed by a single call
+    confirm_max_stations = 1000
+
+    @action(detail=False, methods=['get'])
+    def queue(self, request):
+        """
+        Pending collections in urgency order.
+
+        Stations are ordered by fill level, then by how long the request
+        has been waiting. Each entry carries the forecast time to overflow.
+        Accepts ``limit`` (default 20, max 500).
+        """
+
+        limit = request.query_params.get('limit', str(self.queue_default_limit))
+        if not limit.isdigit() or not 1 <= int(limit) <= self.queue_max_limit:
+            raise ValidationError({'limit': f'Informe um número entre 1 e {self.queue_max_limit}.'})
+
+        limit = int(limit)
+        now = timezone.now()
+
+        def shard_queue(alias):
+            pending = self.filter_site(Station.objects.filter(collection_requested=True))
+            stations = list(
+                pending.order_by('-volume_percentage', F('collection_requested_at').asc(nulls_last=True), 'id')
+                .values('id', 'name', 'volume_percentage', 'collection_requested_at', 'updated_at')[:limit]
+            )
+            return pending.count(), list(zip(stations, station_forecast.forecast(stations, now)))
+
+        parts = sharding.fan_out(shard_queue)
+        count = sum(shard_count for shard_count, _ in parts)
+        entries = parts[0][1] if len(parts) == 1 else sorted(
+            chain.from_iterable(shard_entries for _, shard_entries in parts),
+            key=lambda entry: (
+                -entry[0]['volume_percentage'],
+                entry[0]['collection_requested_at'] is None,
+                entry[0]['collection_requested_at'] or now,
+                entry[0]['id'],
+            ),
+        )[:limit]
+
+        results = []
+        for position, (station, prediction) in enumerate(entries, 1):
+            requested_at = station['collection_requested_at']
+            results.append({
+                'position': position,
+                'id': station['id'],
+                'name': station['name'],
+                'volume_percentage': station['volume_percentage'],
+                'collection_requested_at': requested_at,
+                'waiting_hours': (now - requested_at).total_seconds() / 3600 if requested_at else None,
+                'full_at': prediction['full_at'],
+                'hours_to_full': prediction['hours_to_full'],
+            })
+        return Response({'count': count, 'results': results})
+
+    @action(detail=False, methods=['post'])
+    def confirm(self, request):
+        """
+        Confirm the collections of a whole route in a single transaction.
+
+        Expects a list of station ids. Stations without a pending request
+        are reported per item and do not reject the batch.
+        """
+
+        station_ids = request.data
+        if not isinstance(station_ids, list) or not all(
+            isinstance(station_id, int) and not isinstance(station_id, bool) for station_id in station_ids
+        ):
+            return Response(
+                {'error': 'O corpo da requisição deve ser uma lista de ids de estações.'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if len(station_ids) > self.confirm_max_stations:
+            return Response(
+                {'error': f'Máximo de {self.confirm_max_stations} estações por requisição.'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        station_ids = list(dict.fromkeys(station_ids))
+        # One transaction per shard
+        confirmed = {}
+        for alias, shard_ids in sharding.group_by_shard(station_ids).items():
+            with sharding.using(alias):
+                confirmed.update(services.confirm_collections(shard_ids))
+
+        results = []
+        for station_id in station_ids:
+            station = confirmed.get(station_id)
+            if station is None:
+                results.append({
+                    'id': station_id,
+                    'status': 'error',
+                    'error': 'Não há pedido de coleta para esta estação.',
+                })
+                continue
+            station_data = StationSerializer(station).data
+            publish_station_event('collection_complete', station_data)
+            results.append({'id': station_id, 'status': 'ok', 'station': station_data})
+
+        return Response({
+            'confirmed': len(confirmed),
+            'failed': len(station_ids) - len(confirmed),
+            'results': results,
+        })
+
+
+class SyncViewSet(sharding.ShardRoutingMixin, viewsets.ViewSet):
+    """
+    Delta sync for offline clients and ETL.
+
+    ``GET /api/sync/?since=<watermark>`` returns the stations changed and
+    the history recorded since the watermark, plus the watermark for the
+    next call. Without ``since`` everything is returned. Reads stop short
+    of writes that may still commit (see ``horizon``), so recent stations
+    and history may be sent again; clients should upsert by id.
+    Deleted stations are not reported; ``station_count`` lets clients
+    notice them and fall back to a full sync. With sharding each site is
+    synced separately (``?site=``); watermarks are only valid for the site
+    that issued them.
+    """
+
+    renderer_classes = [FastJSONRenderer, BrowsableAPIRenderer]
+    history_default_limit = 1000
+    history_max_limit = 5000
+
+    def list(self, request):
+        """Return the changes since the ``since`` watermark"""
+
+        self.require_shard()
+        limit = request.query_params.get('limit', str(self.history_default_limit))
+        if not limit.isdigit() or not 1 <= int(limit) <= self.history_max_limit:
+            raise ValidationError({'limit': f'Informe um número entre 1 e {self.history_max_limit}.'})
+        limit = int(limit)
+
+        site = request.query_params.get('site')
+        token = request.query_params.get('since')
+        try:
+            watermark = sync.decode(token, site) if token else sync.INITIAL
+        except sync.InvalidWatermark:
+            raise ValidationError({'since': 'Marca de sincronização inválida.'})
+
+        all_stations = self.filter_site(Station.objects.all())
+        all_history = self.filter_site(StationHistory.objects.all(), 'station__site')
+        with horizon.reading() as read:
+            stations = all_stations.order_by('updated_at', 'id')
+            if watermark.stations_since is not None:
+                stations = stations.filter(updated_at__gt=watermark.stations_since)
+            station_rows = list(station_values.values(stations))
+
+            # Events below the last one sent that may have committed since
+            late_rows = []
+            if watermark.history_floor < watermark.history_read:
+                late_rows = list(history_values.values(all_history.filter(
+                    id__gt=watermark.history_floor, id__lte=watermark.history_read
+                ).order_by('id')))
+            history = all_history.filter(id__gt=watermark.history_read).order_by('id')
+            history_rows = list(history_values.values(history)[:limit + 1])
+            station_count = all_stations.count()
+
+        has_more = len(history_rows) > limit
+        history_rows = history_rows[:limit]
+        history_read = history_rows[-1]['id'] if history_rows else watermark.history_read
+
+        return Response({
+            'stations': station_values.map(station_rows),
+            'history': history_values.map(late_rows + history_rows),
+            'station_count': station_count,
+            'has_more': has_more,
+            'watermark': sync.encode(sync.next_watermark(watermark, read, history_read), site),
+        })
+
+
+class StationHistoryViewSet(sharding.ShardRoutingMixin, replicas.ReplicaReadMixin, viewsets.ReadOnlyModelViewSet):
     """
     ViewSet for viewing station history records.
     
     Provides read-only access to history with filtering capabilities.
+    Listings are cursor-paginated on (timestamp, id). With sharding, a
+    ``station_id`` filter selects the station's shard and ``site`` a
+    site's; without either, only the newest page of every shard is merged,
+    as history ids are per shard. History is read from the replicas, if
+    any.
     """
 
     queryset = StationHistory.objects.all()
     serializer_class = StationHistorySerializer
-    # pagination_class = StandardResultsSetPagination
+    pagination_class = HistoryCursorPagination
+    renderer_classes = [FastJSONRenderer, BrowsableAPIRenderer]
+    replica_actions = ('list', 'retrieve', 'export')
+
+    def get_shard(self):
+        """History is read from the shard of the ``station_id`` filter"""
+        station_id = self.request.query_params.get('station_id')
+        if station_id is not None and station_id.isdigit():
+            return sharding.for_station(int(station_id))
+        # History ids are per shard: records are looked up on the default shard unless ?site= is given
+        return sharding.DEFAULT_DB if self.action == 'retrieve' else None
+
+    def list(self, request, *args, **kwargs):
+        """
+        List history from .values() rows instead of serialized instances.
+
+        ``?fields=`` narrows both the selected columns and the response.
+        Last-Modified is the newest event timestamp matching the filters:
+        the first page reads it off its first row, and a request with
+        If-Modified-Since looks it up before reading the page. Other pages
+        carry no Last-Modified.
+        """
+
+        fields = parse_fields(request.query_params, history_values.keys)
+        if sharding.enabled() and not sharding.is_routed():
+            return self._merged_first_page(request, fields)
+        queryset = self.filter_queryset(self.get_queryset())
+
+        last_modified = None
+        if 'HTTP_IF_MODIFIED_SINCE' in request.META:
+            last_modified = queryset.aggregate(latest=Max('timestamp'))['latest']
+            if station_cache.not_modified(request, last_modified=last_modified):
+                return Response(
+                    status=status.HTTP_304_NOT_MODIFIED,
+                    headers=station_cache.validator_headers(last_modified=last_modified)
+                )
+
+        page = self.paginate_queryset(history_values.values(queryset, fields, extra=('timestamp',)))
+        if last_modified is None and page and self.paginator.cursor_query_param not in request.query_params:
+            last_modified = page[0]['timestamp']
+        response = self.get_paginated_response(history_values.map(page, fields))
+        for header, value in station_cache.validator_headers(last_modified=last_modified).items():
+            response[header] = value
+        return response
+
+    def _merged_first_page(self, request, fields):
+        """
+        The newest events across every shard, for listings without a shard.
+
+        There is no cursor across shards: ``next`` is null, and further
+        pages need ``site`` or ``station_id``.
+        """
+        if self.paginator.cursor_query_param in request.query_params:
+            self.require_shard()
+        size = self.paginator.get_page_size(request)
+        parts = sharding.fan_out(lambda alias: list(history_values.values(
+            self.filter_queryset(self.get_queryset()).order_by('-timestamp', '-id'), fields, extra=('timestamp',)
+        )[:size]))
+        rows = sorted(chain.from_iterable(parts), key=itemgetter('timestamp'), reverse=True)[:size]
+
+        last_modified = rows[0]['timestamp'] if rows else None
+        headers = station_cache.validator_headers(last_modified=last_modified)
+        if station_cache.not_modified(request, last_modified=last_modified):
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers=headers)
+        return Response(
+            {'next': None, 'previous': None, 'results': history_values.map(rows, fields)}, headers=headers
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        """Retrieve a history record; records never change, so Last-Modified is their timestamp"""
+
+        instance = self.get_object()
+        headers = station_cache.validator_headers(last_modified=instance.timestamp)
+        if station_cache.not_modified(request, last_modified=instance.timestamp):
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers=headers)
+        return Response(self.get_serializer(instance).data, headers=headers)
 
     def get_queryset(self):
         """
         Return filtered history records based on query parameters.
         
-        Supports filtering by station_id.
+        Supports filtering by station_id, operation_type and a
+        since/until timestamp range (ISO 8601, inclusive).
         """
 
-        queryset = StationHistory.objects.all()
-        station_id = self.request.query_params.get('station_id', None)
+        # station_name is serialized for every row, join the station up front
+        queryset = StationHistory.objects.select_related('station')
+        params = self.request.query_params
+        station_id = params.get('station_id', None)
+        operation_type = params.get('operation_type', None)
+        since = parse_datetime_param(params, 'since')
+        until = parse_datetime_param(params, 'until')
         
         if station_id is not None:
             queryset = queryset.filter(station_id=station_id)
+        queryset = self.filter_site(queryset, 'station__site')
+        if operation_type is not None:
+            if operation_type not in OPERATION_TYPES:
+                raise ValidationError({'operation_type': 'Tipo de operação inválido.'})
+            queryset = queryset.filter(operation_type=operation_type)
+        if since is not None:
+            queryset = queryset.filter(timestamp__gte=since)
+        if until is not None:
+            queryset = queryset.filter(timestamp__lte=until)
+
+        if self.action == 'retrieve':
+            fields = parse_fields(params, history_values.keys)
+            if fields is not None:
+                # Load only the requested columns, joining the station only for its name
+                queryset = queryset.select_related(None)
+                if 'station_name' in fields:
+                    queryset = queryset.select_related('station')
+                queryset = history_values.only(queryset, fields, extra=('timestamp',))
             
         return queryset
+
+    @action(detail=False, methods=['get'], renderer_classes=[HistoryCSVRenderer, HistoryNDJSONRenderer])
+    def export(self, request):
+        """
+        Stream the filtered history as CSV (default) or NDJSON.
+
+        Takes the same filters as the listing. The format is chosen with
+        ``?format=csv|ndjson`` or the Accept header.
+        """
+
+        self.require_shard()
+        return history_export.export_response(
+            request._request, self.get_queryset(), request.accepted_renderer.format
+        )
+
+
+# Seconds between keep-alive comments on an idle event stream
+EVENT_STREAM_HEARTBEAT = 15
+
+
+async def station_events(request):
+    """
+    Stream station changes as Server-Sent Events.
+
+    Each volume update, collection request and collection confirmation is
+    pushed as an event named after its history operation type, carrying the
+    station's new state. Must be served by the ASGI application: idle
+    connections only cost a queue on the event loop.
+    """
+
+    async def stream():
+        queue = broker.subscribe()
+        try:
+            yield 'retry: 3000\n\n'
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), EVENT_STREAM_HEARTBEAT)
+                except asyncio.TimeoutError:
+                    yield ': keep-alive\n\n'
+                    continue
+                yield f"event: {event['type']}\ndata: {json.dumps(event['station'])}\n\n"
+        finally:
+            broker.unsubscribe(queue)
+
+    response = StreamingHttpResponse(stream(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+def metrics(request):
+    """Expose request, database and cache metrics in the Prometheus text format"""
+
+    cache_stats = station_cache.stats()
+    body = registry.render(extra=[
+        ('storage_station_cache_hits_total', 'counter', 'Station cache hits.', cache_stats['hits']),
+        ('storage_station_cache_misses_total', 'counter', 'Station cache misses.', cache_stats['misses']),
+        ('storage_event_subscribers', 'gauge', 'Open station event streams.', broker.subscriber_count),
+        ('storage_readings_coalesced_total', 'counter', 'Sensor readings dropped by the dead-band.',
+         services.coalesced_readings()),
+        ('storage_history_events_dropped_total', 'counter', 'History events the write-behind queue failed to insert.',
+         history_writer.dropped_events()),
+    ])
+    return HttpResponse(body, content_type='text/plain; version=0.0.4; charset=utf-8')
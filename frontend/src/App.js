@@ -1,10 +1,15 @@
-import React, { useState, useEffect } from 'react';
+import React, { useState, useEffect, useRef } from 'react';
 import { Container, Typography, Box, Grid, Paper, ThemeProvider, CssBaseline } from '@mui/material';
 import theme from './styles/theme';
 import StationCard from './components/StationCard';
 import HistoryTable from './components/HistoryTable';
+import SummaryPanel from './components/SummaryPanel';
 import { api, endpoints } from './services/api';
 
+// Station events refetch the fleet totals at most once per interval (ms),
+// so a burst of writes (e.g. a bulk ingest) costs one summary request
+const SUMMARY_REFRESH_INTERVAL = 5000;
+
 /**
  * Main application component for the Storage Control System.
  * Manages station data, operation history, and provides UI for user interactions.
@@ -12,8 +17,10 @@ import { api, endpoints } from './services/api';
 function App() {
   const [stations, setStations] = useState([]); // Array of station objects
   const [history, setHistory] = useState([]);    // Array of historical operations
+  const [summary, setSummary] = useState(null);  // Fleet totals from the summary endpoint
   const [loading, setLoading] = useState(true); // Loading state flag
   const [error, setError] = useState(null);     // Error message state
+  const summaryTimer = useRef(null);            // Pending event-driven summary refetch
 
   /**
    * Effect hook to load initial data when component mounts.
@@ -24,20 +31,71 @@ function App() {
   }, []);
 
   /**
-   * Fetches all stations and history data from the API.
+   * Effect hook to subscribe to the server's station event stream.
+   * Changes made elsewhere (sensors, other operators) are applied
+   * to the local state as they happen, without polling, and the
+   * fleet totals are refreshed at most once per SUMMARY_REFRESH_INTERVAL.
+   */
+  useEffect(() => {
+    const source = new EventSource(`${api.defaults.baseURL}${endpoints.events}`);
+    const applyStationEvent = (event) => {
+      const station = JSON.parse(event.data);
+      setStations(current => current.some(s => s.id === station.id)
+        ? current.map(s => (s.id === station.id ? station : s))
+        : [...current, station]);
+      scheduleSummaryRefresh();
+    };
+
+    ['create', 'update', 'collection_request', 'collection_complete'].forEach(type =>
+      source.addEventListener(type, applyStationEvent)
+    );
+    return () => {
+      source.close();
+      clearTimeout(summaryTimer.current);
+    };
+  }, []);
+
+  /**
+   * Refetches the fleet totals once the current interval ends; events
+   * arriving in the meantime share that refetch.
+   */
+  const scheduleSummaryRefresh = () => {
+    if (summaryTimer.current) return;
+    summaryTimer.current = setTimeout(() => {
+      summaryTimer.current = null;
+      refreshSummary();
+    }, SUMMARY_REFRESH_INTERVAL);
+  };
+
+  /**
+   * Fetches the fleet totals; a failure only leaves the previous totals shown.
+   */
+  const refreshSummary = async () => {
+    try {
+      const summaryRes = await api.get(endpoints.summary);
+      setSummary(summaryRes.data);
+    } catch (err) {
+      console.error('Error loading summary:', err);
+    }
+  };
+
+  /**
+   * Fetches all stations, history and summary data from the API.
    * Handles loading states and errors during the fetch operation.
    */
   const fetchData = async () => {
     setLoading(true);
     try {
-      // Fetch both stations and history data in parallel
-      const [stationsRes, historyRes] = await Promise.all([
+      // Fetch stations, history and summary data in parallel
+      const [stationsRes, historyRes, summaryRes] = await Promise.all([
         api.get(endpoints.stations),
-        api.get(endpoints.history)
+        api.get(endpoints.history),
+        api.get(endpoints.summary)
       ]);
       
       setStations(stationsRes.data);
-      setHistory(historyRes.data);
+      setHistory(historyRes.data.results);
+      setSummary(summaryRes.data);
       setError(null);
     } catch (err) {
       console.error('Error loading data:', err);
@@ -63,9 +121,10 @@ function App() {
         s.id === stationId ? response.data : s
       ));
       
-      // Refresh history data
+      // Refresh history and summary data
       const historyRes = await api.get(endpoints.history);
-      setHistory(historyRes.data);
+      setHistory(historyRes.data.results);
+      refreshSummary();
       
     } catch (err) {
       console.error('Error updating volume:', err);
@@ -87,9 +146,10 @@ function App() {
         s.id === stationId ? response.data.station : s
       ));
       
-      // Refresh history data
+      // Refresh history and summary data
       const historyRes = await api.get(endpoints.history);
-      setHistory(historyRes.data);
+      setHistory(historyRes.data.results);
+      refreshSummary();
       
     } catch (err) {
       console.error('Error confirming collection:', err);
@@ -116,6 +176,9 @@ function App() {
             </Paper>
           )}
           
+          {/* Fleet totals */}
+          <SummaryPanel summary={summary} />
+          
           {/* Stations grid */}
           <Grid container spacing={4} sx={{ mb: 4 }}>
             {stations.map((station) => (
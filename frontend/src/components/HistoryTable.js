@@ -79,7 +79,7 @@ const HistoryTable = ({ history, loading }) => {
             
             return (
               <TableRow
-                key={record.id}
+                key={`${record.station}-${record.id}`}
                 sx={{ '&:last-child td, &:last-child th': { border: 0 } }}
               >
                 <TableCell component="th" scope="row">
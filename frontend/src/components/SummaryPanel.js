@@ -0,0 +1,38 @@
+import React from 'react';
+import { Paper, Grid, Typography } from '@mui/material';
+
+/**
+ * Fleet totals computed by the backend's summary endpoint.
+ * Shows the station count, average fill, stations above the collection
+ * threshold and pending collection requests.
+ * @param {object} props - Component props
+ * @param {object|null} props.summary - Summary data, or null while loading
+ */
+const SummaryPanel = ({ summary }) => {
+  if (!summary) return null;
+
+  const figures = [
+    { label: 'Estações', value: summary.total },
+    {
+      label: 'Volume médio',
+      value: summary.average_volume === null ? '-' : `${summary.average_volume.toFixed(1)}%`,
+    },
+    { label: `Acima de ${summary.threshold}%`, value: summary.above_threshold },
+    { label: 'Coletas pendentes', value: summary.collection_requested.requested },
+  ];
+
+  return (
+    <Paper elevation={3} sx={{ p: 2, mb: 4 }}>
+      <Grid container spacing={2}>
+        {figures.map(({ label, value }) => (
+          <Grid item xs={6} md={3} key={label}>
+            <Typography variant="body2" color="text.secondary">{label}</Typography>
+            <Typography variant="h5" color="primary">{value}</Typography>
+          </Grid>
+        ))}
+      </Grid>
+    </Paper>
+  );
+};
+
+export default SummaryPanel;
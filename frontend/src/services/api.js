@@ -13,11 +13,13 @@ const API_BASE_URL = process.env.REACT_APP_DOCKERIZED === 'true'
 
 /**
  * Axios instance configured with the base API URL.
- * This instance will be used for all API requests.
+ * This instance will be used for all API requests. Cookies are sent so the
+ * backend can pin the dashboard to the primary database after it writes.
  * @type {axios.AxiosInstance}
  */
 export const api = axios.create({
   baseURL: API_BASE_URL,
+  withCredentials: true,
 });
 
 /**
@@ -25,9 +27,13 @@ export const api = axios.create({
  * Contains all available endpoints for the application.
  * @constant {object}
  * @property {string} stations - Endpoint for station operations
+ * @property {string} summary - Fleet totals computed by the backend
  * @property {string} history - Endpoint for history records
+ * @property {string} events - Server-Sent Events stream of station changes
  */
 export const endpoints = {
   stations: '/stations/',
+  summary: '/stations/summary/',
   history: '/history/',
+  events: '/events/',
 };